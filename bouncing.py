@@ -1,47 +1,351 @@
-import tkinter as tk
-import numpy as np, time
+import argparse, csv, math, time
+import numpy as np
 
 W, H = 600, 400
 N = 20
-rng = np.random.default_rng(0)
-pos = rng.uniform([20,20], [W-20,H-20], (N,2))
-vel = rng.uniform(-120, 120, (N,2))  # px/s
-rad = rng.integers(8, 16, size=N)
-
-root = tk.Tk()
-root.title("NumPy + Tkinter: bouncing balls")
-cv = tk.Canvas(root, width=W, height=H, bg="black")
-cv.pack()
-
-items = []
-colors = ["#%06x"%c for c in rng.integers(0, 0xFFFFFF, size=N)]
-for i in range(N):
-    r = rad[i]
-    x, y = pos[i]
-    it = cv.create_oval(x-r, y-r, x+r, y+r, fill=colors[i], width=0)
-    items.append(it)
-
-last = time.time()
-def tick():
-    global pos, vel, last
-    now = time.time()
-    dt = now - last
-    last = now
-
-    pos += vel * dt
-    # 碰撞墙反弹
-    for axis, lim in ((0, W), (1, H)):
-        hit_lo = pos[:,axis] - rad < 0
-        hit_hi = pos[:,axis] + rad > lim
-        vel[hit_lo | hit_hi, axis] *= -1
-        pos[:,axis] = np.clip(pos[:,axis], rad, lim - rad)
-
-    for i in range(N):
-        r = rad[i]; x, y = pos[i]
-        cv.coords(items[i], x-r, y-r, x+r, y+r)
-
-    root.after(16, tick)  # ~60 FPS
-
-root.after(0, tick)
-root.mainloop()
+F32 = np.float32
 
+# 无界面的模拟引擎：状态为 float32 的 struct-of-arrays（x/y/vx/vy/r/m 各一个数组），
+# 固定步长 dt，step(n) 推进 n 步；每步用到的按球大小的缓冲区都预先分配，原地更新。
+# 同一 seed 得到完全相同的轨迹。
+class Engine:
+    """Headless ball simulation: float32 struct-of-arrays state, fixed time step."""
+
+    def __init__(self, n=N, width=None, height=None, dt=1/60, seed=0, rmin=8, rmax=16, density=0.10):
+        rng = np.random.default_rng(seed)
+        self.n, self.dt = n, F32(dt)
+        self.r = rng.integers(rmin, rmax, size=n).astype(F32)
+        if width is None or height is None:
+            # 未给尺寸时取正方形世界，使球的总面积约占 density
+            side = math.sqrt(math.pi * float((self.r.astype(float) ** 2).sum()) / density)
+            width = height = max(side, 4.0 * rmax)
+        self.w, self.h = float(width), float(height)
+        self.x = rng.uniform(rmax, self.w - rmax, n).astype(F32)
+        self.y = rng.uniform(rmax, self.h - rmax, n).astype(F32)
+        self.vx = rng.uniform(-120, 120, n).astype(F32)  # px/s
+        self.vy = rng.uniform(-120, 120, n).astype(F32)
+        self.m = self.r * self.r  # 按面积计质量
+        self.inv_m = 1 / self.m
+        self.steps = 0
+
+        # 墙：中心坐标的合法范围
+        self.x_hi = (self.w - self.r).astype(F32)
+        self.y_hi = (self.h - self.r).astype(F32)
+        # 均匀网格粗筛：格子边长 = 最大直径，两球相交时必在同格或相邻格
+        self.cell = 2 * float(self.r.max()) if n else 1.0
+        self.gx = max(1, int(math.ceil(self.w / self.cell)))
+        self.gy = max(1, int(math.ceil(self.h / self.cell)))
+        # 热循环里复用的缓冲区
+        self._t = np.empty(n, F32)
+        self._hit = np.empty(n, bool)
+        self._hit2 = np.empty(n, bool)
+        self._cx = np.empty(n, np.intp)
+        self._cy = np.empty(n, np.intp)
+        self._key = np.empty(n, np.intp)
+        self._start = np.zeros(self.gx * self.gy + 1, np.intp)
+        self._self_lo = np.arange(1, n + 1)
+        self._src = np.tile(np.arange(n), len(NEIGHBOURS) + 1)
+
+    def step(self, n=1):
+        """Advance n fixed steps of dt."""
+        dt, t = self.dt, self._t
+        for _ in range(n):
+            np.multiply(self.vx, dt, out=t); self.x += t
+            np.multiply(self.vy, dt, out=t); self.y += t
+            # 球与球碰撞
+            self.collide()
+            # 碰撞墙反弹
+            self._wall(self.x, self.vx, self.x_hi)
+            self._wall(self.y, self.vy, self.y_hi)
+            self.steps += 1
+
+    def _wall(self, p, v, hi):
+        lo, hit, hit2 = self.r, self._hit, self._hit2
+        np.less(p, lo, out=hit)
+        np.greater(p, hi, out=hit2)
+        hit |= hit2
+        np.negative(v, out=v, where=hit)
+        np.clip(p, lo, hi, out=p)
+
+    def candidate_pairs(self):
+        """(i, j) index arrays of balls in the same or adjacent grid cells, each pair once."""
+        gx, gy = self.gx, self.gy
+        cx, cy, key, t = self._cx, self._cy, self._key, self._t
+        np.floor_divide(self.x, self.cell, out=t); cx[:] = t
+        np.floor_divide(self.y, self.cell, out=t); cy[:] = t
+        np.clip(cx, 0, gx - 1, out=cx)
+        np.clip(cy, 0, gy - 1, out=cy)
+        np.multiply(cx, gy, out=key); key += cy
+        order = np.argsort(key, kind="stable")
+        start = self._start  # 格子 c 的球是 order[start[c]:start[c+1]]
+        np.cumsum(np.bincount(key, minlength=gx * gy), out=start[1:])
+        cx, cy, key = cx[order], cy[order], key[order]
+
+        # 同格：排序后位于自己之后的球；邻格：每个球只看“右/下”半边的 4 个邻格，每对候选恰好出现一次
+        lo = [self._self_lo]
+        hi = [start[key + 1]]
+        for dx, dy in NEIGHBOURS:
+            nx, ny = cx + dx, cy + dy
+            ok = (nx < gx) & (ny >= 0) & (ny < gy)
+            nc = np.where(ok, nx * gy + ny, 0)
+            lo.append(np.where(ok, start[nc], 0))
+            hi.append(np.where(ok, start[nc + 1], 0))
+        lo, hi = np.concatenate(lo), np.concatenate(hi)
+
+        # 把每个 [lo, hi) 区间展开成 (src, 区间内每个位置)，不在 Python 里逐对循环
+        cnt = hi - lo
+        total = int(cnt.sum())
+        a = np.repeat(self._src, cnt)
+        b = np.repeat(lo - (np.cumsum(cnt) - cnt), cnt) + np.arange(total)
+        return order[a], order[b]
+
+    def collide(self):
+        """Elastic ball-ball collisions, all contacts of this step as one batch."""
+        if self.n < 2:
+            return
+        i, j = self.candidate_pairs()
+        dx = self.x[j] - self.x[i]
+        dy = self.y[j] - self.y[i]
+        dist2 = dx * dx + dy * dy
+        rsum = self.r[i] + self.r[j]
+        hit = (dist2 < rsum * rsum) & (dist2 > 0)
+        if not hit.any():
+            return
+        i, j, dx, dy, rsum = i[hit], j[hit], dx[hit], dy[hit], rsum[hit]
+        dist = np.sqrt(dist2[hit])
+        nx, ny = dx / dist, dy / dist
+        mi, mj = self.m[i], self.m[j]
+        w = mi * mj / (mi + mj)  # 约化质量
+
+        # 冲量：只处理相互靠近的球对，沿法线交换动量（完全弹性）
+        vn = (self.vx[j] - self.vx[i]) * nx + (self.vy[j] - self.vy[i]) * ny
+        imp = np.where(vn < 0, -2 * w * vn, 0)
+        # 位置修正：按质量反比把重叠推开，避免球粘在一起
+        push = (rsum - dist) * w
+
+        n = self.n
+        for p, v, nrm in ((self.x, self.vx, nx), (self.y, self.vy, ny)):
+            f = imp * nrm
+            g = push * nrm
+            v += (np.bincount(j, f, n) - np.bincount(i, f, n)) * self.inv_m
+            p += (np.bincount(j, g, n) - np.bincount(i, g, n)) * self.inv_m
+
+NEIGHBOURS = ((1, -1), (1, 0), (1, 1), (0, 1))
+
+# 基准：不启动 Tk，测每个规模的 steps/s 与 ns/ball/step。
+# 世界尺寸随 N 放大（球面积占比固定），每个规模至少跑 min_time 秒。
+def bench(sizes, min_time=1.0, seed=0, warmup=2):
+    print(f"{'N':>9} {'steps':>7} {'steps/s':>10} {'ns/ball/step':>13}")
+    for n in sizes:
+        eng = Engine(n, seed=seed)
+        eng.step(warmup)
+        steps, t0 = 0, time.perf_counter()
+        while True:
+            eng.step(1)
+            steps += 1
+            el = time.perf_counter() - t0
+            if el >= min_time and steps >= 3:
+                break
+        print(f"{n:>9} {steps:>7} {steps / el:>10.1f} {el / steps / n * 1e9:>13.1f}")
+
+# 画布渲染：每个球一个 oval，每帧每个球一次 coords（一次 Tcl 往返），N 到几百就成了瓶颈
+class CanvasRenderer:
+    """One canvas oval per ball, moved with cv.coords every frame."""
+
+    def __init__(self, cv, eng, colors):
+        self.cv = cv
+        self.items = []
+        for i in range(eng.n):
+            r = eng.r[i]; x, y = eng.x[i], eng.y[i]
+            self.items.append(cv.create_oval(x-r, y-r, x+r, y+r, fill="#%06x" % colors[i], width=0))
+
+    def draw(self, eng):
+        for i, it in enumerate(self.items):
+            r = eng.r[i]; x, y = eng.x[i], eng.y[i]
+            self.cv.coords(it, x-r, y-r, x+r, y+r)
+
+# 光栅渲染：所有圆盘用向量化的掩码画进一块 NumPy RGB 帧缓冲，再以 PPM 整块交给一个 PhotoImage。
+# 每帧的 Tcl 调用次数与 N 无关。
+class RasterRenderer:
+    """All balls rasterized into one RGB frame buffer, shown through a single PhotoImage."""
+
+    def __init__(self, cv, eng, colors, bg=(0, 0, 0)):
+        self.w, self.h = int(math.ceil(eng.w)), int(math.ceil(eng.h))
+        self.bg = np.array(bg, np.uint8)
+        self.fb = np.empty((self.h, self.w, 3), np.uint8)
+        self.header = b"P6 %d %d 255\n" % (self.w, self.h)
+        colors = np.asarray(colors)
+        self.rgb = np.stack([(colors >> 16) & 255, (colors >> 8) & 255, colors & 255], axis=1).astype(np.uint8)
+        # 半径是整数：每种半径预先算好圆盘内像素相对圆心的偏移，同半径的球一次画完
+        rr = np.rint(eng.r).astype(int)
+        self.groups = []
+        for r in np.unique(rr):
+            dy, dx = np.mgrid[-r:r + 1, -r:r + 1]
+            inside = dx * dx + dy * dy <= r * r
+            idx = np.nonzero(rr == r)[0]
+            # 偏移直接换算成帧缓冲里的线性下标
+            self.groups.append((int(r), idx, (dy * self.w + dx)[inside], self.rgb[idx][:, None]))
+        self.photo = None
+        if cv is not None:
+            import tkinter as tk
+            self.photo = tk.PhotoImage(master=cv, width=self.w, height=self.h)
+            cv.create_image(0, 0, image=self.photo, anchor="nw")
+
+    def rasterize(self, eng):
+        """Fill self.fb with the current frame (no Tk involved)."""
+        fb, w = self.fb, self.w
+        fb[:] = self.bg
+        pix = fb.reshape(-1, 3)
+        for r, idx, off, rgb in self.groups:
+            # 圆心夹到 [r, 边长-1-r]，整个圆盘都落在缓冲区内，逐像素不用再裁剪
+            cx = np.clip(np.rint(eng.x[idx]).astype(np.intp), r, w - 1 - r)
+            cy = np.clip(np.rint(eng.y[idx]).astype(np.intp), r, self.h - 1 - r)
+            pix[(cy * w + cx)[:, None] + off] = rgb
+        return fb
+
+    def draw(self, eng):
+        self.rasterize(eng)
+        self.photo.configure(data=self.header + self.fb.tobytes(), format="PPM")
+
+RENDERERS = {"canvas": CanvasRenderer, "raster": RasterRenderer}
+
+# 帧调度：按截止时间排下一帧（扣掉本帧已花的时间），物理用累加器按固定 dt 补步；
+# 落后时丢的是渲染帧而不是物理步（连续最多丢 max_skip 帧）。只有停顿超过 max_lag
+# （拖动窗口、挂起）时才截断累加器，免得越追越慢。
+class FrameLoop:
+    """Deadline-paced frames over a fixed-step engine; when behind, rendering is skipped, physics is not."""
+
+    def __init__(self, eng, view, after, fps=60, max_lag=0.25, max_skip=5, stats=None):
+        self.eng, self.view, self.after = eng, view, after
+        self.period = 1 / fps
+        self.dt = float(eng.dt)
+        self.max_lag, self.max_skip = max_lag, max_skip
+        self.stats = stats
+        self.acc = 0.0
+        self.skipped = 0
+        self.last = self.due = None
+
+    def start(self):
+        self.last = self.due = time.perf_counter()
+        self.after(0, self.tick)
+
+    def tick(self):
+        now = time.perf_counter()
+        frame = now - self.last
+        self.last = now
+        self.acc += min(frame, self.max_lag)
+        k = int(self.acc / self.dt)
+        self.acc -= k * self.dt
+        self.eng.step(k)
+        t1 = time.perf_counter()
+
+        # 物理做完已过本帧截止时间：不画，尽快进入下一帧
+        nxt = self.due + self.period
+        drop = t1 > nxt and self.skipped < self.max_skip
+        if drop:
+            self.skipped += 1
+        else:
+            self.view.draw(self.eng)
+            self.skipped = 0
+        t2 = time.perf_counter()
+        if self.stats is not None:
+            self.stats.add(now, frame, t1 - now, t2 - t1, k, drop)
+
+        # 落后超过一帧时不补排错过的帧，从现在重新对齐
+        self.due = nxt if nxt + self.period > t2 else t2
+        self.after(max(0, round((self.due - t2) * 1000)), self.tick)
+
+# 每帧计时：叠加层显示最近 window 帧的 FPS、帧时间 p50/p99、物理与渲染耗时；全部记录可导出 CSV
+class FrameStats:
+    """Per-frame timings with a rolling summary and CSV export."""
+
+    FIELDS = ("t", "frame_ms", "physics_ms", "render_ms", "steps", "dropped")
+
+    def __init__(self, window=240):
+        self.window = window
+        self.rows = []
+        self.t0 = None
+
+    def add(self, t, frame, physics, render, steps, dropped):
+        if self.t0 is None:
+            self.t0 = t
+        self.rows.append((round(t - self.t0, 6), round(frame * 1e3, 3), round(physics * 1e3, 3),
+                          round(render * 1e3, 3), steps, int(dropped)))
+
+    def summary(self):
+        # 第一帧的 frame_ms 是从启动算起的，只跳过这一行（CSV 里保留）
+        rows = self.rows[max(1, len(self.rows) - self.window):]
+        if len(rows) < 2:
+            return ""
+        t, frame, physics, render, _, dropped = np.array(rows, float).T
+        drawn = dropped == 0
+        # FPS 按真正画出来的帧的时间戳算；全都被丢时为 0
+        td = t[drawn]
+        fps = (len(td) - 1) / (td[-1] - td[0]) if len(td) >= 2 and td[-1] > td[0] else 0.0
+        p50, p99 = np.percentile(frame, [50, 99])
+        render_ms = f"{render[drawn].mean():5.2f} ms" if drawn.any() else "    - ms"
+        return (f"FPS {fps:5.1f}   frame p50 {p50:5.1f} ms  p99 {p99:5.1f} ms\n"
+                f"physics {physics.mean():5.2f} ms  render {render_ms}  "
+                f"dropped {int((~drawn).sum())}/{len(t)}")
+
+    def write_csv(self, path):
+        with open(path, "w", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(self.FIELDS)
+            w.writerows(self.rows)
+
+def demo(n=N, seed=0, renderer="canvas", size=(W, H), radius=(8, 16), fps=60, hz=60, overlay=False, csv_path=None):
+    import tkinter as tk
+    eng = Engine(n, size[0], size[1], dt=1/hz, seed=seed, rmin=radius[0], rmax=radius[1])
+    rng = np.random.default_rng(seed)
+    colors = rng.integers(0, 0xFFFFFF, size=n)
+
+    root = tk.Tk()
+    root.title("NumPy + Tkinter: bouncing balls")
+    cv = tk.Canvas(root, width=size[0], height=size[1], bg="black", highlightthickness=0)
+    cv.pack()
+    view = RENDERERS[renderer](cv, eng, colors)
+
+    stats = FrameStats() if overlay or csv_path else None
+    loop = FrameLoop(eng, view, root.after, fps=fps, stats=stats)
+    if overlay:
+        # 叠加层单独按 4 Hz 刷新，每次只改一个文本项
+        text = cv.create_text(8, 8, anchor="nw", fill="white", font=("TkFixedFont", 10))
+        def refresh():
+            cv.itemconfigure(text, text=stats.summary())
+            root.after(250, refresh)
+        root.after(250, refresh)
+
+    def close():
+        if csv_path:
+            stats.write_csv(csv_path)
+            print(f"[OK] {len(stats.rows)} frames -> {csv_path}")
+        root.destroy()
+    root.protocol("WM_DELETE_WINDOW", close)
+
+    loop.start()
+    root.mainloop()
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="NumPy bouncing balls (Tk demo, or a headless benchmark)")
+    ap.add_argument("-n", type=int, default=N, help="number of balls in the demo")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--renderer", choices=sorted(RENDERERS), default="canvas",
+                    help="canvas: one oval item per ball; raster: one PhotoImage per frame (thousands of balls)")
+    ap.add_argument("--size", type=lambda s: tuple(int(v) for v in s.split("x")), default=(W, H), help="WxH, e.g. 1280x720")
+    ap.add_argument("--radius", type=lambda s: tuple(int(v) for v in s.split(",")), default=(8, 16),
+                    help="MIN,MAX ball radius (MAX exclusive), e.g. 3,7 for thousands of balls")
+    ap.add_argument("--fps", type=int, default=60, help="target render rate")
+    ap.add_argument("--hz", type=int, default=60, help="fixed physics rate (steps per simulated second)")
+    ap.add_argument("--overlay", action="store_true", help="show FPS, frame time p50/p99 and physics/render split")
+    ap.add_argument("--csv", metavar="PATH", help="write per-frame timings to PATH on exit")
+    sub = ap.add_subparsers(dest="cmd")
+    p_bench = sub.add_parser("bench", help="steps/s and ns/ball/step without Tk")
+    p_bench.add_argument("--sizes", type=lambda s: [int(float(x)) for x in s.split(",")],
+                         default=[100, 1000, 10000, 100000, 1000000], help="comma separated, e.g. 1e2,1e4")
+    p_bench.add_argument("--min-time", type=float, default=1.0, help="seconds per size")
+    args = ap.parse_args()
+    if args.cmd == "bench":
+        bench(args.sizes, args.min_time, args.seed)
+    else:
+        demo(args.n, args.seed, args.renderer, args.size, args.radius, args.fps, args.hz, args.overlay, args.csv)
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark `debwrap.py gen` on synthetic deb pools (offline).
+
+For every pool size the harness copies tools/ and templates/ into a scratch
+root (debwrap writes its workspace next to tools/), generates a pool with
+bench/synthdeb.py and times gen in three states:
+
+  cold   no workspace, no metadata cache, no pool index
+  warm   --force with the metadata cache and pool index already populated
+  noop   plain rerun; every package is skipped by its input fingerprint
+
+each with and without the DSO scan. Reported per case: wall time,
+packages/s, ELF-candidate files scanned/s and peak RSS (max over the gen
+process and its workers).
+
+Usage:
+  python bench/bench_gen.py                              # sizes 10,100,1000; compare with bench/baseline.json
+  python bench/bench_gen.py --sizes 10,100 --jobs 4
+  python bench/bench_gen.py --save-baseline              # record the current numbers as the baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BENCH_DIR.parent
+DEFAULT_BASELINE = BENCH_DIR / "baseline.json"
+DEFAULT_WORK = Path(os.environ.get("TMPDIR", "/tmp")) / "deb2conda-bench"
+
+sys.path.insert(0, str(BENCH_DIR))
+from synthdeb import make_pool, write_manifest, write_rules  # noqa: E402
+
+# Runs debwrap's main() and reports max RSS of itself and its (reaped) worker processes.
+_RUNNER = r"""
+import json, os, resource, runpy, sys
+out, script = sys.argv[1], sys.argv[2]
+sys.argv = sys.argv[2:]
+sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+code = 0
+try:
+    runpy.run_path(script, run_name="__main__")
+except SystemExit as exc:
+    code = exc.code if isinstance(exc.code, int) else 1
+finally:
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    with open(out, "w") as f:
+        json.dump({"exit": code, "maxrss_kb": rss}, f)
+sys.exit(code)
+"""
+
+
+def _prepare_root(root: Path) -> None:
+    """Fresh copy of the generator code; the pool and workspace are left alone."""
+    for sub in ("tools", "templates"):
+        shutil.rmtree(root / sub, ignore_errors=True)
+        shutil.copytree(REPO_ROOT / sub, root / sub, ignore=shutil.ignore_patterns("__pycache__"))
+
+
+def _reset(root: Path, pool: Path) -> None:
+    shutil.rmtree(root / "workspace", ignore_errors=True)
+    (pool / ".debpool.json").unlink(missing_ok=True)
+
+
+def _run_gen(root: Path, pool: Path, dso: bool, jobs: int, force: bool) -> Dict[str, Any]:
+    stats = root / "run-stats.json"
+    argv = [sys.executable, "-c", _RUNNER, str(stats), str(root / "tools" / "debwrap.py"), "gen",
+            "--manifest", str(root / "manifest.yaml"), "--rules", str(root / "rules.yaml"),
+            "--deb-src", str(pool), "--jobs", str(jobs)]
+    if not dso:
+        argv.append("--no-dso-scan")
+    if force:
+        argv.append("--force")
+    log = root / "last-run.log"
+    t0 = time.perf_counter()
+    with open(log, "wb") as lf:
+        rc = subprocess.call(argv, stdout=lf, stderr=subprocess.STDOUT, cwd=str(root))
+    wall = time.perf_counter() - t0
+    try:
+        data = json.loads(stats.read_text())
+    except (OSError, ValueError):
+        data = {"exit": rc, "maxrss_kb": 0}
+    if rc != 0:
+        print(f"[WARN] gen exited with {rc}; see {log}")
+    return {"wall_s": wall, "exit": rc, "peak_rss_mb": data["maxrss_kb"] / 1024.0}
+
+
+def run_size(work: Path, size: int, jobs: int, modes: List[str], dso_modes: List[bool],
+             compression: str) -> List[Dict[str, Any]]:
+    root = work / f"n{size}"
+    root.mkdir(parents=True, exist_ok=True)
+    pool = root / "pool"
+    t0 = time.perf_counter()
+    info = make_pool(pool, size, compression)
+    print(f"[BENCH] pool n={size}: {len(info['packages'])} debs, {info['files_scanned']} scan candidates "
+          f"({time.perf_counter() - t0:.1f}s)")
+    write_manifest(root / "manifest.yaml", info)
+    write_rules(root / "rules.yaml", info)
+    _prepare_root(root)
+
+    results: List[Dict[str, Any]] = []
+    for dso in dso_modes:
+        for mode in ("cold", "warm", "noop"):
+            if mode == "cold":
+                _reset(root, pool)
+            res = _run_gen(root, pool, dso, jobs, force=(mode == "warm"))
+            if mode not in modes:
+                continue  # still run it: later states depend on it
+            files = info["files_scanned"] if dso else 0
+            res.update({
+                "case": f"n{size}/{'dso' if dso else 'nodso'}/{mode}/j{jobs}",
+                "size": size,
+                "dso": dso,
+                "mode": mode,
+                "jobs": jobs,
+                "pkgs_per_s": size / res["wall_s"] if res["wall_s"] else 0.0,
+                "files_scanned": files,
+                "files_per_s": (files / res["wall_s"]) if (files and mode != "noop") else None,
+            })
+            print(f"  {res['case']:<28} {res['wall_s']:8.3f}s  {res['pkgs_per_s']:9.1f} pkg/s  "
+                  + (f"{res['files_per_s']:9.1f} files/s  " if res["files_per_s"] else " " * 19)
+                  + f"rss {res['peak_rss_mb']:6.1f} MB")
+            results.append(res)
+    return results
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Return the cases whose wall time grew by more than threshold (fraction) over the baseline."""
+    base = {r["case"]: r for r in baseline.get("results", [])}
+    regressions: List[str] = []
+    print(f"[BENCH] compared with baseline from {baseline.get('created', '?')} ({baseline.get('host', '?')})")
+    for r in results:
+        b = base.get(r["case"])
+        if not b or not b.get("wall_s"):
+            continue
+        ratio = r["wall_s"] / b["wall_s"]
+        flag = ""
+        if ratio > 1.0 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(r["case"])
+        print(f"  {r['case']:<28} {b['wall_s']:8.3f}s -> {r['wall_s']:8.3f}s  x{ratio:5.2f}{flag}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark debwrap gen on synthetic debs")
+    parser.add_argument("--sizes", default="10,100,1000", help="Comma-separated package counts")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="Passed to gen --jobs")
+    parser.add_argument("--modes", default="cold,warm,noop", help="Which states to report")
+    parser.add_argument("--dso", choices=["both", "on", "off"], default="both", help="Run with/without the DSO scan")
+    parser.add_argument("--compression", choices=["xz", "gz", "none"], default="xz", help="data.tar compression")
+    parser.add_argument("--work", type=Path, default=DEFAULT_WORK, help="Scratch dir (pools are reused between runs)")
+    parser.add_argument("--out", type=Path, default=None, help="Write this run's results as JSON")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Slowdown fraction reported as regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit 1 if any case regressed")
+    args = parser.parse_args()
+
+    sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    dso_modes = {"both": [True, False], "on": [True], "off": [False]}[args.dso]
+
+    results: List[Dict[str, Any]] = []
+    for size in sizes:
+        results.extend(run_size(args.work, size, args.jobs, modes, dso_modes, args.compression))
+
+    doc = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "compression": args.compression,
+        "results": results,
+    }
+    if args.out:
+        args.out.write_text(json.dumps(doc, indent=2), encoding="utf-8")
+        print(f"[BENCH] results written to {args.out}")
+
+    regressions: List[str] = []
+    baseline: Optional[Dict[str, Any]] = None
+    if args.baseline.is_file() and not args.save_baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.threshold)
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(doc, indent=2), encoding="utf-8")
+        print(f"[BENCH] baseline saved to {args.baseline}")
+    if regressions and args.fail_on_regression:
+        print(f"[BENCH] {len(regressions)} regression(s): {', '.join(regressions)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Synthetic .deb pool for benchmarking debwrap (no network, no dpkg needed).
+
+Every deb is a real ar archive (debian-binary, control.tar.gz, data.tar.xz)
+whose shared objects and executables are minimal but valid ELF64 riscv64
+images with a PT_DYNAMIC segment carrying DT_NEEDED/DT_SONAME, so both
+`readelf -d` and tools/elfdyn.py see the same dependencies as on a real deb.
+
+Package mix (by index i): lib (60%), bin (20%), python_ext (10%), data (10%).
+Libraries and tools link against a few lower-numbered libraries, so the
+DSO-derived run deps form a realistic DAG.
+
+Usage:
+  info = make_pool(Path("/tmp/bench/pool"), 100)
+  write_manifest(Path("/tmp/bench/manifest.yaml"), info)
+  write_rules(Path("/tmp/bench/rules.yaml"), info)
+"""
+
+import io
+import json
+import struct
+import tarfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+POOL_FORMAT = 1
+ARCH = "riscv64"
+MULTIARCH = "riscv64-linux-gnu"
+MTIME = 1700000000  # fixed, so the pool is byte-for-byte reproducible
+
+EM_RISCV = 243
+ET_DYN = 3
+PT_LOAD = 1
+PT_DYNAMIC = 2
+DT_NULL, DT_NEEDED, DT_STRTAB, DT_STRSZ, DT_SONAME = 0, 1, 5, 10, 14
+
+
+def make_elf(needed: List[str], soname: Optional[str] = None, payload: int = 0) -> bytes:
+    """Minimal little-endian ELF64 image: header, PT_LOAD + PT_DYNAMIC, dynamic array, string table."""
+    strtab = bytearray(b"\x00")
+    offsets: Dict[str, int] = {}
+    for s in needed + ([soname] if soname else []):
+        if s not in offsets:
+            offsets[s] = len(strtab)
+            strtab += s.encode() + b"\x00"
+    dyn: List[Tuple[int, int]] = [(DT_NEEDED, offsets[n]) for n in needed]
+    if soname:
+        dyn.append((DT_SONAME, offsets[soname]))
+    ehsize, phentsize, phnum = 64, 56, 2
+    dyn_off = ehsize + phentsize * phnum
+    dyn_size = 16 * (len(dyn) + 3)  # + STRTAB, STRSZ, NULL
+    str_off = dyn_off + dyn_size
+    dyn += [(DT_STRTAB, str_off), (DT_STRSZ, len(strtab)), (DT_NULL, 0)]
+    total = str_off + len(strtab) + payload
+
+    out = bytearray()
+    ident = b"\x7fELF" + bytes([2, 1, 1, 0]) + bytes(8)
+    out += ident
+    out += struct.pack("<HHIQQQIHHHHHH", ET_DYN, EM_RISCV, 1, 0, ehsize, 0, 0x5,
+                       ehsize, phentsize, phnum, 64, 0, 0)
+    out += struct.pack("<IIQQQQQQ", PT_LOAD, 5, 0, 0, 0, total, total, 0x1000)
+    out += struct.pack("<IIQQQQQQ", PT_DYNAMIC, 6, dyn_off, dyn_off, dyn_off, dyn_size, dyn_size, 8)
+    for tag, val in dyn:
+        out += struct.pack("<qQ", tag, val)
+    out += strtab
+    out += bytes(payload)
+    return bytes(out)
+
+
+def _tar_bytes(entries: List[Tuple[str, Any]], compression: str) -> bytes:
+    """entries: (path, bytes) for files, (path, None) for dirs, (path, '->target') for symlinks."""
+    buf = io.BytesIO()
+    mode = {"gz": "w:gz", "xz": "w:xz", "none": "w"}[compression]
+    with tarfile.open(fileobj=buf, mode=mode, format=tarfile.GNU_FORMAT) as tar:
+        for path, data in entries:
+            ti = tarfile.TarInfo("./" + path if path else ".")
+            ti.mtime = MTIME
+            ti.uname = ti.gname = "root"
+            if data is None:
+                ti.type = tarfile.DIRTYPE
+                ti.mode = 0o755
+                tar.addfile(ti)
+            elif isinstance(data, str) and data.startswith("->"):
+                ti.type = tarfile.SYMTYPE
+                ti.linkname = data[2:]
+                ti.mode = 0o777
+                tar.addfile(ti)
+            else:
+                ti.size = len(data)
+                ti.mode = 0o755 if data[:4] == b"\x7fELF" else 0o644
+                tar.addfile(ti, io.BytesIO(data))
+    return buf.getvalue()
+
+
+def _ar_member(name: str, data: bytes) -> bytes:
+    header = f"{name:<16}{MTIME:<12}{0:<6}{0:<6}{'100644':<8}{len(data):<10}`\n".encode()
+    return header + data + (b"\n" if len(data) % 2 else b"")
+
+
+def write_deb(path: Path, control: Dict[str, str], files: List[Tuple[str, Any]], compression: str = "xz") -> None:
+    dirs = set()
+    for p, _ in files:
+        parts = p.split("/")[:-1]
+        for i in range(1, len(parts) + 1):
+            dirs.add("/".join(parts[:i]))
+    data_entries: List[Tuple[str, Any]] = [("", None)] + [(d, None) for d in sorted(dirs)] + sorted(files)
+    control_text = "".join(f"{k}: {v}\n" for k, v in control.items())
+    control_tar = _tar_bytes([("", None), ("control", control_text.encode())], "gz")
+    suffix = {"gz": ".gz", "xz": ".xz", "none": ""}[compression]
+    blob = b"!<arch>\n"
+    blob += _ar_member("debian-binary", b"2.0\n")
+    blob += _ar_member("control.tar.gz", control_tar)
+    blob += _ar_member(f"data.tar{suffix}", _tar_bytes(data_entries, compression))
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_bytes(blob)
+    tmp.replace(path)
+
+
+def _kind(i: int) -> str:
+    r = i % 10
+    if r < 6:
+        return "lib"
+    if r < 8:
+        return "bin"
+    if r < 9:
+        return "python_ext"
+    return "data"
+
+
+def _lib_deps(i: int, libs: List[int]) -> List[int]:
+    """Up to three lower-numbered libraries, chosen deterministically."""
+    lower = [j for j in libs if j < i]
+    return sorted({lower[(i * k) % len(lower)] for k in (3, 7, 11)}) if lower else []
+
+
+def _control(package: str, arch: str) -> Dict[str, str]:
+    return {
+        "Package": package,
+        "Version": "1.0-1",
+        "Architecture": arch,
+        "Maintainer": "bench <bench@example.invalid>",
+        "Installed-Size": "64",
+        "Description": f"synthetic benchmark package {package}",
+    }
+
+
+def make_pool(pool: Path, count: int, compression: str = "xz", payload: int = 4096) -> Dict[str, Any]:
+    """Create (or reuse) a pool of `count` synthetic debs. Returns the pool description."""
+    pool.mkdir(parents=True, exist_ok=True)
+    info_path = pool / "bench-pool.json"
+    try:
+        info = json.loads(info_path.read_text(encoding="utf-8"))
+        if info.get("format") == POOL_FORMAT and info.get("count") == count and info.get("compression") == compression:
+            return info
+    except (OSError, ValueError):
+        pass
+
+    libs = [i for i in range(count) if _kind(i) == "lib"]
+    packages: List[Dict[str, Any]] = []
+    sonames: Dict[str, str] = {"libc.so.6": "libc6"}
+    files_scanned = 0
+    for i in range(count):
+        kind = _kind(i)
+        files: List[Tuple[str, Any]] = []
+        needed = ["libc.so.6"] + [f"libbench{j}.so.1" for j in _lib_deps(i, libs)]
+        if kind == "lib":
+            name, deb_pkg, arch = f"libbench{i}", f"libbench{i}-1", ARCH
+            so = f"libbench{i}.so.1"
+            libdir = f"usr/lib/{MULTIARCH}"
+            files.append((f"{libdir}/{so}.0.0", make_elf(needed, so, payload)))
+            files.append((f"{libdir}/{so}", f"->{so}.0.0"))
+            sonames[so] = name
+        elif kind == "bin":
+            name, deb_pkg, arch = f"bench-tool{i}", f"bench-tool{i}", ARCH
+            files.append((f"usr/bin/bench-tool{i}", make_elf(needed, None, payload)))
+            files.append((f"usr/share/man/man1/bench-tool{i}.1.gz", b"\x1f\x8b" + bytes(64)))
+        elif kind == "python_ext":
+            name, deb_pkg, arch = f"benchmod{i}", f"python3-benchmod{i}", ARCH
+            site = f"usr/lib/python3/dist-packages/benchmod{i}"
+            files.append((f"{site}/__init__.py", f"from ._ext import *  # benchmod{i}\n".encode()))
+            for m in range(5):
+                files.append((f"{site}/mod{m}.py", f"VALUE = {m}\n\ndef f(x):\n    return x + {m}\n".encode()))
+            files.append((f"{site}/_ext.cpython-312-{MULTIARCH}.so", make_elf(needed, None, payload)))
+        else:
+            name, deb_pkg, arch = f"bench-data{i}", f"bench-data{i}", "all"
+            for m in range(8):
+                files.append((f"usr/share/bench-data{i}/file{m}.txt", f"data {i} {m}\n".encode() * 32))
+        files.append((f"usr/share/doc/{deb_pkg}/copyright", b"Synthetic data for benchmarks.\n"))
+        files_scanned += sum(1 for p, d in files if p.startswith(("usr/lib/", "usr/bin/", "lib/", "bin/")))
+        filename = f"{deb_pkg}_1.0-1_{arch}.deb"
+        write_deb(pool / filename, _control(deb_pkg, arch), files, compression)
+        packages.append({"name": name, "kind": kind, "deb": filename})
+
+    info = {
+        "format": POOL_FORMAT,
+        "count": count,
+        "compression": compression,
+        "files_scanned": files_scanned,
+        "packages": packages,
+        "sonames": sonames,
+    }
+    info_path.write_text(json.dumps(info, indent=1), encoding="utf-8")
+    return info
+
+
+def write_manifest(path: Path, info: Dict[str, Any]) -> None:
+    lines = ["channel_root: /tmp/deb2conda-bench-channel/", "", "packages:"]
+    for p in info["packages"]:
+        lines.append(f"  - name: {p['name']}")
+        lines.append(f"    debs: [ {p['deb']} ]")
+        lines.append(f"    kind: {p['kind']}")
+        if p["kind"] == "python_ext":
+            lines.append(f"    extras: {{ pyver: \"3.12\", pyabi: \"312\", ensure_modules: [{p['name']}] }}")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def write_rules(path: Path, info: Dict[str, Any]) -> None:
+    lines = ["map_run_deps:"]
+    for so, pkg in sorted(info["sonames"].items()):
+        lines.append(f"  {so}: \"{pkg}\"")
+    lines += ["", "test_snippets:", "  import_only: \"python -c \\\"import {module}; print('OK')\\\"\""]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Incremental indexer for a local conda channel (file:// channel_root).
+
+repodata.json of every subdir is loaded once into memory. Existence checks
+("is artifact X there", "is any version of package Y there") are set lookups.
+New .conda / .tar.bz2 files are added by reading only their info/index.json;
+artifacts already listed in repodata are never opened again, and entries
+whose file disappeared are dropped. Only subdirs that changed are rewritten.
+
+Usage:
+  ch = LocalChannel(Path("/workspace/local-conda-channel"))
+  added = ch.scan()                     # pick up files that are not in repodata yet
+  ch.has_name("jq"), ch.has_artifact("jq-1.7.1-riscv64_aptwrap_0")
+  ch.add(Path(".../linux-riscv64/jq-1.7.1-riscv64_aptwrap_0.conda"))
+  ch.save()
+"""
+
+import hashlib
+import json
+import os
+import tarfile
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from debfile import zstd_reader
+
+EXTS = (".conda", ".tar.bz2")
+_KEYS = {".conda": "packages.conda", ".tar.bz2": "packages"}
+
+
+def split_ext(filename: str) -> Tuple[str, str]:
+    """('jq-1.7.1-h0_0', '.conda'); ext is '' for non-artifacts."""
+    for ext in EXTS:
+        if filename.endswith(ext):
+            return filename[: -len(ext)], ext
+    return filename, ""
+
+
+def _index_from_tar(fobj: Any, mode: str) -> Optional[Dict[str, Any]]:
+    with tarfile.open(fileobj=fobj, mode=mode) as tar:
+        for member in tar:
+            if member.name.lstrip("./") == "info/index.json":
+                f = tar.extractfile(member)
+                return json.load(f) if f is not None else None
+    return None
+
+
+def read_index_json(path: Path) -> Dict[str, Any]:
+    """info/index.json of a .conda (zip + info-*.tar.zst) or .tar.bz2 artifact."""
+    stem, ext = split_ext(path.name)
+    if ext == ".conda":
+        with zipfile.ZipFile(path) as zf:
+            names = zf.namelist()
+            info = f"info-{stem}.tar.zst"
+            if info not in names:
+                info = next((n for n in names if n.startswith("info-") and n.endswith(".tar.zst")), "")
+            with zf.open(info) as raw:
+                data = _index_from_tar(zstd_reader(raw), "r|")
+    elif ext == ".tar.bz2":
+        with open(path, "rb") as raw:
+            data = _index_from_tar(raw, "r|bz2")
+    else:
+        raise ValueError(f"not a conda artifact: {path}")
+    if not data:
+        raise ValueError(f"no info/index.json in {path}")
+    return data
+
+
+def _digests(path: Path) -> Tuple[str, str, int]:
+    md5, sha = hashlib.md5(), hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            md5.update(chunk)
+            sha.update(chunk)
+            size += len(chunk)
+    return md5.hexdigest(), sha.hexdigest(), size
+
+
+def _incr(counts: Dict[str, int], key: str, delta: int) -> None:
+    n = counts.get(key, 0) + delta
+    if n > 0:
+        counts[key] = n
+    else:
+        counts.pop(key, None)
+
+
+class LocalChannel:
+    """In-memory view of <root>/<subdir>/repodata.json for all subdirs."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = Path(root)
+        self.repodata: Dict[str, Dict[str, Any]] = {}
+        self._files: Dict[str, Set[str]] = {}  # subdir -> artifact filenames
+        self._stems: Dict[str, int] = {}  # '<name>-<version>-<build>' -> number of files (.conda/.tar.bz2)
+        self._names: Dict[str, int] = {}  # package name -> number of artifacts
+        self._dirty: Set[str] = set()
+        self.added: List[Path] = []
+        self.removed: List[str] = []
+        self._load()
+
+    # -- loading --------------------------------------------------------------
+    def _subdirs(self) -> List[str]:
+        if not self.root.is_dir():
+            return []
+        return sorted(e.name for e in os.scandir(self.root) if e.is_dir() and not e.name.startswith("."))
+
+    def _empty(self, subdir: str) -> Dict[str, Any]:
+        return {"info": {"subdir": subdir}, "packages": {}, "packages.conda": {}, "removed": [], "repodata_version": 1}
+
+    def _load(self) -> None:
+        for subdir in self._subdirs():
+            path = self.root / subdir / "repodata.json"
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            for key in ("packages", "packages.conda"):
+                data.setdefault(key, {})
+            self.repodata[subdir] = data
+            for key in ("packages", "packages.conda"):
+                for fn, rec in data[key].items():
+                    self._remember(subdir, fn, rec.get("name"))
+
+    def _remember(self, subdir: str, fn: str, name: Optional[str]) -> None:
+        self._files.setdefault(subdir, set()).add(fn)
+        stem, _ = split_ext(fn)
+        _incr(self._stems, stem, 1)
+        _incr(self._names, name or stem.rsplit("-", 2)[0], 1)
+
+    def _forget(self, subdir: str, fn: str, name: Optional[str]) -> None:
+        self._files.get(subdir, set()).discard(fn)
+        stem, _ = split_ext(fn)
+        _incr(self._stems, stem, -1)
+        _incr(self._names, name or stem.rsplit("-", 2)[0], -1)
+
+    # -- queries --------------------------------------------------------------
+    def has_artifact(self, name: str) -> bool:
+        """name is a filename (with extension) or a '<name>-<version>-<build>' stem."""
+        stem, ext = split_ext(name)
+        if not ext:
+            return stem in self._stems
+        return any(name in files for files in self._files.values())
+
+    def has_name(self, package: str) -> bool:
+        return package in self._names
+
+    def artifacts(self) -> List[str]:
+        return sorted(f"{subdir}/{fn}" for subdir, files in self._files.items() for fn in files)
+
+    # -- updates --------------------------------------------------------------
+    def add(self, path: Path, replace: bool = False) -> bool:
+        """Record an artifact that lives in <root>/<subdir>/. Returns False if it was already indexed
+        (unless replace=True, e.g. for a rebuild that overwrote the file under the same name).
+        """
+        path = Path(path)
+        subdir = path.parent.name
+        stem, ext = split_ext(path.name)
+        if not ext:
+            raise ValueError(f"not a conda artifact: {path}")
+        if path.name in self._files.get(subdir, set()):
+            if not replace:
+                return False
+            self._drop(subdir, path.name)
+        rec = dict(read_index_json(path))
+        rec["md5"], rec["sha256"], rec["size"] = _digests(path)
+        data = self.repodata.setdefault(subdir, self._empty(subdir))
+        data.setdefault(_KEYS[ext], {})[path.name] = rec
+        self._remember(subdir, path.name, rec.get("name"))
+        self._dirty.add(subdir)
+        self.added.append(path)
+        return True
+
+    def _drop(self, subdir: str, fn: str) -> None:
+        rec = self.repodata[subdir].get(_KEYS[split_ext(fn)[1]], {}).pop(fn, None) or {}
+        self._forget(subdir, fn, rec.get("name"))
+        self._dirty.add(subdir)
+
+    def scan(self) -> List[Path]:
+        """Index files present on disk but missing from repodata; drop entries whose file is gone.
+        Returns the newly added artifacts.
+        """
+        added: List[Path] = []
+        for subdir in self._subdirs():
+            on_disk = {e.name: e.stat().st_size for e in os.scandir(self.root / subdir)
+                       if e.is_file() and split_ext(e.name)[1]}
+            known = set(self._files.get(subdir, set()))
+            # same name but different size: rebuilt in place, index it again
+            data = self.repodata.get(subdir, {})
+            stale = {fn for fn in known & set(on_disk)
+                     if data.get(_KEYS[split_ext(fn)[1]], {}).get(fn, {}).get("size") != on_disk[fn]}
+            for fn in sorted(set(on_disk) - known | stale):
+                try:
+                    if self.add(self.root / subdir / fn, replace=True):
+                        added.append(self.root / subdir / fn)
+                except Exception as exc:
+                    print(f"[WARN] cannot index {self.root / subdir / fn}: {exc}")
+            for fn in sorted(known - set(on_disk)):
+                self._drop(subdir, fn)
+                self.removed.append(f"{subdir}/{fn}")
+        return added
+
+    def save(self) -> List[str]:
+        """Write repodata.json for changed subdirs (and an empty noarch/ one if missing, as conda expects)."""
+        if self._dirty and "noarch" not in self.repodata and not (self.root / "noarch" / "repodata.json").exists():
+            self.repodata["noarch"] = self._empty("noarch")
+            self._dirty.add("noarch")
+        written: List[str] = []
+        for subdir in sorted(self._dirty):
+            path = self.root / subdir / "repodata.json"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".repodata.json.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(self.repodata[subdir], indent=2, sort_keys=True), encoding="utf-8")
+            os.replace(tmp, path)
+            written.append(subdir)
+        self._dirty.clear()
+        return written
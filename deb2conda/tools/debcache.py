@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Persistent, content-addressed metadata cache for .deb files (SQLite).
+
+Facts that never change for a given .deb (control fields, member list, ELF dynamic
+info of its members) are stored under the deb's sha256. A (path, size, mtime) fast path avoids
+re-hashing unchanged files, so a warm lookup costs one stat() and one SELECT.
+
+Usage:
+  cache = DebCache(Path("workspace/debcache.sqlite"))
+  control = cache.get(deb, "control")
+  if control is None:
+      control = DebFile(deb).control
+      cache.put(deb, "control", control)
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    sha256    TEXT NOT NULL,
+    kind      TEXT NOT NULL,
+    data      TEXT NOT NULL,
+    nbytes    INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (sha256, kind)
+);
+CREATE TABLE IF NOT EXISTS paths (
+    path     TEXT PRIMARY KEY,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256   TEXT NOT NULL
+);
+"""
+
+
+def sha256_file(path: Path, bufsize: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(bufsize)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class DebCache:
+    """Key/value store of JSON blobs addressed by (deb sha256, kind)."""
+
+    def __init__(self, db_path: Path) -> None:
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.db_path), timeout=60, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        version = self._db.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self._db.executescript("DROP TABLE IF EXISTS meta; DROP TABLE IF EXISTS paths;")
+            self._db.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        self._db.executescript(_SCHEMA)
+        # sha256 per resolved path, valid for the lifetime of this object
+        self._digests: Dict[str, Tuple[int, int, str]] = {}
+
+    def close(self) -> None:
+        self._db.close()
+
+    def digest(self, path: Path) -> str:
+        """sha256 of path, via the (path, size, mtime) fast path when the file is unchanged."""
+        key = str(Path(path).resolve())
+        st = os.stat(key)
+        mem = self._digests.get(key)
+        if mem and mem[0] == st.st_size and mem[1] == st.st_mtime_ns:
+            return mem[2]
+        row = self._db.execute(
+            "SELECT sha256 FROM paths WHERE path=? AND size=? AND mtime_ns=?", (key, st.st_size, st.st_mtime_ns)
+        ).fetchone()
+        if row:
+            digest = row[0]
+        else:
+            digest = sha256_file(Path(key))
+            self._db.execute(
+                "INSERT OR REPLACE INTO paths(path, size, mtime_ns, sha256) VALUES (?,?,?,?)",
+                (key, st.st_size, st.st_mtime_ns, digest),
+            )
+        self._digests[key] = (st.st_size, st.st_mtime_ns, digest)
+        return digest
+
+    def get(self, path: Path, kind: str) -> Optional[Any]:
+        digest = self.digest(path)
+        row = self._db.execute("SELECT data FROM meta WHERE sha256=? AND kind=?", (digest, kind)).fetchone()
+        if row is None:
+            return None
+        self._db.execute("UPDATE meta SET last_used=? WHERE sha256=? AND kind=?", (time.time(), digest, kind))
+        return json.loads(row[0])
+
+    def put(self, path: Path, kind: str, value: Any) -> None:
+        digest = self.digest(path)
+        data = json.dumps(value, separators=(",", ":"), sort_keys=True)
+        self._db.execute(
+            "INSERT OR REPLACE INTO meta(sha256, kind, data, nbytes, last_used) VALUES (?,?,?,?,?)",
+            (digest, kind, data, len(data), time.time()),
+        )
+
+    def size(self) -> int:
+        """Total payload bytes stored (excluding SQLite overhead)."""
+        return int(self._db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM meta").fetchone()[0])
+
+    def prune(self, max_bytes: int) -> Tuple[int, int, int]:
+        """Evict least-recently-used entries until the payload fits in max_bytes.
+        Also drops path rows for files that vanished or whose digest has no entries.
+        Returns (evicted_entries, bytes_before, bytes_after).
+        """
+        before = self.size()
+        total = before
+        evicted = 0
+        if total > max_bytes:
+            rows = self._db.execute("SELECT sha256, kind, nbytes FROM meta ORDER BY last_used ASC").fetchall()
+            self._db.execute("BEGIN")
+            for digest, kind, nbytes in rows:
+                if total <= max_bytes:
+                    break
+                self._db.execute("DELETE FROM meta WHERE sha256=? AND kind=?", (digest, kind))
+                total -= nbytes
+                evicted += 1
+            self._db.execute("COMMIT")
+        stale = [p for (p,) in self._db.execute("SELECT path FROM paths") if not os.path.exists(p)]
+        self._db.executemany("DELETE FROM paths WHERE path=?", [(p,) for p in stale])
+        self._db.execute("DELETE FROM paths WHERE sha256 NOT IN (SELECT sha256 FROM meta)")
+        self._db.execute("VACUUM")
+        self._digests.clear()
+        return evicted, before, total
+
+
+def parse_size(text: str) -> int:
+    """Parse sizes like '512K', '64M', '2G' or plain bytes."""
+    s = str(text).strip().upper().rstrip("B")
+    mult = 1
+    for suffix, factor in (("K", 1 << 10), ("M", 1 << 20), ("G", 1 << 30), ("T", 1 << 40)):
+        if s.endswith(suffix):
+            s, mult = s[:-1], factor
+            break
+    return int(float(s) * mult)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+In-process reader for Debian binary packages (.deb), no dpkg-deb required.
+
+A .deb is an `ar` archive with three members:
+  debian-binary        "2.0\n"
+  control.tar[.gz|.xz|.zst|.bz2]
+  data.tar[.gz|.xz|.zst|.bz2]
+
+Usage:
+  deb = DebFile(Path("libx11-6_1.8.7-1_riscv64.deb"))
+  deb.control["Version"]                # control fields
+  for info, fobj in deb.iter_data():    # streamed data.tar members
+      ...
+  deb.extract(Path("/tmp/root"))        # same layout as `dpkg-deb -x`
+"""
+
+import io
+import shutil
+import subprocess
+import tarfile
+import threading
+from pathlib import Path
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+
+AR_MAGIC = b"!<arch>\n"
+AR_HEADER_SIZE = 60
+
+
+class DebError(Exception):
+    """Raised when a file is not a well-formed .deb archive."""
+
+
+class _Section(io.RawIOBase):
+    """Read-only window [offset, offset+size) over an open binary file."""
+
+    def __init__(self, fobj: IO[bytes], offset: int, size: int) -> None:
+        super().__init__()
+        self._f = fobj
+        self._pos = offset
+        self._end = offset + size
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:  # type: ignore[override]
+        n = min(len(b), self._end - self._pos)
+        if n <= 0:
+            return 0
+        self._f.seek(self._pos)
+        data = self._f.read(n)
+        b[: len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+
+def zstd_reader(raw: IO[bytes]) -> IO[bytes]:
+    """Wrap a zstd-compressed stream with a decompressor.
+    Prefers the stdlib (3.14+) or the `zstandard` module; falls back to `zstd -dc`.
+    """
+    try:
+        from compression import zstd  # type: ignore
+
+        return zstd.ZstdFile(raw)  # type: ignore[return-value]
+    except ImportError:
+        pass
+    try:
+        import zstandard  # type: ignore
+
+        return zstandard.ZstdDecompressor().stream_reader(raw)  # type: ignore[no-any-return]
+    except ImportError:
+        pass
+    if shutil.which("zstd") is None:
+        raise DebError("zstd-compressed member but neither zstandard nor zstd(1) is available")
+    proc = subprocess.Popen(["zstd", "-dc"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def _feed() -> None:
+        try:
+            shutil.copyfileobj(raw, proc.stdin)  # type: ignore[arg-type]
+        except (BrokenPipeError, OSError):
+            pass
+        finally:
+            try:
+                proc.stdin.close()  # type: ignore[union-attr]
+            except OSError:
+                pass
+
+    threading.Thread(target=_feed, daemon=True).start()
+    return proc.stdout  # type: ignore[return-value]
+
+
+def parse_control(text: str) -> Dict[str, str]:
+    """Parse a deb822 control paragraph into {Field: value}.
+    Continuation lines (leading space/tab) are kept verbatim, as `dpkg-deb -f` prints them.
+    """
+    fields: Dict[str, str] = {}
+    key: Optional[str] = None
+    for line in text.splitlines():
+        if not line.strip():
+            if fields:
+                break
+            continue
+        if line[0] in " \t" and key is not None:
+            fields[key] += "\n" + line
+            continue
+        if ":" not in line:
+            continue
+        k, v = line.split(":", 1)
+        key = k.strip()
+        fields[key] = v.strip()
+    return fields
+
+
+class DebFile:
+    """Lazy view over a .deb archive. Only the ar index is read on construction."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._members: List[Tuple[str, int, int]] = []
+        self._control: Optional[Dict[str, str]] = None
+        self._control_files: Optional[Dict[str, bytes]] = None
+        self._read_index()
+
+    # -- ar container -------------------------------------------------------
+    def _read_index(self) -> None:
+        try:
+            with self.path.open("rb") as f:
+                if f.read(len(AR_MAGIC)) != AR_MAGIC:
+                    raise DebError(f"{self.path}: not an ar archive")
+                offset = len(AR_MAGIC)
+                while True:
+                    f.seek(offset)
+                    hdr = f.read(AR_HEADER_SIZE)
+                    if not hdr:
+                        break
+                    if len(hdr) < AR_HEADER_SIZE or hdr[58:60] != b"`\n":
+                        raise DebError(f"{self.path}: truncated or corrupt ar header at {offset}")
+                    name = hdr[0:16].decode("ascii", errors="replace").strip().rstrip("/")
+                    try:
+                        size = int(hdr[48:58].decode("ascii").strip())
+                    except ValueError:
+                        raise DebError(f"{self.path}: bad member size at {offset}") from None
+                    data_off = offset + AR_HEADER_SIZE
+                    self._members.append((name, data_off, size))
+                    offset = data_off + size + (size & 1)
+                end = f.seek(0, io.SEEK_END)
+        except OSError as exc:
+            raise DebError(f"{self.path}: {exc}") from exc
+        if not self._members or self._members[0][0] != "debian-binary":
+            raise DebError(f"{self.path}: first member is not debian-binary")
+        name, off, size = self._members[-1]
+        if off + size > end:
+            raise DebError(f"{self.path}: truncated member {name}")
+
+    @property
+    def members(self) -> List[str]:
+        return [m[0] for m in self._members]
+
+    def _find(self, prefix: str) -> Tuple[str, int, int]:
+        for m in self._members:
+            if m[0] == prefix or m[0].startswith(prefix + "."):
+                return m
+        raise DebError(f"{self.path}: missing {prefix} member")
+
+    def _open_tar_stream(self, prefix: str, f: IO[bytes]) -> tarfile.TarFile:
+        name, off, size = self._find(prefix)
+        raw = io.BufferedReader(_Section(f, off, size), buffer_size=1 << 16)
+        if name.endswith(".zst"):
+            return tarfile.open(fileobj=zstd_reader(raw), mode="r|")
+        # gz / xz / bz2 / uncompressed are auto-detected by tarfile in stream mode
+        return tarfile.open(fileobj=raw, mode="r|*")
+
+    # -- control.tar --------------------------------------------------------
+    @property
+    def control_files(self) -> Dict[str, bytes]:
+        """All regular files from control.tar (control, md5sums, shlibs, ...)."""
+        if self._control_files is None:
+            files: Dict[str, bytes] = {}
+            try:
+                with self.path.open("rb") as f, self._open_tar_stream("control.tar", f) as tar:
+                    for info in tar:
+                        if not info.isfile():
+                            continue
+                        fobj = tar.extractfile(info)
+                        if fobj is not None:
+                            files[_normalize(info.name)] = fobj.read()
+            except Exception as exc:  # tarfile/lzma/zlib/zstd errors all mean a broken member
+                raise DebError(f"{self.path}: bad control.tar ({exc})") from exc
+            self._control_files = files
+        return self._control_files
+
+    @property
+    def control(self) -> Dict[str, str]:
+        if self._control is None:
+            raw = self.control_files.get("control")
+            if raw is None:
+                raise DebError(f"{self.path}: control.tar has no control file")
+            self._control = parse_control(raw.decode("utf-8", errors="replace"))
+        return self._control
+
+    def field(self, name: str) -> Optional[str]:
+        """Case-insensitive control field lookup, like `dpkg-deb -f`."""
+        lname = name.lower()
+        for k, v in self.control.items():
+            if k.lower() == lname:
+                return v
+        return None
+
+    @property
+    def package(self) -> Optional[str]:
+        return self.field("Package")
+
+    @property
+    def version(self) -> Optional[str]:
+        return self.field("Version")
+
+    @property
+    def architecture(self) -> Optional[str]:
+        return self.field("Architecture")
+
+    # -- data.tar -----------------------------------------------------------
+    def iter_data(self) -> Iterator[Tuple[tarfile.TarInfo, Optional[IO[bytes]]]]:
+        """Stream data.tar members in archive order.
+        Yields (TarInfo, file object or None). The file object is only valid until the
+        next iteration step; member names are normalised to not start with './'.
+        """
+        with self.path.open("rb") as f, self._open_tar_stream("data.tar", f) as tar:
+            for info in tar:
+                info.name = _normalize(info.name)
+                yield info, (tar.extractfile(info) if info.isfile() else None)
+
+    def extract(self, dest: Path) -> None:
+        """Extract data.tar into dest (equivalent of `dpkg-deb -x`)."""
+        dest.mkdir(parents=True, exist_ok=True)
+        try:
+            with self.path.open("rb") as f, self._open_tar_stream("data.tar", f) as tar:
+                if hasattr(tarfile, "tar_filter"):
+                    tar.extractall(str(dest), filter="tar")
+                else:  # pragma: no cover - Python < 3.8.17 without extraction filters
+                    tar.extractall(str(dest))
+        except DebError:
+            raise
+        except Exception as exc:
+            raise DebError(f"{self.path}: bad data.tar ({exc})") from exc
+
+
+def _normalize(name: str) -> str:
+    while name.startswith("./"):
+        name = name[2:]
+    return name.lstrip("/")
+
+
+def read_control(path: Path) -> Optional[Dict[str, str]]:
+    """Return control fields of a .deb, or None if it cannot be parsed."""
+    try:
+        return DebFile(path).control
+    except DebError:
+        return None
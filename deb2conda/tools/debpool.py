@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+In-memory index of a --deb-src pool directory.
+
+The directory is listed once. File-name lookups are dict hits. Glob patterns
+are resolved against a sorted name list: bisect on the pattern's literal prefix,
+then fnmatch only inside that range. Control data (Package/Version/Architecture)
+is read lazily, the first time a package-name lookup is made, and is persisted
+next to the pool in `.debpool.json`. Later runs only parse debs that are new or
+changed (by size/mtime).
+
+Usage:
+  pool = DebPool(Path("allDebs"))
+  pool.glob("libx11-6_*riscv64.deb")       # [Path(...)]
+  pool.select("libx11-6 (>= 2:1.8)")      # newest matching deb or None
+"""
+
+import bisect
+import fnmatch
+import json
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from debfile import DebError, DebFile
+
+INDEX_NAME = ".debpool.json"
+INDEX_VERSION = 1
+_WILDCARDS = re.compile(r"[*?\[]")
+
+
+# ---------------------------------------------------------------------------
+# Debian version comparison (same ordering as `dpkg --compare-versions`)
+# ---------------------------------------------------------------------------
+def _order(c: str) -> int:
+    if not c or c.isdigit():
+        return 0
+    if c.isalpha():
+        return ord(c)
+    if c == "~":
+        return -1
+    return ord(c) + 256
+
+
+def _verrevcmp(a: str, b: str) -> int:
+    i = j = 0
+    la, lb = len(a), len(b)
+    while i < la or j < lb:
+        first_diff = 0
+        while (i < la and not a[i].isdigit()) or (j < lb and not b[j].isdigit()):
+            ac = _order(a[i]) if i < la else 0
+            bc = _order(b[j]) if j < lb else 0
+            if ac != bc:
+                return ac - bc
+            i += 1
+            j += 1
+        while i < la and a[i] == "0":
+            i += 1
+        while j < lb and b[j] == "0":
+            j += 1
+        while i < la and a[i].isdigit() and j < lb and b[j].isdigit():
+            if not first_diff:
+                first_diff = ord(a[i]) - ord(b[j])
+            i += 1
+            j += 1
+        if i < la and a[i].isdigit():
+            return 1
+        if j < lb and b[j].isdigit():
+            return -1
+        if first_diff:
+            return first_diff
+    return 0
+
+
+def _split_version(v: str) -> Tuple[int, str, str]:
+    v = v.strip()
+    epoch = 0
+    if ":" in v:
+        e, v = v.split(":", 1)
+        epoch = int(e) if e.isdigit() else 0
+    rev = ""
+    if "-" in v:
+        v, rev = v.rsplit("-", 1)
+    return epoch, v, rev
+
+
+def compare_versions(a: str, b: str) -> int:
+    """Return <0, 0, >0 like `dpkg --compare-versions a lt/eq/gt b`."""
+    ea, ua, ra = _split_version(a)
+    eb, ub, rb = _split_version(b)
+    if ea != eb:
+        return ea - eb
+    return _verrevcmp(ua, ub) or _verrevcmp(ra, rb)
+
+
+_OPS = {
+    "<<": lambda c: c < 0,
+    "<=": lambda c: c <= 0,
+    "=": lambda c: c == 0,
+    ">=": lambda c: c >= 0,
+    ">>": lambda c: c > 0,
+}
+_RELATION = re.compile(r"^\s*([A-Za-z0-9][A-Za-z0-9+.\-]*)\s*(?:\((.*)\))?\s*$")
+_CONSTRAINT = re.compile(r"^\s*(<<|<=|>=|>>|=|<|>)\s*(\S+)\s*$")
+
+
+def parse_relation(spec: Any) -> Tuple[str, List[Tuple[str, str]]]:
+    """Parse 'name', 'name (>= 1.2)' or 'name (>= 1.2, << 2)'; also {name, version} mappings.
+    Returns (name, [(op, version), ...]). Bare '<'/'>' are read as '<<'/'>>'.
+    """
+    if isinstance(spec, dict):
+        name = str(spec.get("name") or spec.get("package") or "").strip()
+        raw = str(spec.get("version") or "").strip()
+    else:
+        m = _RELATION.match(str(spec))
+        if not m:
+            raise ValueError(f"bad deb package selector: {spec!r}")
+        name, raw = m.group(1), (m.group(2) or "").strip()
+    constraints: List[Tuple[str, str]] = []
+    for part in filter(None, (x.strip() for x in raw.split(","))):
+        cm = _CONSTRAINT.match(part)
+        if not cm:
+            raise ValueError(f"bad version constraint {part!r} in {spec!r}")
+        op = {"<": "<<", ">": ">>"}.get(cm.group(1), cm.group(1))
+        constraints.append((op, cm.group(2)))
+    if not name:
+        raise ValueError(f"bad deb package selector: {spec!r}")
+    return name, constraints
+
+
+def satisfies(version: str, constraints: List[Tuple[str, str]]) -> bool:
+    return all(_OPS[op](compare_versions(version, want)) for op, want in constraints)
+
+
+# ---------------------------------------------------------------------------
+# Pool index
+# ---------------------------------------------------------------------------
+class DebPool:
+    """Filename and control-field index over the .deb files directly inside root."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = Path(root)
+        self._names: Dict[str, Path] = {}
+        self._sorted: List[str] = []
+        self._stats: Dict[str, Tuple[int, int]] = {}
+        self._control: Optional[Dict[str, Dict[str, Any]]] = None
+        self._by_package: Dict[str, List[Tuple[str, str, Path]]] = {}
+        self._known: Optional[Dict[str, Dict[str, Any]]] = None  # control of debs unchanged since the last listing
+        self.refresh()
+
+    def refresh(self) -> Set[str]:
+        """Re-list the directory (e.g. after downloads). Returns the .deb names added, removed or changed.
+        Control data already loaded for unchanged debs is kept; the rest is re-read lazily.
+        """
+        names: Dict[str, Path] = {}
+        stats: Dict[str, Tuple[int, int]] = {}
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                names[entry.name] = Path(entry.path)
+                if entry.name.endswith(".deb"):
+                    st = entry.stat()
+                    stats[entry.name] = (st.st_size, st.st_mtime_ns)
+        changed = {n for n in stats.keys() | self._stats.keys() if stats.get(n) != self._stats.get(n)}
+        if self._control is not None:
+            self._known = {n: e for n, e in self._control.items() if n in stats and n not in changed}
+        self._names = names
+        self._sorted = sorted(names)
+        self._stats = stats
+        self._control = None
+        self._by_package = {}
+        return changed
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def get(self, name: str) -> Optional[Path]:
+        return self._names.get(name)
+
+    def glob(self, pattern: str) -> List[Path]:
+        """Same matches as root.glob(pattern) for patterns without a directory part."""
+        if "/" in pattern:
+            return sorted(p for p in self.root.glob(pattern) if p.is_file())
+        m = _WILDCARDS.search(pattern)
+        if m is None:
+            hit = self._names.get(pattern)
+            return [hit] if hit is not None else []
+        prefix = pattern[: m.start()]
+        lo = bisect.bisect_left(self._sorted, prefix)
+        out: List[Path] = []
+        for i in range(lo, len(self._sorted)):
+            name = self._sorted[i]
+            if not name.startswith(prefix):
+                break
+            if fnmatch.fnmatchcase(name, pattern):
+                out.append(self._names[name])
+        return out
+
+    # -- control-field index ------------------------------------------------
+    def _load_control(self) -> Dict[str, Dict[str, Any]]:
+        if self._control is not None:
+            return self._control
+        index_path = self.root / INDEX_NAME
+        old: Dict[str, Any] = self._known or {}
+        if self._known is None:
+            try:
+                data = json.loads(index_path.read_text(encoding="utf-8"))
+                if data.get("version") == INDEX_VERSION:
+                    old = data.get("debs", {}) or {}
+            except (OSError, ValueError):
+                pass
+        control: Dict[str, Dict[str, Any]] = {}
+        changed = set(old) != set(self._stats)
+        for name, (size, mtime_ns) in self._stats.items():
+            ent = old.get(name)
+            if ent and ent.get("size") == size and ent.get("mtime_ns") == mtime_ns:
+                control[name] = ent
+                continue
+            changed = True
+            try:
+                deb = DebFile(self._names[name])
+                ent = {
+                    "size": size,
+                    "mtime_ns": mtime_ns,
+                    "Package": deb.package or "",
+                    "Version": deb.version or "",
+                    "Architecture": deb.architecture or "",
+                }
+            except DebError:
+                ent = {"size": size, "mtime_ns": mtime_ns, "Package": "", "Version": "", "Architecture": ""}
+            control[name] = ent
+        if changed:
+            self._save(index_path, control)
+        by_package: Dict[str, List[Tuple[str, str, Path]]] = {}
+        for name, ent in control.items():
+            if ent.get("Package"):
+                by_package.setdefault(ent["Package"], []).append((ent["Version"], ent["Architecture"], self._names[name]))
+        self._control = control
+        self._by_package = by_package
+        return control
+
+    @staticmethod
+    def _save(index_path: Path, control: Dict[str, Dict[str, Any]]) -> None:
+        tmp = index_path.with_name(f"{index_path.name}.{os.getpid()}.tmp")
+        try:
+            tmp.write_text(json.dumps({"version": INDEX_VERSION, "debs": control}, sort_keys=True), encoding="utf-8")
+            os.replace(tmp, index_path)
+        except OSError:
+            # read-only pool: keep the index in memory only
+            tmp.unlink(missing_ok=True)
+
+    def control(self, name: str) -> Optional[Dict[str, Any]]:
+        """Package/Version/Architecture of a pool file by file name."""
+        return self._load_control().get(name)
+
+    def packages(self, package: str) -> List[Tuple[str, str, Path]]:
+        """All (version, architecture, path) entries of a Debian package name."""
+        self._load_control()
+        return list(self._by_package.get(package, []))
+
+    def select(self, spec: Any, archs: Optional[List[str]] = None) -> Optional[Path]:
+        """Newest deb of a package satisfying a relation like 'libx11-6 (>= 2:1.8)'."""
+        name, constraints = parse_relation(spec)
+        best: Optional[Tuple[str, Path]] = None
+        for version, arch, path in self.packages(name):
+            if archs and arch not in archs:
+                continue
+            if not satisfies(version, constraints):
+                continue
+            if best is None or compare_versions(version, best[0]) > 0:
+                best = (version, path)
+        return best[1] if best else None
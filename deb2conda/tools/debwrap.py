@@ -7,42 +7,61 @@ Generate conda-build recipes from Debian package manifest/rules.
 Usage:
   python tools/debwrap.py gen --manifest manifest.yaml --rules rules.yaml
 
-Outputs per package under workspace/recipes/<name>/:
+Outputs per package under workspace/recipes/<name>-<version>/ (indexed in workspace/index.json):
   - debs/           (put matching .deb files here)
   - recipes/
       - meta.yaml
       - build.sh
+      - install_plan.tsv   (python_core/python_ext: what build.sh copies where)
 """
 
+from __future__ import annotations
+
 import argparse
+import contextlib
+import hashlib
+import io
+import json
 import os
 import re
+import shlex
 import sys
 import shutil
 import subprocess
 import tempfile
+import traceback
 from pathlib import Path
-from typing import Any, Dict, List, Tuple, Optional
-from urllib.parse import urlparse
-import urllib.request
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Tuple, Optional
 import time
 
+from debcache import DebCache, parse_size, sha256_file
+from profiler import PROF
+
+if TYPE_CHECKING:
+    # imported where they are used, so light commands (query, plan) do not pay for them
+    from debpool import DebPool
+    from fetcher import FetchJob
+    from jinja2 import Environment
+    from ownership import OwnershipIndex
+
 try:
     import yaml  # type: ignore
 except Exception as exc:  # pragma: no cover
     print("[ERROR] Missing dependency pyyaml. pip install pyyaml", file=sys.stderr)
     raise
 
-try:
-    from jinja2 import Environment, FileSystemLoader  # type: ignore
-except Exception as exc:  # pragma: no cover
-    print("[ERROR] Missing dependency jinja2. pip install jinja2", file=sys.stderr)
-    raise
+# libyaml-backed loaders when PyYAML was built with it (same results, several times faster)
+_SAFE_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_BASE_LOADER = getattr(yaml, "CBaseLoader", yaml.BaseLoader)
 
 #假设脚本在 repo/tools/debwrap.py，则 REPO_ROOT = repo/。
 REPO_ROOT = Path(__file__).resolve().parents[1]
 TEMPLATES_DIR = REPO_ROOT / "templates"
 WORKSPACE_DIR = REPO_ROOT / "workspace" / "recipes"
+DEFAULT_CACHE_PATH = REPO_ROOT / "workspace" / "debcache.sqlite"
+INDEX_PATH = REPO_ROOT / "workspace" / "index.json"
+FETCH_LOCK_DIR = REPO_ROOT / "workspace" / ".locks"  # fetcher flock files, kept out of --deb-src
+INDEX_VERSION = 1
 
 #读取 YAML 并返回字典；or {} 保险空文件时不崩。 示例：manifest = read_yaml(Path("manifest.yaml"))
 def read_yaml(path: Path) -> Dict[str, Any]:
@@ -51,10 +70,10 @@ def read_yaml(path: Path) -> Dict[str, Any]:
     """
     try:
         with path.open("r", encoding="utf-8-sig") as f:
-            return yaml.safe_load(f) or {}
+            return yaml.load(f, Loader=_SAFE_LOADER) or {}
     except UnicodeDecodeError:
         with path.open("r", encoding="latin-1", errors="ignore") as f:
-            return yaml.safe_load(f) or {}
+            return yaml.load(f, Loader=_SAFE_LOADER) or {}
 
 #确保目录存在；示例：ensure_dir(Path("workspace/recipes")) 递归建目录，若已存在不报错
 def ensure_dir(path: Path) -> None:
@@ -124,17 +143,22 @@ def compute_run_deps(pkg: Dict[str, Any], rules: Dict[str, Any], auto_run_deps:
             result.append(s)
         return result
 
-    pkg_name = str(pkg.get("name", "")).strip()
+    pkg_name = _conda_name(pkg).strip()
 
     # Allow extras.needs to directly specify run deps
     extras = pkg.get("extras", {}) or {}
     needs = _clean(extras.get("needs", []) or [])
     run_deps.extend(needs)
 
+    # A pythons matrix variant is pinned to its Python (unless needs already names python)
+    if pkg.get("variant_of") and pkg.get("kind") == "python_ext" \
+            and not any(r.split()[0] == "python" for r in needs) and isinstance(extras.get("pyver"), str):
+        run_deps.append(f"python {extras['pyver']}.*")
+
     # If python_ext, consider python_site_requires overrides by package name
     if pkg.get("kind") == "python_ext":
         site_requires = rules.get("python_site_requires", {}) or {}
-        reqs = _clean(site_requires.get(pkg.get("name"), []) or [])
+        reqs = _clean(site_requires.get(pkg_name, []) or [])
         run_deps.extend(reqs)
 
     # Auto derived dependencies from DSO scanning (if provided)
@@ -189,17 +213,18 @@ def compute_test_cmds(pkg: Dict[str, Any], rules: Dict[str, Any]) -> List[str]:
     if isinstance(extra_cmds, list) and extra_cmds:
         cmds.extend([str(x) for x in extra_cmds])
 
-    # For plain libraries, verify key DSOs exist in $PREFIX/lib using map_run_deps inversion
+    # For plain libraries, verify key DSOs exist in $PREFIX/lib (provider index, else map_run_deps inversion)
     kind = pkg.get("kind", "")
     if kind in {"lib", "bin", "data"}:
-        map_run_deps: Dict[str, str] = rules.get("map_run_deps", {}) or {}
+        this_name = _conda_name(pkg)
         provides: List[str] = []
-        this_name = str(pkg.get("name"))
-        for dso, mapped in map_run_deps.items():
-            # value may include version constraints, only compare the package token
-            mapped_name = str(mapped).split()[0]
-            if mapped_name == this_name:
-                provides.append(dso)
+        if "_provides" in rules:
+            provides = list(rules["_provides"].get(this_name, []))
+        else:
+            for dso, mapped in (rules.get("map_run_deps", {}) or {}).items():
+                # value may include version constraints, only compare the package token
+                if str(mapped).split()[0] == this_name:
+                    provides.append(dso)
         for dso in provides:
             # Ensure the SONAME file exists after installation
             cmds.append(f"bash -c 'test -e \"$PREFIX/lib/{dso}\"'")
@@ -207,7 +232,7 @@ def compute_test_cmds(pkg: Dict[str, Any], rules: Dict[str, Any]) -> List[str]:
     # If 'bin' kind, allow package-specific smoke tests from rules.bin_tests
     if kind == "bin":
         bin_tests: Dict[str, List[str]] = rules.get("bin_tests", {}) or {}
-        for c in bin_tests.get(str(pkg.get("name")), []) or []:
+        for c in bin_tests.get(_conda_name(pkg), []) or []:
             cmds.append(str(c))
 
     # Fallback minimal test
@@ -227,12 +252,26 @@ def _extract_version_from_filename(path: Path) -> Optional[str]:
     return None
 
 
-def _extract_version_with_dpkg(deb_path: Path) -> Optional[str]:
+def _deb_control(deb_path: Path, cache: Optional[DebCache] = None) -> Dict[str, str]:
+    """Control fields of a deb, served from the metadata cache when possible."""
+    from debfile import DebFile
+    if cache is not None:
+        hit = cache.get(deb_path, "control")
+        if hit is not None:
+            return hit
+    control = DebFile(deb_path).control
+    if cache is not None:
+        cache.put(deb_path, "control", control)
+    return control
+
+
+def _extract_version_from_control(deb_path: Path, cache: Optional[DebCache] = None) -> Optional[str]:
+    """Read the Version field straight from control.tar (no dpkg-deb fork)."""
+    from debfile import DebError
     try:
-        proc = subprocess.run(["dpkg-deb", "-f", str(deb_path), "Version"], check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        v = proc.stdout.decode("utf-8", errors="ignore").strip()
+        v = str(_deb_control(deb_path, cache).get("Version") or "").strip()
         return v or None
-    except Exception:
+    except DebError:
         return None
 
 
@@ -249,7 +288,7 @@ def _sanitize_conda_version(raw: str) -> str:
     return v or "0"
 
 
-def compute_version(pkg: Dict[str, Any], copied_debs: Optional[List[Path]] = None) -> str:
+def compute_version(pkg: Dict[str, Any], copied_debs: Optional[List[Path]] = None, cache: Optional[DebCache] = None) -> str:
     # 1) explicit override (package-level takes precedence)
     direct = pkg.get("version")
     if isinstance(direct, str) and direct.strip():
@@ -266,20 +305,67 @@ def compute_version(pkg: Dict[str, Any], copied_debs: Optional[List[Path]] = Non
             # move preferred debs to front if filename contains the key
             ordered.sort(key=lambda p: (preferred_key not in p.name, p.name))
         for p in ordered:
-            v = _extract_version_with_dpkg(p) or _extract_version_from_filename(p)
+            v = _extract_version_from_control(p, cache) or _extract_version_from_filename(p)
             if v:
                 return _sanitize_conda_version(v)
 
     # 3) fallback
     return "0"
 
+#作用：包级 Python 版本/ABI：extras {pyver, pyabi} 覆盖全局值。
+#示例：extras: { pyver: "3.9", pyabi: "39" } → ("3.9", "39")
+def _effective_python(pkg: Dict[str, Any], pyver: str, pyabi: str) -> Tuple[str, str]:
+    pkg_extras = pkg.get("extras", {}) or {}
+    eff_pyver = str(pkg_extras.get("pyver")).strip() if isinstance(pkg_extras.get("pyver"), str) and pkg_extras.get("pyver").strip() else pyver
+    eff_pyabi = str(pkg_extras.get("pyabi")).strip() if isinstance(pkg_extras.get("pyabi"), str) and pkg_extras.get("pyabi").strip() else pyabi
+    return eff_pyver, eff_pyabi
+
+#作用：python_ext 条目的 pythons 矩阵：每个 Python 版本展开为一个变体条目。变体名为 <name>-py<abi>
+#（工作区目录、index.json 与 build/query 都以它为键），conda 包名仍是 <name>（记在 variant_of），
+#pyver/pyabi 写入变体的 extras。没有 pythons 时原样返回 [pkg]。
+#示例：{name: numpy, pythons: ["3.11", {pyver: "3.9", pyabi: "39"}]} → numpy-py311、numpy-py39
+def _python_variants(pkg: Dict[str, Any], quiet: bool = False) -> List[Dict[str, Any]]:
+    pythons = pkg.get("pythons")
+    if not pythons:
+        return [pkg]
+    name = pkg["name"]
+    if pkg.get("kind") != "python_ext" or not isinstance(pythons, list):
+        if not quiet:
+            print(f"[WARN] {name}: pythons must be a list on a python_ext entry; ignored")
+        return [{k: v for k, v in pkg.items() if k != "pythons"}]
+    variants: List[Dict[str, Any]] = []
+    for item in pythons:
+        if isinstance(item, dict):
+            ver, abi = str(item.get("pyver", "")).strip(), str(item.get("pyabi", "")).strip()
+        elif isinstance(item, str):
+            ver, abi = item.strip(), ""
+        else:
+            # an unquoted 3.10 is the float 3.1
+            ver, abi = "", ""
+        if not re.fullmatch(r"\d+\.\d+", ver):
+            if not quiet:
+                print(f"[WARN] {name}: bad pythons entry {item!r} (use a quoted \"3.11\" or {{pyver, pyabi}})")
+            continue
+        abi = abi or ver.replace(".", "")
+        extras = dict(pkg.get("extras", {}) or {})
+        extras.update(pyver=ver, pyabi=abi)
+        variant = {k: v for k, v in pkg.items() if k != "pythons"}
+        variant.update(name=f"{name}-py{abi}", variant_of=name, extras=extras)
+        variants.append(variant)
+    return variants
+
+
+def _conda_name(pkg: Dict[str, Any]) -> str:
+    """conda package name of a manifest entry (a pythons variant keeps the name of its entry)."""
+    return str(pkg.get("variant_of") or pkg.get("name", ""))
+
 #整理模板上下文（名字、版本、依赖、测试命令、Python 版本/ABI 等）；
 
 #用 templates/meta.yaml.j2 与 templates/build.sh.j2 渲染；
 
 #写到 <out_dir>/meta.yaml 与 build.sh，并给 build.sh 加可执行权限。
 def render_templates(pkg: Dict[str, Any], rules: Dict[str, Any], pyver: str, pyabi: str, env: Environment, out_dir: Path) -> None:
-    name = pkg["name"]
+    name = _conda_name(pkg)
     version = pkg.get("_resolved_version") or compute_version(pkg)
     build_number = int(pkg.get("build_number", 0))
     kind = pkg.get("kind", "lib")
@@ -288,10 +374,7 @@ def render_templates(pkg: Dict[str, Any], rules: Dict[str, Any], pyver: str, pya
     test_cmds = compute_test_cmds(pkg, rules)
 
     summary = f"Wrapped from Debian packages: {', '.join(pkg.get('debs', []) or [])}"
-    # Allow per-package override of python version/abi via extras {pyver, pyabi}
-    pkg_extras = pkg.get("extras", {}) or {}
-    eff_pyver = str(pkg_extras.get("pyver")).strip() if isinstance(pkg_extras.get("pyver"), str) and pkg_extras.get("pyver").strip() else pyver
-    eff_pyabi = str(pkg_extras.get("pyabi")).strip() if isinstance(pkg_extras.get("pyabi"), str) and pkg_extras.get("pyabi").strip() else pyabi
+    eff_pyver, eff_pyabi = _effective_python(pkg, pyver, pyabi)
     context: Dict[str, Any] = {
         "name": name,
         "version": version,
@@ -304,6 +387,8 @@ def render_templates(pkg: Dict[str, Any], rules: Dict[str, Any], pyver: str, pya
         "extras": pkg.get("extras", {}) or {},
         "pyver": eff_pyver,
         "pyabi": eff_pyabi,
+        # pythons variants share the package name: the build string tells them apart
+        "py_tag": f"py{eff_pyabi}" if pkg.get("variant_of") else "",
         "map_run_deps": rules.get("map_run_deps", {}) or {},
     }
 
@@ -322,142 +407,392 @@ def render_templates(pkg: Dict[str, Any], rules: Dict[str, Any], pyver: str, pya
     build_path.write_text(build_out, encoding="utf-8")
     os.chmod(build_path, 0o755)
 
+    # install_plan.tsv / exclude.txt: the copy and cleanup steps of build.sh, evaluated by gen (see _package_layout)
+    if "_install_plan" in pkg:
+        from installplan import PLAN_FILE, write_plan
+        write_plan(out_dir / PLAN_FILE, pkg["_install_plan"], name)
+    if "_exclude" in pkg:
+        from ownership import write_exclude
+        write_exclude(out_dir, pkg["_exclude"])
+
 #作用：
 #读取配置；创建 Jinja 环境；遍历 packages；
 #为每个包创建 debs/ 和 recipes/ 目录；
 #调用 render_templates() 生成文件；
 #打印结果。
 #示例：对于 name: opencv-python，会创建
-def _copy_matching_debs(deb_src: Path, patterns: List[str], dest_dir: Path) -> int:
-    """Copy .deb files from deb_src matching any of patterns into dest_dir.
-    Returns number of files copied.
+# Linux FICLONE ioctl: share extents with the source (btrfs, xfs, bcachefs); no data copied
+_FICLONE = 0x40049409
+STAGE_MODES = ("auto", "reflink", "hardlink", "symlink", "copy")
+
+
+def _reflink(src: Path, dst: Path) -> None:
+    import fcntl
+
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            dst.unlink(missing_ok=True)
+            raise
+    shutil.copystat(src, dst)
+
+
+def _stage_file(src: Path, dst: Path, mode: str = "auto") -> str:
+    """Place src at dst without duplicating data when possible.
+    auto tries reflink -> hardlink -> symlink -> copy; other modes use only that method
+    (copy is still the last resort if it fails). Returns the method used, or "same" when
+    dst already is src.
     """
-    copied = 0
+    if dst.exists() or dst.is_symlink():
+        try:
+            if os.path.samefile(src, dst):
+                # hardlink/symlink from a previous run; a reflink or copy is a different inode
+                return "same"
+        except OSError:
+            pass
+        dst.unlink()
+    order = ["reflink", "hardlink", "symlink"] if mode == "auto" else ([] if mode == "copy" else [mode])
+    for method in order:
+        try:
+            if method == "reflink":
+                _reflink(src, dst)
+            elif method == "hardlink":
+                os.link(src, dst)
+            elif method == "symlink":
+                os.symlink(src.resolve(), dst)
+            return method
+        except OSError:
+            continue
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+# 每个进程对每个 --deb-src 只建一次索引（fork 出的 worker 直接继承父进程的索引）
+_POOLS: Dict[str, DebPool] = {}
+
+
+def _get_pool(deb_src: Path) -> DebPool:
+    from debpool import DebPool
+    key = str(deb_src)
+    if key not in _POOLS:
+        _POOLS[key] = DebPool(deb_src)
+    return _POOLS[key]
+
+
+def _match_debs(deb_src: Path, patterns: List[str], selectors: Optional[List[Any]] = None,
+                quiet: bool = False) -> List[Path]:
+    """Resolve filename patterns and package selectors against the pool; unique by file name."""
+    pool = _get_pool(deb_src)
+    matches: List[Path] = []
     for pat in patterns:
-        # Use Path.glob relative to deb_src
-        for match in deb_src.glob(pat):
-            if match.is_file():
-                target = dest_dir / match.name
-                shutil.copy2(match, target)
-                print(f"[COPY] {match} -> {target}")
-                copied += 1
-    if copied == 0:
-        pats = ", ".join(patterns) if patterns else "<none>"
-        print(f"[WARN] No .deb matched in {deb_src} for patterns: {pats}")
-    return copied
+        matches.extend(pool.glob(pat))
+    for spec in selectors or []:
+        try:
+            hit = pool.select(spec)
+        except ValueError as exc:
+            if not quiet:
+                print(f"[WARN] {exc}")
+            continue
+        if hit is None:
+            if not quiet:
+                print(f"[WARN] No .deb in {deb_src} satisfies {spec}")
+        else:
+            matches.append(hit)
+    unique: Dict[str, Path] = {}
+    for m in matches:
+        unique.setdefault(m.name, m)
+    return list(unique.values())
+
+
 def _is_valid_deb(path: Path) -> bool:
-    """Best-effort validation for a .deb file by asking dpkg-deb for metadata.
-    Returns True when dpkg-deb can parse fields; otherwise False.
+    """Best-effort validation for a .deb file by parsing its ar index and control fields in-process.
+    Returns True when the control file carries a Package field; otherwise False.
     """
+    from debfile import DebError, DebFile
     if not path.exists() or not path.is_file():
         return False
     try:
-        proc = subprocess.run(["dpkg-deb", "-f", str(path), "Package"], check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return proc.returncode == 0 and proc.stdout.decode("utf-8", errors="ignore").strip() != ""
-    except Exception:
+        return bool((DebFile(path).package or "").strip())
+    except DebError:
         return False
 
 
-def _download_with_retries(url: str, dest: Path, tries: int = 4, backoff_s: float = 1.5) -> bool:
-    """Download url -> dest with retry and exponential backoff. Returns True on success."""
-    dest.parent.mkdir(parents=True, exist_ok=True)
-    for attempt in range(1, max(1, tries) + 1):
-        try:
-            with urllib.request.urlopen(url, timeout=60) as resp, open(dest, "wb") as out:
-                shutil.copyfileobj(resp, out)
-            if _is_valid_deb(dest):
-                print(f"[FETCH] ok {url} -> {dest}")
-                return True
-            else:
-                print(f"[FETCH] invalid deb after download, removing: {dest}")
-                dest.unlink(missing_ok=True)
-        except Exception as exc:  # pragma: no cover
-            print(f"[FETCH] attempt {attempt} failed: {url} ({exc})")
-        if attempt < tries:
-            time.sleep(backoff_s * attempt)
-    return False
+def _fetch_jobs_for_pkg(pkg: Dict[str, Any], deb_src: Path) -> List[FetchJob]:
+    """Build download jobs from pkg["urls"] (or extras.urls).
+    Entries are plain URLs or mappings {url: ..., sha256: ...}; URLs that share a file name
+    are treated as mirrors of the same file and become one job.
+    """
+    from urllib.parse import urlparse
+
+    from fetcher import FetchJob
+    raw_urls = pkg.get("urls") or (pkg.get("extras", {}) or {}).get("urls")
+    if not isinstance(raw_urls, list):
+        return []
+    jobs: Dict[str, FetchJob] = {}
+    for entry in raw_urls:
+        if isinstance(entry, dict):
+            url = str(entry.get("url") or "").strip()
+            pin = str(entry.get("sha256") or "").strip().lower() or None
+        else:
+            url, pin = str(entry).strip(), None
+        if not url:
+            continue
+        # allow "sha256:<hex>" as well as bare hex
+        if pin and pin.startswith("sha256:"):
+            pin = pin[len("sha256:"):]
+        name = os.path.basename(urlparse(url).path) or f"file_{int(time.time())}.deb"
+        job = jobs.get(name)
+        if job is None:
+            jobs[name] = FetchJob(deb_src / name, [url], pin)
+        else:
+            job.urls.append(url)
+            if pin and not job.sha256:
+                jobs[name] = job._replace(sha256=pin)
+    return list(jobs.values())
 
 
-def _attempt_fetch_debs_from_urls(pkg: Dict[str, Any], deb_src: Path, tries: int = 4) -> int:
+def _attempt_fetch_debs_from_urls(pkg: Dict[str, Any], deb_src: Path, tries: int = 4, workers: int = 4) -> int:
     """Try to fetch deb files declared in pkg["urls"] (or extras.urls) into deb_src.
     Returns number of new files successfully fetched.
     """
-    urls: List[str] = []
-    raw_urls = pkg.get("urls") or (pkg.get("extras", {}) or {}).get("urls")
-    if isinstance(raw_urls, list):
-        urls = [str(u) for u in raw_urls]
-    if not urls:
-        return 0
+    return _fetch_debs(_fetch_jobs_for_pkg(pkg, deb_src), tries=tries, workers=workers)
 
-    fetched = 0
-    for u in urls:
-        try:
-            parsed = urlparse(u)
-            name = os.path.basename(parsed.path) or f"file_{int(time.time())}.deb"
-            dest = deb_src / name
-            if dest.exists() and _is_valid_deb(dest):
-                print(f"[FETCH] skip existing valid {dest}")
-                continue
-            if _download_with_retries(u, dest, tries=tries):
-                fetched += 1
-        except Exception:
-            # continue to next url
-            pass
-    return fetched
 
+def _fetch_debs(jobs: List[FetchJob], tries: int = 4, workers: int = 4) -> int:
+    """Download jobs on a bounded pool; already-present valid files are skipped, not counted."""
+    from fetcher import fetch_all
+    todo: List[FetchJob] = []
+    for job in jobs:
+        if job.dest.exists() and (_is_valid_deb(job.dest) if not job.sha256 else sha256_file(job.dest) == job.sha256):
+            print(f"[FETCH] skip existing valid {job.dest}")
+            continue
+        todo.append(job)
+    if not todo:
+        return 0
+    results = fetch_all(todo, workers=workers, tries=tries, validate=_is_valid_deb, skip_existing=False,
+                        lock_dir=FETCH_LOCK_DIR)
+    return sum(1 for ok in results.values() if ok)
 
 
-def _scan_dsos_and_map_run_deps(extracted_root: Path, rules: Dict[str, Any]) -> List[str]:
-    """Scan ELF files under extracted_root and map NEEDED DSOs to run deps via rules.map_run_deps.
-    We check files in common library and binary locations and parse `readelf -d` output
-    to collect NEEDED entries (e.g. libopenblas.so.0), then map with rules.
+#作用：在逐包处理之前，把所有“在 --deb-src 中找不到匹配 .deb”的包的 urls 一次性并发下载。
+def _prefetch_missing_debs(pkgs: List[Dict[str, Any]], deb_src: Path, workers: int = 4, tries: int = 4) -> None:
+    pool = _get_pool(deb_src)
+    jobs: Dict[Path, FetchJob] = {}
+    for pkg in pkgs:
+        if not _fetch_jobs_for_pkg(pkg, deb_src):
+            continue
+        patterns = [str(x) for x in (pkg.get("debs", []) or [])]
+        if any(pool.glob(pat) for pat in patterns):
+            continue
+        for job in _fetch_jobs_for_pkg(pkg, deb_src):
+            jobs.setdefault(job.dest, job)
+    if jobs:
+        print(f"[FETCH] prefetching {len(jobs)} file(s) with {workers} worker(s)")
+        if _fetch_debs(list(jobs.values()), tries=tries, workers=workers):
+            pool.refresh()
+
+
+def _scan_elf_tree(extracted_root: Path) -> Dict[str, Dict[str, Any]]:
+    """Read the dynamic section of every ELF file under the lib/bin locations of extracted_root.
+    Returns {relative path: {needed, soname, rpath, runpath}} sorted by path.
+    Non-ELF files (Python sources, headers, data) are rejected after reading the 4-byte magic.
     """
-    dso_to_pkg: Dict[str, str] = rules.get("map_run_deps", {}) or {}
-    found: List[str] = []
-    seen = set()
-
+    from elfdyn import read_dynamic
+    result: Dict[str, Dict[str, Any]] = {}
     candidate_dirs = [
         extracted_root / "usr" / "lib",
         extracted_root / "usr" / "bin",
         extracted_root / "lib",
         extracted_root / "bin",
     ]
-
     for base in candidate_dirs:
         if not base.exists():
             continue
         for p in base.rglob("*"):
-            if not p.is_file():
+            # symlinks may point outside the extracted tree; their targets are scanned directly
+            if p.is_symlink() or not p.is_file():
                 continue
-            try:
-                proc = subprocess.run(["readelf", "-d", str(p)], check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                text = proc.stdout.decode("utf-8", errors="ignore")
-                if not text:
-                    continue
-            except Exception:
+            info = read_dynamic(p)
+            if info is None:
                 continue
-            for line in text.splitlines():
-                if "NEEDED" in line and "Shared library" in line:
-                    # example: 0x0000000000000001 (NEEDED)             Shared library: [libopenblas.so.0]
-                    m = re.search(r"Shared library:\s*\[(.+?)\]", line)
-                    if not m:
-                        continue
-                    soname = m.group(1).strip()
-                    mapped = dso_to_pkg.get(soname)
-                    if mapped and mapped not in seen:
-                        found.append(mapped)
-                        seen.add(mapped)
+            result[p.relative_to(extracted_root).as_posix()] = info._asdict()
+    return dict(sorted(result.items()))
+
+
+def _map_run_deps_from_elf(elf_index: Dict[str, Dict[str, Any]], rules: Dict[str, Any]) -> List[str]:
+    """Map the NEEDED entries of scanned ELF files to run deps (first-seen order), through the provider
+    index of _prepare_providers when present, else rules.map_run_deps alone.
+    """
+    dso_to_pkg: Dict[str, str] = rules.get("_providers") or rules.get("map_run_deps", {}) or {}
+    found: List[str] = []
+    seen = set()
+    for info in elf_index.values():
+        for soname in info.get("needed", []) or []:
+            mapped = dso_to_pkg.get(soname)
+            if mapped and mapped not in seen:
+                found.append(mapped)
+                seen.add(mapped)
     return found
 
 
-def cmd_gen(manifest_path: Path, rules_path: Path, deb_src: Optional[Path] = None, enable_dso_scan: bool = True) -> None:
-    manifest = read_yaml(manifest_path)
-    rules = read_yaml(rules_path)
+def _scan_dsos_and_map_run_deps(extracted_root: Path, rules: Dict[str, Any]) -> List[str]:
+    """Scan ELF files under extracted_root and map NEEDED DSOs to run deps via rules.map_run_deps.
+    We check files in common library and binary locations and read their dynamic section
+    in-process (see elfdyn.py) to collect NEEDED entries (e.g. libopenblas.so.0), then map with rules.
+    """
+    return _map_run_deps_from_elf(_scan_elf_tree(extracted_root), rules)
+
+
+# DSO 扫描只关心这些前缀下的文件（与 _scan_elf_tree 的 candidate_dirs 一致）
+_ELF_SCAN_PREFIXES = ("usr/lib/", "usr/bin/", "lib/", "bin/")
 
-    pyver, pyabi = detect_python_version_from_manifest(manifest)
 
+def _stream_deb_scan(deb_path: Path) -> Tuple[List[List[str]], Dict[str, Dict[str, Any]]]:
+    """One pass over data.tar: the member list (see installplan.member_row) and the same ELF index as
+    extracting the deb and running _scan_elf_tree, without touching disk. For ELF members only the
+    magic, program headers, dynamic segment and string table are read.
+    """
+    from debfile import DebFile
+    from elfdyn import read_dynamic_stream
+    from installplan import member_row
+    members: List[List[str]] = []
+    result: Dict[str, Dict[str, Any]] = {}
+    for info, fobj in DebFile(deb_path).iter_data():
+        row = member_row(info)
+        if row is not None:
+            members.append(row)
+        if not info.name.startswith(_ELF_SCAN_PREFIXES):
+            continue
+        if info.islnk():
+            # hard link: same content as an earlier member
+            target = info.linkname
+            while target.startswith("./"):
+                target = target[2:]
+            if target.lstrip("/") in result:
+                result[info.name] = result[target.lstrip("/")]
+            continue
+        if fobj is None:
+            continue
+        dyn = read_dynamic_stream(fobj)
+        if dyn is not None:
+            result[info.name] = dyn._asdict()
+    return members, dict(sorted(result.items()))
+
+
+def _stream_elf_index(deb_path: Path) -> Dict[str, Dict[str, Any]]:
+    """ELF index of a deb from a streamed data.tar (see _stream_deb_scan)."""
+    return _stream_deb_scan(deb_path)[1]
+
+
+def _deb_elf_index(deb_path: Path, cache: Optional[DebCache] = None, scan_mode: str = "stream") -> Dict[str, Dict[str, Any]]:
+    """ELF dynamic info of one deb's lib/bin members; reads the deb only on a cache miss.
+    scan_mode "stream" reads data.tar in memory; "extract" unpacks to a temp dir first.
+    """
+    from debfile import DebFile
+    if cache is not None:
+        hit = cache.get(deb_path, "elf")
+        if hit is not None:
+            return hit
+    if scan_mode == "extract":
+        with tempfile.TemporaryDirectory() as tmpd:
+            tmp_root = Path(tmpd)
+            DebFile(deb_path).extract(tmp_root)
+            index = _scan_elf_tree(tmp_root)
+    else:
+        members, index = _stream_deb_scan(deb_path)
+        if cache is not None:
+            cache.put(deb_path, "members", members)
+    if cache is not None:
+        cache.put(deb_path, "elf", index)
+    return index
+
+
+def _deb_members(deb_path: Path, cache: Optional[DebCache] = None) -> List[List[str]]:
+    """data.tar member list of one deb (path, type, link target); reads the deb only on a cache miss.
+    The same pass fills the ELF index, so a later DSO scan of this deb is a cache hit.
+    """
+    if cache is not None:
+        hit = cache.get(deb_path, "members")
+        if hit is not None:
+            return hit
+    members, index = _stream_deb_scan(deb_path)
+    if cache is not None:
+        cache.put(deb_path, "members", members)
+        cache.put(deb_path, "elf", index)
+    return members
+
+
+class _Layout(NamedTuple):
+    """What a package's build.sh installs, worked out from its debs' member lists."""
+    paths: Dict[str, str]  # $PREFIX-relative path -> "f" | "l", after exclusion
+    exclude: List[str]  # foreign SONAMEs dropped from paths (recipes/exclude.txt)
+    plan: Optional[List[Tuple[str, str, str]]]  # install_plan.tsv entries (build.sh.j2 kinds)
+    warnings: List[str]
+
+
+def _package_layout(pkg: Dict[str, Any], member_lists: List[List[List[str]]], rules: Dict[str, Any],
+                    pyver: str, pyabi: str) -> _Layout:
+    """member_lists must be in the order build.sh extracts the debs (sorted by file name)."""
+    from installplan import install_plan, merge_members
+    from ownership import foreign_sonames, prefix_paths
+    kind = pkg.get("kind", "lib")
+    members = merge_members(member_lists)
+    plan: Optional[List[Tuple[str, str, str]]] = None
+    warnings: List[str] = []
+    eff_pyver, eff_pyabi = _effective_python(pkg, pyver, pyabi)
+    name = _conda_name(pkg)
+    if kind not in {"lib", "bin", "data"}:
+        # a pythons variant carries only the extension modules of its own ABI
+        plan, warnings = install_plan(kind, eff_pyver, eff_pyabi, members, abi_only=bool(pkg.get("variant_of")))
+    paths = prefix_paths(kind, name, members, plan, eff_pyver, pkg.get("extras", {}) or {})
+    exclude = foreign_sonames(paths, name, rules.get("map_run_deps", {}) or {})
+    for p in exclude:
+        del paths[p]
+    return _Layout(paths, exclude, plan, warnings)
+
+
+def _sorted_debs(sources: List[Path]) -> List[Path]:
+    # build.sh extracts "$DEB_DIR"/*.deb in glob order; later debs overwrite earlier ones
+    return sorted(sources, key=lambda p: p.name)
+
+
+class GenOptions(NamedTuple):
+    """Per-run settings shared by every package of a gen run (picklable for the process pool)."""
+    deb_src: Optional[Path] = None
+    enable_dso_scan: bool = True
+    cache_path: Optional[Path] = None
+    scan_mode: str = "stream"
+    stage_mode: str = "auto"
+    profile: bool = False
+
+
+# 每个进程各自打开一次缓存连接（sqlite 连接不能跨 fork 复用）
+_CACHES: Dict[Tuple[int, str], DebCache] = {}
+
+
+def _open_cache(cache_path: Optional[Path]) -> Optional[DebCache]:
+    if cache_path is None:
+        return None
+    key = (os.getpid(), str(cache_path))
+    if key not in _CACHES:
+        try:
+            _CACHES[key] = DebCache(cache_path)
+        except Exception as exc:
+            print(f"[WARN] metadata cache unavailable ({cache_path}): {exc}")
+            return None
+    return _CACHES[key]
+
+
+def _make_jinja_env() -> Environment:
+    try:
+        from jinja2 import Environment, FileSystemLoader  # type: ignore
+    except Exception:  # pragma: no cover
+        print("[ERROR] Missing dependency jinja2. pip install jinja2", file=sys.stderr)
+        raise
     # Use custom comment delimiters to avoid accidental parsing issues in shell scripts
-    env = Environment(
+    return Environment(
         loader=FileSystemLoader(str(TEMPLATES_DIR)),
         autoescape=False,
         trim_blocks=True,
@@ -466,123 +801,1360 @@ def cmd_gen(manifest_path: Path, rules_path: Path, deb_src: Optional[Path] = Non
         comment_end_string="~##",
     )
 
-    pkgs: List[Dict[str, Any]] = manifest.get("packages", []) or []
-    if not pkgs:
-        print("[WARN] No packages found in manifest.")
 
-    for pkg in pkgs:
-        name = pkg.get("name")
-        if not name:
-            print("[WARN] Skip entry without name")
-            continue
+#作用：定位包的源 .deb（--deb-src 池中匹配，缺失时按 urls 下载；未给 --deb-src 时沿用已发布目录中的 debs/）。
+#缺少 .deb 时 raise SystemExit(2)。
+def _locate_debs(pkg: Dict[str, Any], opts: GenOptions) -> List[Path]:
+    name = pkg["name"]
+    deb_src = opts.deb_src
+    if deb_src is None:
+        prev = _published_dir(name)
+        debs_dir = (prev or WORKSPACE_DIR / name) / "debs"
+        return sorted(debs_dir.glob("*.deb")) if debs_dir.is_dir() else []
+    if not deb_src.exists() or not deb_src.is_dir():
+        print(f"[ERROR] --deb-src path not a directory: {deb_src}")
+        return []
+    patterns: List[str] = [str(x) for x in (pkg.get("debs", []) or [])]
+    selectors: List[Any] = list(pkg.get("deb_packages", []) or [])
+    matches = _match_debs(deb_src, patterns, selectors)
+    if not matches:
+        pats = ", ".join([*patterns, *(str(x) for x in selectors)]) or "<none>"
+        print(f"[WARN] No .deb matched in {deb_src} for patterns: {pats}")
+        # 每个 url 最多拉取四次（失败时按 Range 续传），多个镜像依次尝试
+        with PROF.span("fetch", name):
+            fetched = _attempt_fetch_debs_from_urls(pkg, deb_src, tries=4)
+        if fetched > 0:
+            _get_pool(deb_src).refresh()
+            matches = _match_debs(deb_src, patterns, selectors)
+    # If still none, and we expected something, fail fast to surface missing resource
+    if not matches and (patterns or selectors):
+        print(f"[ERROR] Missing .deb for package {name}; attempted fetch from urls and failed.")
+        raise SystemExit(2)
+    return sorted(matches, key=lambda p: p.name)
+
+
+#作用：按版本决定发布目录名（manifest.version > extras.version > 从 deb 解析的版本 > 无后缀）。
+def _package_dir_name(pkg: Dict[str, Any]) -> str:
+    name = pkg["name"]
+    for v in (pkg.get("version"), (pkg.get("extras", {}) or {}).get("version"), pkg.get("_resolved_version")):
+        if isinstance(v, str) and v.strip():
+            return f"{name}-{_sanitize_conda_version(v)}"
+    return name
 
-        # Start with non-versioned directory; we may rename to a versioned directory later
-        base_dir = WORKSPACE_DIR / name
-        debs_dir = base_dir / "debs"
-        recipes_dir = base_dir / "recipes"
-        ensure_dir(debs_dir)
-        ensure_dir(recipes_dir)
-
-        # Optionally copy .deb files from a source directory into per-package debs/.
-        # If not found, try to fetch from pkg.urls (or extras.urls) into deb_src with retries, then copy again.
-        if deb_src is not None:
-            if not deb_src.exists() or not deb_src.is_dir():
-                print(f"[ERROR] --deb-src path not a directory: {deb_src}")
-            else:
-                patterns: List[str] = [str(x) for x in (pkg.get("debs", []) or [])]
-                copied = _copy_matching_debs(deb_src, patterns, debs_dir)
-                if copied == 0:
-                    fetched = _attempt_fetch_debs_from_urls(pkg, deb_src, tries=4)
-                    if fetched > 0:
-                        copied = _copy_matching_debs(deb_src, patterns, debs_dir)
-                # If still none, and we expected something, fail fast to surface missing resource
-                if copied == 0 and patterns:
-                    # Try a second fetch round to increase resilience, as要求: 至少拉取四次
-                    fetched = _attempt_fetch_debs_from_urls(pkg, deb_src, tries=4)
-                    if fetched > 0:
-                        copied = _copy_matching_debs(deb_src, patterns, debs_dir)
-                if copied == 0 and patterns:
-                    print(f"[ERROR] Missing .deb for package {name}; attempted fetch from urls and failed.")
-                    raise SystemExit(2)
-
-        # Optional: extract debs to a temp dir to scan DSOs for auto deps
-        if enable_dso_scan and debs_dir.exists():
-            with tempfile.TemporaryDirectory() as tmpd:
-                tmp_root = Path(tmpd)
-                # extract all .deb under debs_dir
-                deb_files = list(debs_dir.glob("*.deb"))
-                # resolve version from deb metadata if not provided
-                try:
-                    version = compute_version(pkg, deb_files)
-                    if version and not pkg.get("_resolved_version"):
-                        pkg["_resolved_version"] = version
-                except Exception:
-                    pass
-                for f in deb_files:
+
+STAGING_DIR = REPO_ROOT / "workspace" / ".staging"
+_KEEP_ON_PUBLISH = (".build_sig",)  # build bookkeeping that gen does not produce
+_RENAMEAT2: Any = None
+
+
+def _exchange_dirs(a: Path, b: Path) -> bool:
+    """Atomically swap two paths (Linux renameat2 RENAME_EXCHANGE). False when unsupported."""
+    global _RENAMEAT2
+    if _RENAMEAT2 is None:
+        _RENAMEAT2 = False
+        if sys.platform.startswith("linux"):
+            try:
+                import ctypes
+
+                libc = ctypes.CDLL(None, use_errno=True)
+                fn = libc.renameat2
+                fn.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+                _RENAMEAT2 = fn
+            except (OSError, AttributeError):
+                pass
+    if not _RENAMEAT2:
+        return False
+    at_fdcwd, rename_exchange = -100, 2
+    return _RENAMEAT2(at_fdcwd, os.fsencode(a), at_fdcwd, os.fsencode(b), rename_exchange) == 0
+
+
+def _publish_dir(staging: Path, target: Path) -> None:
+    """Make a fully written staging dir visible as target with a single rename.
+    An existing target is swapped out atomically where the kernel supports it, then removed.
+    """
+    if not target.exists():
+        ensure_dir(target.parent)
+        os.replace(staging, target)
+        return
+    for keep in _KEEP_ON_PUBLISH:
+        if (target / keep).is_file() and not (staging / keep).exists():
+            shutil.copy2(target / keep, staging / keep)
+    if _exchange_dirs(staging, target):
+        shutil.rmtree(staging, ignore_errors=True)  # now holds the previous version
+        return
+    old = staging.with_name(staging.name + ".old")
+    os.replace(target, old)
+    os.replace(staging, target)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def _clean_staging() -> None:
+    """Remove staging dirs left behind by interrupted runs (their owning process is gone)."""
+    if not STAGING_DIR.is_dir():
+        return
+    for entry in STAGING_DIR.iterdir():
+        pid_text = entry.name.rsplit(".", 1)[-1]
+        if pid_text.isdigit():
+            try:
+                os.kill(int(pid_text), 0)
+                continue  # still being written by a live process
+            except ProcessLookupError:
+                pass
+            except PermissionError:
+                continue
+        shutil.rmtree(entry, ignore_errors=True)
+
+
+#作用：处理单个包（定位 debs → 解析版本并决定目录 → 在暂存目录中放置 debs、扫描 DSO、渲染 → 原子发布）。
+#pythons 矩阵的各变体一起处理：debs 只定位/暂存一次（其余变体硬链接）、DSO 扫描与成员列表只做一次，
+#每个变体只各自布局、渲染、发布。
+#返回各变体最终的 recipes 目录；缺少 .deb 时 raise SystemExit(2)。
+def _gen_package(pkg: Dict[str, Any], rules: Dict[str, Any], pyver: str, pyabi: str, env: Environment,
+                 opts: GenOptions) -> Path:
+    return _gen_variants([pkg], rules, pyver, pyabi, env, opts)[0]
+
+
+def _gen_variants(pkgs: List[Dict[str, Any]], rules: Dict[str, Any], pyver: str, pyabi: str, env: Environment,
+                  opts: GenOptions) -> List[Path]:
+    name = pkgs[0]["name"]
+    cache = _open_cache(opts.cache_path)
+
+    with PROF.span("stage", name):
+        sources = _locate_debs(pkgs[0], opts)
+
+    # Resolve the version before anything is written, so the final directory is known up front
+    try:
+        with PROF.span("version", name):
+            version = compute_version(pkgs[0], sources, cache)
+        for pkg in pkgs:
+            if version and not pkg.get("_resolved_version"):
+                pkg["_resolved_version"] = version
+    except Exception:
+        pass
+    targets = [WORKSPACE_DIR / _package_dir_name(pkg) for pkg in pkgs]
+
+    # Everything is written into a private staging dir and published in one step:
+    # an interrupted run never leaves a half-written <name>-<ver>/ behind.
+    stagings = [STAGING_DIR / f"{t.name}.{os.getpid()}" for t in targets]
+    for staging in stagings:
+        shutil.rmtree(staging, ignore_errors=True)
+        ensure_dir(staging / "debs")
+        ensure_dir(staging / "recipes")
+    try:
+        # debs re-used from the published dir are hardlinked (a symlink would dangle once it is replaced)
+        mode = opts.stage_mode if opts.deb_src is not None else "hardlink"
+        with PROF.span("stage", name):
+            for src in sources:
+                first = stagings[0] / "debs" / src.name
+                method = _stage_file(src, first, mode)
+                print(f"[COPY] {src} -> {targets[0] / 'debs' / src.name} ({method})")
+                # further variants share the first one's file
+                for staging, target in zip(stagings[1:], targets[1:]):
+                    method = _stage_file(first, staging / "debs" / src.name, "hardlink")
+                    print(f"[COPY] {src} -> {target / 'debs' / src.name} ({method})")
+
+        # Optional: scan DSOs of each deb for auto deps (served from the metadata cache when warm)
+        if opts.enable_dso_scan:
+            elf_index: Dict[str, Dict[str, Any]] = {}
+            with PROF.span("dso-scan", name):
+                for f in sources:
                     try:
-                        subprocess.run(["dpkg-deb", "-x", str(f), str(tmp_root)], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                        elf_index.update(_deb_elf_index(f, cache, opts.scan_mode))
                     except Exception:
                         # ignore failing archives; best-effort
                         pass
-                auto_run = _scan_dsos_and_map_run_deps(tmp_root, rules)
-                if auto_run:
+                auto_run = _map_run_deps_from_elf(elf_index, rules)
+            if auto_run:
+                for pkg in pkgs:
                     pkg["_auto_run_deps"] = auto_run
 
-        # Decide final workspace directory name (with version suffix if available)
-        # Priority: manifest.version > extras.version > detected _resolved_version > no suffix
-        dir_ver: Optional[str] = None
-        direct_v = pkg.get("version")
-        if isinstance(direct_v, str) and direct_v.strip():
-            dir_ver = _sanitize_conda_version(direct_v)
+        # Lay the package out from its member lists: install plan (build.sh.j2 kinds) and the exact
+        # list of foreign SONAMEs build.sh drops (exclude.txt)
+        member_lists = [_deb_members(f, cache) for f in _sorted_debs(sources)]
+        for pkg, staging in zip(pkgs, stagings):
+            with PROF.span("layout", pkg["name"]):
+                layout = _package_layout(pkg, member_lists, rules, pyver, pyabi)
+            for w in layout.warnings:
+                print(f"[WARN] {pkg['name']}: {w}")
+            if layout.plan is not None:
+                pkg["_install_plan"] = layout.plan
+            pkg["_exclude"] = layout.exclude
+
+            with PROF.span("render", pkg["name"]):
+                render_templates(pkg, rules, pyver, pyabi, env, staging / "recipes")
+        with PROF.span("publish", name):
+            for staging, target in zip(stagings, targets):
+                _publish_dir(staging, target)
+    finally:
+        for staging in stagings:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    for pkg, target in zip(pkgs, targets):
+        print(f"[OK] Generated recipe for {pkg['name']} -> {target / 'recipes'} (dir: {target.name})")
+    return [t / "recipes" for t in targets]
+
+
+def _variant_groups(named: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Packages as units of generation: the variants of one pythons entry together, in manifest order."""
+    groups: List[List[Dict[str, Any]]] = []
+    for pkg in named:
+        of = pkg.get("variant_of")
+        if of and groups and groups[-1][0].get("variant_of") == of:
+            groups[-1].append(pkg)
         else:
-            extras_v = (pkg.get("extras", {}) or {}).get("version")
-            if isinstance(extras_v, str) and extras_v.strip():
-                dir_ver = _sanitize_conda_version(extras_v)
-            else:
-                resolved_v = pkg.get("_resolved_version")
-                if isinstance(resolved_v, str) and resolved_v.strip():
-                    dir_ver = _sanitize_conda_version(resolved_v)
+            groups.append([pkg])
+    return groups
+
+
+# 每个 worker 进程只创建一次 Jinja 环境
+_WORKER_ENV: Optional[Environment] = None
+
+
+def _gen_package_worker(pkgs: List[Dict[str, Any]], rules: Dict[str, Any], pyver: str, pyabi: str,
+                        opts: GenOptions) -> Tuple[str, int, List[str], List[Dict[str, Any]]]:
+    """Process-pool entry point for one package (or the variants of one pythons entry).
+    Captures everything the package prints so the parent can emit it as one block.
+    Returns (log, exit_code, recipes dirs, profile spans).
+    """
+    global _WORKER_ENV
+    if _WORKER_ENV is None:
+        _WORKER_ENV = _make_jinja_env()
+    if opts.profile:
+        PROF.enable()
+    buf = io.StringIO()
+    code = 0
+    out: List[Path] = []
+    with contextlib.redirect_stdout(buf):
+        try:
+            with PROF.span("package", pkgs[0]["name"]):
+                out = _gen_variants(pkgs, rules, pyver, pyabi, _WORKER_ENV, opts)
+        except SystemExit as exc:
+            code = exc.code if isinstance(exc.code, int) else 1
+        except Exception:
+            traceback.print_exc(file=buf)
+            code = 1
+    return buf.getvalue(), code, [str(o) for o in out], PROF.drain()
+
+
+def _print_summary(results: List[Tuple[str, Optional[str]]]) -> None:
+    """Print per-package result lines in manifest order."""
+    ok = sum(1 for _, d in results if d)
+    print(f"[SUMMARY] {ok}/{len(results)} recipes generated")
+    for name, out in results:
+        print(f"  {name}: {out or 'FAILED'}")
+
 
-        if dir_ver:
-            target_dir = WORKSPACE_DIR / f"{name}-{dir_ver}"
+#作用：计算包的输入指纹（manifest 条目、相关 rules 片段、模板与生成器源码哈希、deb 内容摘要）。
+#指纹不变且产物目录仍在时，gen 跳过该包。
+def _rules_slice(pkg: Dict[str, Any], rules: Dict[str, Any]) -> Dict[str, Any]:
+    name = _conda_name(pkg)
+    return {
+        "map_run_deps": rules.get("map_run_deps", {}) or {},
+        "test_snippets": rules.get("test_snippets", {}) or {},
+        "python_site_requires": (rules.get("python_site_requires", {}) or {}).get(name),
+        "bin_tests": (rules.get("bin_tests", {}) or {}).get(name),
+    }
+
+
+_STATIC_DIGEST: Optional[str] = None
+
+
+def _static_digest() -> str:
+    """Hash of the templates and generator sources: any change there dirties every package."""
+    global _STATIC_DIGEST
+    if _STATIC_DIGEST is None:
+        h = hashlib.sha256()
+        for p in sorted(TEMPLATES_DIR.glob("*.j2")) + sorted(Path(__file__).resolve().parent.glob("*.py")):
+            h.update(p.name.encode())
+            h.update(p.read_bytes())
+        _STATIC_DIGEST = h.hexdigest()
+    return _STATIC_DIGEST
+
+
+def _package_debs(pkg: Dict[str, Any], opts: GenOptions, state: Dict[str, Any]) -> List[Path]:
+    """The debs a gen run would use for pkg: from --deb-src, else those already in its workspace dir."""
+    if opts.deb_src is not None and opts.deb_src.is_dir():
+        patterns = [str(x) for x in (pkg.get("debs", []) or [])]
+        return _match_debs(opts.deb_src, patterns, list(pkg.get("deb_packages", []) or []), quiet=True)
+    prev = (state.get(pkg["name"]) or {}).get("dir")
+    debs_dir = (WORKSPACE_DIR / prev if prev else WORKSPACE_DIR / pkg["name"]) / "debs"
+    return sorted(debs_dir.glob("*.deb")) if debs_dir.is_dir() else []
+
+
+def compute_fingerprint(pkg: Dict[str, Any], rules: Dict[str, Any], pyver: str, pyabi: str, opts: GenOptions,
+                        debs: List[Path]) -> str:
+    cache = _open_cache(opts.cache_path)
+    deb_digests = sorted((p.name, cache.digest(p) if cache is not None else sha256_file(p)) for p in debs)
+    doc = {
+        "pkg": {k: v for k, v in pkg.items() if not str(k).startswith("_")},
+        "rules": _rules_slice(pkg, rules),
+        "python": [pyver, pyabi],
+        "dso_scan": opts.enable_dso_scan,
+        "providers": rules.get("_providers_digest"),
+        "static": _static_digest(),
+        "debs": deb_digests,
+    }
+    return hashlib.sha256(json.dumps(doc, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+#作用：workspace/index.json 记录每个包的发布目录、版本、输入指纹与预期产物名，供增量生成与 shell 脚本直接查询。
+#示例：python -c 'import json;print(json.load(open("workspace/index.json"))["packages"]["jq"]["dir"])'
+def _load_index() -> Dict[str, Any]:
+    try:
+        data = json.loads(INDEX_PATH.read_text(encoding="utf-8"))
+        if isinstance(data, dict) and data.get("version") == INDEX_VERSION:
+            return data.get("packages", {}) or {}
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def _save_index(packages: Dict[str, Any]) -> None:
+    ensure_dir(INDEX_PATH.parent)
+    tmp = INDEX_PATH.with_name(f"{INDEX_PATH.name}.{os.getpid()}.tmp")
+    doc = {"version": INDEX_VERSION, "recipes_dir": str(WORKSPACE_DIR), "packages": packages}
+    tmp.write_text(json.dumps(doc, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, INDEX_PATH)
+
+
+def _index_entry(pkg: Dict[str, Any], recipes_dir: Path, fingerprint: str) -> Dict[str, Any]:
+    cname, version, bstring, _deps = _recipe_info(recipes_dir)
+    return {
+        "dir": recipes_dir.parent.name,
+        "version": version,
+        "fingerprint": fingerprint,
+        "artifact": f"{cname}-{version}-{bstring}",
+    }
+
+
+_INDEX_CACHE: Optional[Tuple[int, Dict[str, Any]]] = None
+
+
+def _published_dir(name: str) -> Optional[Path]:
+    """Directory the index records for name (re-read only when index.json changes)."""
+    global _INDEX_CACHE
+    try:
+        mtime = INDEX_PATH.stat().st_mtime_ns
+    except OSError:
+        return None
+    if _INDEX_CACHE is None or _INDEX_CACHE[0] != mtime:
+        _INDEX_CACHE = (mtime, _load_index())
+    rel = (_INDEX_CACHE[1].get(name) or {}).get("dir")
+    return WORKSPACE_DIR / rel if rel else None
+
+
+def plan_packages(named: List[Dict[str, Any]], rules: Dict[str, Any], pyver: str, pyabi: str, opts: GenOptions,
+                  state: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Return [{name, reason, fingerprint, dir}] for every package that gen would (re)generate."""
+    dirty: List[Dict[str, Any]] = []
+    for pkg in named:
+        name = pkg["name"]
+        prev = state.get(name) or {}
+        debs = _package_debs(pkg, opts, state)
+        fp = compute_fingerprint(pkg, rules, pyver, pyabi, opts, debs)
+        wants_debs = bool(pkg.get("debs") or pkg.get("deb_packages")) and opts.deb_src is not None
+        if not prev:
+            reason = "new"
+        elif wants_debs and not debs:
+            reason = "debs-missing"
+        elif not (WORKSPACE_DIR / str(prev.get("dir", "")) / "recipes" / "meta.yaml").is_file():
+            reason = "output-missing"
+        elif prev.get("fingerprint") != fp:
+            reason = "changed"
         else:
-            target_dir = base_dir
-
-        # If target directory differs, move/merge current temp dir into the versioned one
-        if target_dir != base_dir:
-            ensure_dir(target_dir)
-            # Move contents over and remove the temp base dir
-            for item in base_dir.iterdir():
-                dest = target_dir / item.name
-                if dest.exists():
-                    # If destination exists, attempt to merge directories or overwrite files
-                    if item.is_dir() and dest.is_dir():
-                        for sub in item.iterdir():
-                            shutil.move(str(sub), str(dest / sub.name))
-                        shutil.rmtree(item)
-                    else:
-                        # Overwrite the destination
-                        if dest.is_dir():
-                            shutil.rmtree(dest)
-                        else:
-                            dest.unlink(missing_ok=True)
-                        shutil.move(str(item), str(dest))
-                else:
-                    shutil.move(str(item), str(dest))
-            # finally, remove the empty base_dir
+            continue
+        dirty.append({"name": name, "reason": reason, "fingerprint": fp, "dir": prev.get("dir")})
+    return dirty
+
+
+def _named_packages(manifest: Dict[str, Any]) -> List[Dict[str, Any]]:
+    pkgs: List[Dict[str, Any]] = manifest.get("packages", []) or []
+    if not pkgs:
+        print("[WARN] No packages found in manifest.")
+    named: List[Dict[str, Any]] = []
+    for pkg in pkgs:
+        if not pkg.get("name"):
+            print("[WARN] Skip entry without name")
+            continue
+        named.extend(_python_variants(pkg))
+    return named
+
+
+def cmd_gen(manifest_path: Path, rules_path: Path, deb_src: Optional[Path] = None, enable_dso_scan: bool = True,
+            jobs: int = 1, cache_path: Optional[Path] = DEFAULT_CACHE_PATH, scan_mode: str = "stream",
+            fetch_jobs: int = 4, stage_mode: str = "auto", force: bool = False,
+            profile_path: Optional[Path] = None, profile_top: int = 10) -> None:
+    if profile_path is None:
+        _gen_all(manifest_path, rules_path, deb_src, enable_dso_scan, jobs, cache_path, scan_mode, fetch_jobs,
+                 stage_mode, force)
+        return
+    PROF.enable()
+    try:
+        with PROF.span("gen"):
+            _gen_all(manifest_path, rules_path, deb_src, enable_dso_scan, jobs, cache_path, scan_mode, fetch_jobs,
+                     stage_mode, force, profile=True)
+    finally:
+        PROF.write(profile_path, command="gen", top=profile_top)
+
+
+def _gen_all(manifest_path: Path, rules_path: Path, deb_src: Optional[Path], enable_dso_scan: bool, jobs: int,
+             cache_path: Optional[Path], scan_mode: str, fetch_jobs: int, stage_mode: str, force: bool,
+             profile: bool = False) -> None:
+    opts = GenOptions(deb_src, enable_dso_scan, cache_path, scan_mode, stage_mode, profile)
+    manifest = read_yaml(manifest_path)
+    rules = read_yaml(rules_path)
+
+    pyver, pyabi = detect_python_version_from_manifest(manifest)
+    named = _named_packages(manifest)
+
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+
+    _clean_staging()
+    # Incremental: only packages whose input fingerprint changed are regenerated
+    state = _load_index()
+    # Cross-package facts first (file ownership, SONAME providers): clobbers are reported before anything
+    # is generated, and the provider index is part of every fingerprint
+    with PROF.span("providers"):
+        _prepare_providers(named, rules, pyver, pyabi, opts, state, jobs)
+    if force:
+        todo = list(named)
+    else:
+        with PROF.span("plan"):
+            dirty = {d["name"] for d in plan_packages(named, rules, pyver, pyabi, opts, state)}
+        todo = [pkg for pkg in named if pkg["name"] in dirty]
+        for pkg in named:
+            if pkg["name"] not in dirty:
+                print(f"[SKIP] {pkg['name']} unchanged ({state[pkg['name']]['dir']})")
+
+    # Download everything that is missing from --deb-src up front, across all packages
+    if deb_src is not None and deb_src.is_dir() and todo:
+        with PROF.span("prefetch"):
+            _prefetch_missing_debs(todo, deb_src, workers=max(1, fetch_jobs))
+
+    # debs downloaded just now can add SONAMEs (and clobbers); the index is only rebuilt if its inputs changed
+    if deb_src is not None and deb_src.is_dir() and todo:
+        with PROF.span("providers"):
+            _prepare_providers(named, rules, pyver, pyabi, opts, state, jobs)
+
+    outputs: Dict[str, Optional[str]] = {}
+    try:
+        outputs = _run_packages(todo, rules, pyver, pyabi, opts, jobs)
+    except _PartialRun as exc:
+        outputs = exc.outputs
+        raise
+    finally:
+        # record what was generated, even when a later package failed
+        with PROF.span("state"):
+            for pkg in todo:
+                out = outputs.get(pkg["name"])
+                if out:
+                    fp = compute_fingerprint(pkg, rules, pyver, pyabi, opts, _package_debs(pkg, opts, state))
+                    state[pkg["name"]] = _index_entry(pkg, Path(out), fp)
+            if todo:
+                _save_index(state)
+
+    results: List[Tuple[str, Optional[str]]] = []
+    for pkg in named:
+        name = pkg["name"]
+        out = outputs.get(name) if name in outputs else str(WORKSPACE_DIR / state[name]["dir"] / "recipes")
+        results.append((name, out))
+    _print_summary(results)
+
+
+def _scan_members(deb_path: Path) -> Optional[Tuple[List[List[str]], Dict[str, Dict[str, Any]]]]:
+    try:
+        return _stream_deb_scan(deb_path)
+    except Exception as exc:
+        print(f"[WARN] cannot read {deb_path}: {exc}")
+        return None
+
+
+#作用：按 manifest 全部包在纸面上布局 $PREFIX（与 build.sh 相同的复制/软链/排除），并收集各包 ELF 的 DT_SONAME。
+#返回 {包名: _ManifestEntry}，按 manifest 顺序；读不了的 deb 所在的包被跳过。
+class _ManifestEntry(NamedTuple):
+    layout: _Layout
+    sonames: List[str]       # DT_SONAME of the package's ELF files
+    needed: Dict[str, str]   # NEEDED soname -> first file (in the debs) needing it
+
+
+def _manifest_layouts(named: List[Dict[str, Any]], rules: Dict[str, Any], pyver: str, pyabi: str, opts: GenOptions,
+                      debs_of: Dict[str, List[Path]], jobs: int) -> Dict[str, _ManifestEntry]:
+    from concurrent.futures import ThreadPoolExecutor
+    cache = _open_cache(opts.cache_path)
+    members: Dict[Path, Optional[List[List[str]]]] = {}
+    elves: Dict[Path, Optional[Dict[str, Dict[str, Any]]]] = {}
+    missing: List[Path] = []
+    for debs in debs_of.values():
+        for deb in debs:
+            if deb in members:
+                continue
+            members[deb] = cache.get(deb, "members") if cache is not None else None
+            elves[deb] = cache.get(deb, "elf") if cache is not None and members[deb] is not None else None
+            if members[deb] is None or elves[deb] is None:
+                missing.append(deb)
+    if missing:
+        # cold debs are read in parallel (decompression releases the GIL); cache writes stay on this thread
+        with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(missing)))) as ex:
+            for deb, scanned in zip(missing, ex.map(_scan_members, missing)):
+                if scanned is None:
+                    continue
+                members[deb], elves[deb] = scanned
+                if cache is not None:
+                    cache.put(deb, "members", scanned[0])
+                    cache.put(deb, "elf", scanned[1])
+    out: Dict[str, _ManifestEntry] = {}
+    for pkg in named:
+        name = pkg["name"]
+        debs = debs_of[name]
+        if any(members[d] is None or elves[d] is None for d in debs):
+            continue
+        needed: Dict[str, str] = {}
+        sonames = set()
+        for d in debs:
+            for path, info in elves[d].items():  # type: ignore[union-attr]
+                if info.get("soname"):
+                    sonames.add(info["soname"])
+                for so in info.get("needed", []) or []:
+                    needed.setdefault(so, path)
+        layout = _package_layout(pkg, [members[d] for d in debs], rules, pyver, pyabi)  # type: ignore[misc]
+        out[name] = _ManifestEntry(layout, sorted(sonames), needed)
+    return out
+
+
+def _report_clobbers(index: OwnershipIndex, show: int = 5) -> int:
+    """Print one [CLOBBER] line per set of packages that install the same paths; returns the number of paths."""
+    total = 0
+    for owners, paths in index.grouped().items():
+        total += len(paths)
+        more = f" (+{len(paths) - show} more)" if len(paths) > show else ""
+        print(f"[CLOBBER] {' <-> '.join(owners)}: {len(paths)} path(s): {', '.join(paths[:show])}{more}")
+    return total
+
+
+PROVIDERS_PATH = REPO_ROOT / "workspace" / "providers.json"
+PROVIDERS_VERSION = 1
+
+
+def _providers_key(named: List[Dict[str, Any]], rules: Dict[str, Any], pyver: str, pyabi: str, opts: GenOptions,
+                   debs_of: Dict[str, List[Path]]) -> str:
+    """Digest of everything the provider index is derived from (manifest entries, their debs, map_run_deps)."""
+    cache = _open_cache(opts.cache_path)
+    doc = {
+        "version": PROVIDERS_VERSION,
+        "map_run_deps": rules.get("map_run_deps", {}) or {},
+        "python": [pyver, pyabi],
+        "dso_scan": opts.enable_dso_scan,
+        "static": _static_digest(),
+        "packages": [
+            [{k: v for k, v in pkg.items() if not str(k).startswith("_")},
+             [(p.name, cache.digest(p) if cache is not None else sha256_file(p)) for p in debs_of[pkg["name"]]]]
+            for pkg in named
+        ],
+    }
+    return hashlib.sha256(json.dumps(doc, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+#作用：SONAME → 提供者 索引：manifest 内各包实际安装到 lib/ 的 ELF 的 DT_SONAME，再以 rules.map_run_deps 覆盖。
+#结果挂在 rules 上（_providers: SONAME → 依赖串；_provides: 包名 → 需做存在性测试的 SONAME），
+#并写入 workspace/providers.json；输入未变时直接复用，不读任何 deb。
+#输入变化时顺带打印 [CLOBBER]，以及没有任何包提供、也不在 missing_dso 白名单中的 NEEDED（[UNRESOLVED]）。
+#示例：libX11.so.6 由 manifest 中的 libx11 安装 → 其他包 NEEDED libX11.so.6 时自动得到 run 依赖 libx11
+def _prepare_providers(named: List[Dict[str, Any]], rules: Dict[str, Any], pyver: str, pyabi: str, opts: GenOptions,
+                       state: Dict[str, Any], jobs: int = 1, report: bool = True) -> None:
+    from ownership import OwnershipIndex, soname_providers, unresolved_needed
+    explicit = {str(k): str(v) for k, v in (rules.get("map_run_deps", {}) or {}).items()}
+    debs_of = {pkg["name"]: _sorted_debs(_package_debs(pkg, opts, state)) for pkg in named}
+    key = _providers_key(named, rules, pyver, pyabi, opts, debs_of)
+    try:
+        stored = json.loads(PROVIDERS_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        stored = {}
+    if stored.get("key") == key:
+        derived, tested = stored.get("derived", {}) or {}, stored.get("tested", {}) or {}
+    else:
+        entries = _manifest_layouts(named, rules, pyver, pyabi, opts, debs_of, jobs)
+        # by conda package name: the pythons variants of one entry are alternatives, never installed together
+        paths_of: Dict[str, Dict[str, str]] = {}
+        sonames_of: Dict[str, List[str]] = {}
+        for pkg in named:
+            entry = entries.get(pkg["name"])
+            if entry is not None:
+                paths_of.setdefault(_conda_name(pkg), {}).update(entry.layout.paths)
+                sonames_of.setdefault(_conda_name(pkg), []).extend(entry.sonames)
+        if report:
+            index = OwnershipIndex()
+            for name, paths in paths_of.items():
+                index.add(name, paths)
+            clobbered = _report_clobbers(index)
+            if clobbered:
+                print(f"[WARN] {clobbered} path(s) are installed by more than one package (see [CLOBBER] above)")
+        derived: Dict[str, str] = {}
+        tested: Dict[str, List[str]] = {}
+        if opts.enable_dso_scan:
+            derived, conflicts = soname_providers(paths_of, sonames_of)
+            for so, names in sorted(conflicts.items()):
+                if report and so not in explicit:
+                    print(f"[WARN] {so} is installed by {', '.join(names)}; using {names[0]} "
+                          f"(set map_run_deps.{so} to choose)")
+            # derived SONAMEs get the same presence test as map_run_deps ones, when lib/<soname> is installed
+            for so, name in sorted(derived.items()):
+                if so not in explicit and f"lib/{so}" in paths_of[name]:
+                    tested.setdefault(name, []).append(so)
+            unresolved = 0
+            seen: set = set()
+            for pkg in named:
+                entry = entries.get(pkg["name"])
+                if entry is None or _conda_name(pkg) in seen:
+                    continue
+                seen.add(_conda_name(pkg))
+                missing = unresolved_needed(entry.needed, entry.sonames, {**derived, **explicit},
+                                            pkg.get("missing_dso", []) or [])
+                unresolved += len(missing)
+                for so, path in missing.items():
+                    if report:
+                        print(f"[UNRESOLVED] {_conda_name(pkg)}: {so} (needed by {path})")
+            if report and unresolved:
+                print(f"[WARN] {unresolved} NEEDED SONAME(s) have no provider in the manifest "
+                      f"(add the package, map_run_deps, or missing_dso)")
+        ensure_dir(PROVIDERS_PATH.parent)
+        tmp = PROVIDERS_PATH.with_name(f"{PROVIDERS_PATH.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({"version": PROVIDERS_VERSION, "key": key, "derived": derived, "tested": tested},
+                                  indent=2, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, PROVIDERS_PATH)
+
+    providers: Dict[str, str] = dict(derived)
+    providers.update(explicit)
+    provides: Dict[str, List[str]] = {}
+    for so, mapped in explicit.items():
+        provides.setdefault(mapped.split()[0], []).append(so)
+    for name, sos in tested.items():
+        provides.setdefault(name, []).extend(sos)
+    rules["_providers"] = providers
+    rules["_provides"] = provides
+    rules["_providers_digest"] = hashlib.sha256(
+        json.dumps([providers, provides], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class _PartialRun(SystemExit):
+    """SystemExit that still carries the packages generated before the failure."""
+
+    def __init__(self, outputs: Dict[str, Optional[str]], code: int = 2) -> None:
+        super().__init__(code)
+        self.outputs = outputs
+
+
+def _run_packages(named: List[Dict[str, Any]], rules: Dict[str, Any], pyver: str, pyabi: str, opts: GenOptions,
+                  jobs: int, env: Optional[Environment] = None) -> Dict[str, Optional[str]]:
+    """Generate the given packages, serially or on a process pool. Returns {name: recipes dir}.
+    Raises SystemExit on the first failure (after recording finished packages in the returned dict).
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    outputs: Dict[str, Optional[str]] = {}
+    if not named:
+        return outputs
+    units = _variant_groups(named)
+    if jobs == 1 or len(units) <= 1:
+        env = env or _make_jinja_env()
+        for unit in units:
             try:
-                base_dir.rmdir()
-            except Exception:
-                pass
-            # update working paths
-            base_dir = target_dir
-            debs_dir = base_dir / "debs"
-            recipes_dir = base_dir / "recipes"
-            ensure_dir(recipes_dir)
+                with PROF.span("package", unit[0]["name"]):
+                    recipes_dirs = _gen_variants(unit, rules, pyver, pyabi, env, opts)
+            except SystemExit as exc:
+                raise _PartialRun(outputs, exc.code if isinstance(exc.code, int) else 2) from None
+            for pkg, recipes_dir in zip(unit, recipes_dirs):
+                outputs[pkg["name"]] = str(recipes_dir)
+        return outputs
+
+    # Parallel: packages are independent; logs are buffered per package and flushed in manifest order.
+    done: Dict[int, Tuple[str, int, List[str], List[Dict[str, Any]]]] = {}
+    cursor = 0
+    failed = 0
+    with ProcessPoolExecutor(max_workers=min(jobs, len(units))) as pool:
+        futures = {
+            pool.submit(_gen_package_worker, unit, rules, pyver, pyabi, opts): idx
+            for idx, unit in enumerate(units)
+        }
+        for fut in as_completed(futures):
+            idx = futures[fut]
+            try:
+                done[idx] = fut.result()
+            except Exception as exc:  # worker crashed (e.g. killed)
+                done[idx] = (f"[ERROR] worker for {units[idx][0]['name']} crashed: {exc}\n", 1, [], [])
+            if done[idx][1] != 0:
+                failed = done[idx][1]
+                # Stop scheduling new packages; let running ones finish
+                pool.shutdown(wait=True, cancel_futures=True)
+                for f, i in futures.items():
+                    if i not in done and f.done() and not f.cancelled() and f.exception() is None:
+                        done[i] = f.result()
+                break
+            while cursor in done:
+                sys.stdout.write(done[cursor][0])
+                sys.stdout.flush()
+                cursor += 1
+
+    # Flush whatever is left (after a failure, out-of-order completions) in manifest order
+    for idx in sorted(i for i in done if i >= cursor):
+        sys.stdout.write(done[idx][0])
+    sys.stdout.flush()
+    for idx, (_log, code, outs, spans) in done.items():
+        PROF.extend(spans)
+        if code == 0:
+            for pkg, out in zip(units[idx], outs):
+                outputs[pkg["name"]] = out
+    if failed:
+        raise _PartialRun(outputs, failed)
+    return outputs
+
+
+#作用：只计算不生成，打印需要重新生成的包（JSON 列表）。
+#示例：python tools/debwrap.py plan --manifest manifest.yaml --rules rules.yaml --deb-src allDebs
+def cmd_plan(manifest_path: Path, rules_path: Path, deb_src: Optional[Path] = None, enable_dso_scan: bool = True,
+             cache_path: Optional[Path] = DEFAULT_CACHE_PATH) -> None:
+    opts = GenOptions(deb_src, enable_dso_scan, cache_path)
+    manifest = read_yaml(manifest_path)
+    rules = read_yaml(rules_path)
+    pyver, pyabi = detect_python_version_from_manifest(manifest)
+    with contextlib.redirect_stdout(sys.stderr):
+        named = _named_packages(manifest)
+    state = _load_index()
+    with contextlib.redirect_stdout(sys.stderr):
+        _prepare_providers(named, rules, pyver, pyabi, opts, state)
+    dirty = plan_packages(named, rules, pyver, pyabi, opts, state)
+    print(json.dumps(dirty, indent=2))
+
+
+#作用：供 shell 脚本使用：一次解析 manifest，输出频道、工作区与各包信息（JSON 或 TSV），或单个字段的纯文本。
+#只依赖 yaml/json，不加载 jinja2 等重模块，启动在几十毫秒内。
+#示例：CHANNEL_ROOT="$(python tools/debwrap.py query --manifest manifest.yaml channel_root)"
+#      python tools/debwrap.py query --manifest manifest.yaml --format tsv
+QUERY_FIELDS = ("channel_root", "recipes_dir", "names", "pyver", "pyabi", "packages")
+_QUERY_COLUMNS = ("name", "kind", "version", "dir", "recipes", "artifact", "in_channel")
+
+
+def _channel_stems(channel: Path) -> set:
+    """'<name>-<version>-<build>' of every artifact in the channel's subdirs (a directory listing, no parsing)."""
+    stems: set = set()
+    if not channel.is_dir():
+        return stems
+    for sub in os.scandir(channel):
+        if sub.is_dir() and not sub.name.startswith("."):
+            for e in os.scandir(sub.path):
+                for ext in (".conda", ".tar.bz2"):
+                    if e.name.endswith(ext):
+                        stems.add(e.name[: -len(ext)])
+    return stems
+
+
+def query_manifest(manifest_path: Path) -> Dict[str, Any]:
+    manifest = read_yaml(manifest_path)
+    channel = Path(manifest.get("channel_root", "/workspace/local-conda-channel/"))
+    pyver, pyabi = detect_python_version_from_manifest(manifest)
+    state = _load_index()
+    stems = _channel_stems(channel)
+    packages: List[Dict[str, Any]] = []
+    for pkg in (v for p in manifest.get("packages", []) or [] if p.get("name") for v in _python_variants(p, quiet=True)):
+        name = pkg["name"]
+        entry = state.get(name) or {}
+        recipes = WORKSPACE_DIR / entry["dir"] / "recipes" if entry.get("dir") else None
+        packages.append({
+            "name": name,
+            "kind": pkg.get("kind", "lib"),
+            "version": entry.get("version"),
+            "dir": entry.get("dir"),
+            "recipes": str(recipes) if recipes is not None else None,
+            "artifact": entry.get("artifact"),
+            "in_channel": bool(entry.get("artifact")) and entry["artifact"] in stems,
+        })
+    return {
+        "manifest": str(manifest_path),
+        "channel_root": str(channel),
+        "recipes_dir": str(WORKSPACE_DIR),
+        "pyver": pyver,
+        "pyabi": pyabi,
+        "names": [p["name"] for p in packages],
+        "packages": packages,
+    }
+
 
-        render_templates(pkg, rules, pyver, pyabi, env, recipes_dir)
-        final_dir_display = base_dir.name
-        print(f"[OK] Generated recipe for {name} -> {recipes_dir} (dir: {final_dir_display})")
+def cmd_query(manifest_path: Path, field: Optional[str] = None, fmt: str = "json") -> None:
+    doc = query_manifest(manifest_path)
+    value: Any = doc if field is None else doc[field]
+    if fmt == "json":
+        print(json.dumps(value, indent=2))
+        return
+    # tsv: scalars as-is, lists one item per line, the package table with a header row
+    if field is None or field == "packages":
+        print("\t".join(_QUERY_COLUMNS))
+        for p in doc["packages"]:
+            print("\t".join("" if p[c] is None else str(p[c]).lower() if isinstance(p[c], bool) else str(p[c])
+                            for c in _QUERY_COLUMNS))
+    elif isinstance(value, list):
+        for item in value:
+            print(item)
+    else:
+        print(value)
+
+
+#作用：常驻进程：解析后的 manifest/rules、Jinja 环境、deb 池索引与元数据缓存都留在内存中，
+#监视 deb 池、manifest、rules 与模板的变化（inotify，不可用时轮询），去抖后只重新生成受影响的包。
+#示例：python tools/debwrap.py watch --manifest manifest.yaml --rules rules.yaml --deb-src allDebs
+def _templates_for(pkg: Dict[str, Any]) -> set:
+    """Templates render_templates uses for pkg."""
+    build_t = "build.lib.sh.j2" if pkg.get("kind", "lib") in {"lib", "bin", "data"} else "build.sh.j2"
+    return {"meta.yaml.j2", build_t}
+
+
+def _template_digests() -> Dict[str, str]:
+    return {p.name: sha256_file(p) for p in sorted(TEMPLATES_DIR.glob("*.j2"))}
+
+
+def _pkg_key(pkg: Dict[str, Any]) -> str:
+    return json.dumps(pkg, sort_keys=True, default=str)
+
+
+class _WatchState:
+    """Inputs of the last generation, kept between change events."""
+
+    def __init__(self, manifest_path: Path, rules_path: Path, opts: GenOptions) -> None:
+        self.manifest_path = manifest_path.resolve()
+        self.rules_path = rules_path.resolve()
+        self.opts = opts
+        self.env = _make_jinja_env()
+        self.templates = _template_digests()
+        self.rules: Dict[str, Any] = read_yaml(rules_path)
+        self.named: Dict[str, Dict[str, Any]] = {}
+        self.pyver, self.pyabi = "", ""
+        self.debs: Dict[str, List[Tuple[str, int, int]]] = {}
+        self.index = _load_index()
+        self.templates_changed = False
+        self.providers_digest: Optional[str] = None
+        self._load_manifest()
+        for name, pkg in self.named.items():
+            self.debs[name] = self._deb_sig(pkg)
+
+    def _load_manifest(self) -> None:
+        manifest = read_yaml(self.manifest_path)
+        self.pyver, self.pyabi = detect_python_version_from_manifest(manifest)
+        self.named = {p["name"]: p for p in _named_packages(manifest)}
+
+    def _deb_sig(self, pkg: Dict[str, Any]) -> List[Tuple[str, int, int]]:
+        out = []
+        for p in _package_debs(pkg, self.opts, self.index):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            out.append((p.name, st.st_size, st.st_mtime_ns))
+        return sorted(out)
+
+    def packages(self, names: Optional[set] = None) -> List[Dict[str, Any]]:
+        """Manifest entries in manifest order, as fresh copies (gen stores _resolved_version etc. on them)."""
+        return [{k: v for k, v in pkg.items() if not str(k).startswith("_")}
+                for name, pkg in self.named.items() if names is None or name in names]
+
+    def affected(self, changed: set) -> Tuple[set, List[str]]:
+        """Apply changed paths to the in-memory state. Returns (package names to recheck, reasons)."""
+        global _STATIC_DIGEST
+        names: set = set()
+        reasons: List[str] = []
+        if self.manifest_path in changed:
+            old, old_py = self.named, (self.pyver, self.pyabi)
+            try:
+                self._load_manifest()
+            except Exception as exc:
+                print(f"[WARN] cannot reload {self.manifest_path}: {exc}")
+            else:
+                if (self.pyver, self.pyabi) != old_py:
+                    names.update(self.named)
+                    reasons.append(f"python {old_py[0]} -> {self.pyver}")
+                edited = {n for n, p in self.named.items() if n not in old or _pkg_key(p) != _pkg_key(old[n])}
+                for n in sorted(set(old) - set(self.named)):
+                    print(f"[WATCH] {n} removed from manifest (its workspace dir is left alone)")
+                    self.debs.pop(n, None)
+                if edited:
+                    names |= edited
+                    reasons.append(f"manifest: {', '.join(sorted(edited))}")
+        if self.rules_path in changed:
+            try:
+                rules = read_yaml(self.rules_path)
+            except Exception as exc:
+                print(f"[WARN] cannot reload {self.rules_path}: {exc}")
+            else:
+                hit = {n for n, p in self.named.items() if _rules_slice(p, rules) != _rules_slice(p, self.rules)}
+                self.rules = rules
+                if hit:
+                    names |= hit
+                    reasons.append(f"rules: {len(hit)} package(s)")
+        if any(p.parent == TEMPLATES_DIR.resolve() for p in changed):
+            digests = _template_digests()
+            touched = {t for t in digests.keys() | self.templates.keys() if digests.get(t) != self.templates.get(t)}
+            if touched:
+                self.templates = digests
+                self.env = _make_jinja_env()
+                self.templates_changed = True
+                _STATIC_DIGEST = None
+                hit = {n for n, p in self.named.items() if _templates_for(p) & touched}
+                names |= hit
+                reasons.append(f"templates {', '.join(sorted(touched))}: {len(hit)} package(s)")
+        deb_src = self.opts.deb_src
+        if deb_src is not None and any(p == deb_src.resolve() or p.parent == deb_src.resolve() for p in changed):
+            if _get_pool(deb_src).refresh():
+                hit = set()
+                for n, pkg in self.named.items():
+                    sig = self._deb_sig(pkg)
+                    if sig != self.debs.get(n):
+                        self.debs[n] = sig
+                        hit.add(n)
+                if hit:
+                    names |= hit
+                    reasons.append(f"debs: {', '.join(sorted(hit))}")
+        for n in names:
+            self.debs[n] = self._deb_sig(self.named[n]) if n in self.named else []
+        return names & set(self.named), reasons
+
+    def regenerate(self, names: Optional[set], jobs: int) -> List[str]:
+        """Generate the packages among names whose fingerprint changed; returns the names generated."""
+        _prepare_providers(self.packages(), self.rules, self.pyver, self.pyabi, self.opts, self.index, jobs)
+        digest = self.rules.get("_providers_digest")
+        if self.providers_digest is not None and digest != self.providers_digest:
+            # the provider index is part of every fingerprint: re-check the whole manifest
+            names = None
+        self.providers_digest = digest
+        pkgs = self.packages(names)
+        dirty = {d["name"] for d in plan_packages(pkgs, self.rules, self.pyver, self.pyabi, self.opts, self.index)}
+        todo = [p for p in pkgs if p["name"] in dirty]
+        refresh = names is not None and self.templates_changed
+        self.templates_changed = False
+        if refresh:
+            # a template edit changes every fingerprint; unaffected packages render the same, keep them clean
+            for pkg in self.packages(set(self.named) - names):
+                entry = self.index.get(pkg["name"])
+                if entry:
+                    entry["fingerprint"] = compute_fingerprint(pkg, self.rules, self.pyver, self.pyabi, self.opts,
+                                                               _package_debs(pkg, self.opts, self.index))
+        outputs: Dict[str, Optional[str]] = {}
+        try:
+            outputs = _run_packages(todo, self.rules, self.pyver, self.pyabi, self.opts, jobs, env=self.env)
+        except _PartialRun as exc:
+            outputs = exc.outputs
+            print(f"[FAIL] generation stopped (exit {exc.code}); fix the input and save again")
+        except Exception:
+            traceback.print_exc()
+        for pkg in todo:
+            out = outputs.get(pkg["name"])
+            if out:
+                fp = compute_fingerprint(pkg, self.rules, self.pyver, self.pyabi, self.opts,
+                                         _package_debs(pkg, self.opts, self.index))
+                self.index[pkg["name"]] = _index_entry(pkg, Path(out), fp)
+        if todo or refresh:
+            _save_index(self.index)
+        return [p["name"] for p in todo if outputs.get(p["name"])]
+
+
+def cmd_watch(manifest_path: Path, rules_path: Path, deb_src: Optional[Path] = None, enable_dso_scan: bool = True,
+              jobs: int = 1, cache_path: Optional[Path] = DEFAULT_CACHE_PATH, scan_mode: str = "stream",
+              stage_mode: str = "auto", debounce: float = 0.15, poll_interval: float = 1.0,
+              force_poll: bool = False) -> None:
+    from watcher import FsWatcher
+    opts = GenOptions(deb_src, enable_dso_scan, cache_path, scan_mode, stage_mode)
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    _clean_staging()
+    ws = _WatchState(manifest_path, rules_path, opts)
+    done = ws.regenerate(None, jobs)
+    print(f"[WATCH] initial pass: {len(done)} generated, {len(ws.named) - len(done)} up to date")
+
+    dirs = [TEMPLATES_DIR] + ([deb_src] if deb_src is not None and deb_src.is_dir() else [])
+    watcher = FsWatcher(dirs, files=[manifest_path, rules_path], poll_interval=poll_interval, force_poll=force_poll)
+    print(f"[WATCH] watching {', '.join(str(d) for d in dirs)}, {manifest_path.name}, {rules_path.name} "
+          f"({watcher.backend}, debounce {debounce:.2f}s); Ctrl-C to stop")
+    sys.stdout.flush()
+    try:
+        while True:
+            changed = watcher.wait(None)
+            # debounce: keep collecting until the inputs have been quiet for `debounce` seconds
+            while True:
+                more = watcher.wait(debounce)
+                if not more:
+                    break
+                changed |= more
+            if any(p.parent == Path(__file__).resolve().parent and p.suffix == ".py" for p in changed):
+                print("[WARN] generator sources changed; restart watch to pick them up")
+            t0 = time.monotonic()
+            names, reasons = ws.affected(changed)
+            if not names and not ws.templates_changed:
+                continue
+            print(f"[WATCH] change: {'; '.join(reasons)}")
+            generated = ws.regenerate(names, jobs)
+            # latency from the newest input change (file mtime) to recipes being published
+            mtimes = [p.stat().st_mtime for p in changed if p.is_file()]
+            since = f", {time.time() - max(mtimes):.2f}s after the change" if mtimes else ""
+            print(f"[WATCH] {len(generated)} regenerated ({', '.join(generated) or 'fingerprints unchanged'}) "
+                  f"in {time.monotonic() - t0:.2f}s{since}")
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        print("[WATCH] stopped")
+    finally:
+        watcher.close()
+
+
+#作用：按依赖 DAG 并行执行 conda-build（替代 auto_build.sh 中的串行循环）。
+#依赖来自各包渲染后的 meta.yaml requirements.run（即 compute_run_deps 的结果），只保留 manifest 内的包。
+#跳过规则与 auto_build.sh 相同：频道中已有同名包、精确产物存在且 .build_sig 未变 → 跳过。
+#示例：python tools/debwrap.py build --manifest manifest.yaml --jobs 4
+def _resolve_base_dir(name: str, state: Dict[str, Any]) -> Path:
+    prev = (state.get(name) or {}).get("dir")
+    if prev and (WORKSPACE_DIR / prev / "recipes").is_dir():
+        return WORKSPACE_DIR / prev
+    if (WORKSPACE_DIR / name / "recipes").is_dir():
+        return WORKSPACE_DIR / name
+    # workspaces generated before index.json existed: newest <name>-*/recipes
+    candidates = [p.parent for p in WORKSPACE_DIR.glob(f"{name}-*/recipes") if p.is_dir()]
+    if candidates:
+        return max(candidates, key=lambda p: (p / "recipes").stat().st_mtime)
+    return WORKSPACE_DIR / name
+
+
+def _build_sig(base: Path) -> str:
+    """sha256 of `sha256sum meta.yaml build.sh [install_plan.tsv] [exclude.txt] debs/*.deb`
+    (the gen-computed sidecars only when present, so older recipes keep their signature).
+    """
+    lines: List[str] = []
+    for f in (base / "recipes" / "meta.yaml", base / "recipes" / "build.sh", base / "recipes" / "install_plan.tsv",
+              base / "recipes" / "exclude.txt"):
+        if f.is_file():
+            lines.append(f"{sha256_file(f)}  {f}\n")
+    debs_dir = base / "debs"
+    if debs_dir.is_dir():
+        for f in sorted(debs_dir.glob("*.deb")):
+            lines.append(f"{sha256_file(f)}  {f}\n")
+    return hashlib.sha256("".join(lines).encode("utf-8")).hexdigest()
+
+
+def _recipe_info(recdir: Path) -> Tuple[str, str, str, List[str]]:
+    """(name, version, build string, run dep names) from a rendered meta.yaml."""
+    meta = yaml.load((recdir / "meta.yaml").read_text(encoding="utf-8"), Loader=_BASE_LOADER) or {}
+    package = meta.get("package", {}) or {}
+    build = meta.get("build", {}) or {}
+    run = ((meta.get("requirements", {}) or {}).get("run", []) or [])
+    dep_names = [re.split(r"[\s=<>!~]", str(r).strip(), maxsplit=1)[0] for r in run if str(r).strip()]
+    return str(package.get("name", "")), str(package.get("version", "")), str(build.get("string", "")), dep_names
+
+
+def _list_artifacts(root: Path) -> List[Path]:
+    """All .conda/.tar.bz2 files in root's direct subdirs (conda-build output layout: <subdir>/<file>)."""
+    from channel import split_ext
+    found: List[Path] = []
+    if not root.is_dir():
+        return found
+    for entry in os.scandir(root):
+        if entry.is_dir() and not entry.name.startswith("."):
+            found.extend(Path(e.path) for e in os.scandir(entry.path) if e.is_file() and split_ext(e.name)[1])
+    return found
+
+
+def _abs_if_local(arg: str) -> str:
+    return str(Path(arg).resolve()) if os.sep in arg and Path(arg).exists() else arg
+
+
+class _BuildPlan(NamedTuple):
+    name: str
+    base: Path
+    stem: str
+    sig: str
+    deps: List[str]
+    action: str  # "build" | "skip"
+    reason: str
+
+
+def cmd_build(manifest_path: Path, jobs: int = 1, force: bool = False, conda_build: str = "conda-build",
+              conda_index: Optional[str] = None, channel_root: Optional[Path] = None,
+              log_dir: Optional[Path] = None) -> None:
+    from channel import LocalChannel
+    from scheduler import break_cycles, run_dag
+    manifest = read_yaml(manifest_path)
+    channel = Path(channel_root or manifest.get("channel_root", "/workspace/local-conda-channel/"))
+    ensure_dir(channel)
+    logs = log_dir or (REPO_ROOT / "workspace" / "logs")
+    ensure_dir(logs)
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    state = _load_index()
+    # builds run inside each recipes dir: pin relative executables (e.g. a stub ./conda-build) to our cwd
+    build_cmd = [_abs_if_local(x) for x in shlex.split(conda_build)]
+    index_cmd = [_abs_if_local(x) for x in shlex.split(conda_index)] if conda_index else None
+
+    # repodata.json loaded once; files dropped into the channel by hand are indexed here
+    ch = LocalChannel(channel)
+    ch.scan()
+    if index_cmd is None:
+        ch.save()
+    preexisting = len(ch.added)
+
+    plans: Dict[str, _BuildPlan] = {}
+    order: List[str] = []
+    for pkg in _named_packages(manifest):
+        name = pkg["name"]
+        base = _resolve_base_dir(name, state)
+        recdir = base / "recipes"
+        if not (recdir / "meta.yaml").is_file():
+            print(f"[ERROR] {name}: no generated recipe under {recdir}; run gen first")
+            raise SystemExit(2)
+        cname, version, bstring, deps = _recipe_info(recdir)
+        stem = f"{cname}-{version}-{bstring}"
+        sig = _build_sig(base)
+        sigfile = base / ".build_sig"
+        old_sig = sigfile.read_text(encoding="utf-8").strip() if sigfile.is_file() else None
+        if force:
+            action, reason = "build", "forced"
+        elif not ch.has_name(cname):
+            action, reason = "build", "channel missing package"
+        elif ch.has_artifact(stem) and old_sig == sig:
+            action, reason = "skip", "no changes and artifact already present"
+        else:
+            action, reason = "build", "changed" if ch.has_artifact(stem) else "artifact missing"
+        plans[name] = _BuildPlan(name, base, stem, sig, deps, action, reason)
+        order.append(name)
+
+    # conda package names may differ from manifest names (pythons variants share one); map both
+    by_cname: Dict[str, List[str]] = {}
+    for n, p in plans.items():
+        by_cname.setdefault(p.stem.rsplit("-", 2)[0], []).append(n)
+
+    def dep_nodes(n: str, d: str) -> List[str]:
+        # a dep with several variants: the one built for the same Python (-py<abi> suffix), else all of them
+        nodes = by_cname.get(d, [d])
+        same = [m for m in nodes if len(nodes) > 1 and m.rsplit("-", 1)[-1] == n.rsplit("-", 1)[-1]]
+        return same or nodes
+
+    deps_graph = {n: [m for d in p.deps for m in dep_nodes(n, d)] for n, p in plans.items()}
+    _graph, cyclic = break_cycles(order, deps_graph)
+    if cyclic:
+        print(f"[WARN] dependency cycle among {', '.join(cyclic)}; falling back to manifest order inside it")
+
+    durations: Dict[str, float] = {}
+    produced: Dict[str, List[Path]] = {}
+    published: set = set()
+    indexed: set = set()
+
+    def run_index() -> None:
+        if index_cmd is None:
+            indexed.update(published)
+            return
+        print(f"[INDEX] {' '.join(index_cmd)} {channel}")
+        sys.stdout.flush()
+        with open(logs / "_index.log", "ab") as lf:
+            rc = subprocess.call(index_cmd + [str(channel)], stdout=lf, stderr=subprocess.STDOUT)
+        if rc != 0:
+            print(f"[WARN] channel index exited with {rc}; see {logs / '_index.log'}")
+        indexed.update(published)
+
+    def before_start(name: str) -> None:
+        # dependents solve against the channel: make freshly built deps visible first
+        if plans[name].action == "build" and any(d in published and d not in indexed for d in _graph[name]):
+            run_index()
+
+    def build_one(name: str) -> bool:
+        plan = plans[name]
+        if plan.action == "skip":
+            print(f"[SKIP] {name} ({plan.reason})")
+            return True
+        print(f"[BUILD] {name} ({plan.reason}) log: {logs / (name + '.log')}")
+        sys.stdout.flush()
+        out_dir = Path(tempfile.mkdtemp(prefix=f".build-{name}-", dir=str(REPO_ROOT / "workspace")))
+        t0 = time.monotonic()
+        try:
+            with open(logs / f"{name}.log", "wb") as lf:
+                rc = subprocess.call(
+                    build_cmd + [".", "--override-channels", "-c", f"file://{channel}", "--output-folder", str(out_dir)],
+                    cwd=str(plan.base / "recipes"), stdout=lf, stderr=subprocess.STDOUT,
+                )
+            durations[name] = time.monotonic() - t0
+            if rc != 0:
+                print(f"[FAIL] {name}: conda-build exited with {rc} after {durations[name]:.1f}s; see {logs / (name + '.log')}")
+                return False
+            artifacts = _list_artifacts(out_dir)
+            produced[name] = []
+            for art in artifacts:
+                dest = channel / art.parent.relative_to(out_dir) / art.name
+                ensure_dir(dest.parent)
+                shutil.move(str(art), str(dest))
+                produced[name].append(dest)
+            (plan.base / ".build_sig").write_text(plan.sig + "\n", encoding="utf-8")
+            print(f"[OK] {name} built in {durations[name]:.1f}s ({len(artifacts)} artifact(s))")
+            return True
+        finally:
+            shutil.rmtree(out_dir, ignore_errors=True)
+
+    def on_done(name: str, ok: bool) -> None:
+        if ok and plans[name].action == "build":
+            published.add(name)
+            if index_cmd is None:
+                # runs on the scheduler thread: repodata is updated before any dependent starts
+                for art in produced.get(name, []):
+                    try:
+                        ch.add(art, replace=True)
+                    except Exception as exc:
+                        print(f"[WARN] cannot index {art}: {exc}")
+                written = ch.save()
+                if written:
+                    print(f"[INDEX] {name}: {', '.join(a.name for a in produced.get(name, []))} -> {', '.join(written)}")
+
+    t_start = time.monotonic()
+    status = run_dag(order, deps_graph, build_one, jobs=jobs, before_start=before_start, on_done=on_done)
+    wall = time.monotonic() - t_start
+    if published - indexed:
+        run_index()
+
+    added = sorted({str(p) for p in ch.added[preexisting:]} | {str(p) for arts in produced.values() for p in arts})
+    print("[SUMMARY] build")
+    for name in order:
+        st = status[name]
+        if st == "ok":
+            st = "built" if plans[name].action == "build" else "skipped"
+        print(f"  {name}: {st}")
+    print(f"  wall {wall:.1f}s, sum of builds {sum(durations.values()):.1f}s, jobs {jobs}")
+    print(f"  new artifacts: {len(added)}")
+    for a in added:
+        print(f"    {a}")
+    if any(v != "ok" for v in status.values()):
+        raise SystemExit(1)
+
+
+#作用：不经 conda-build，直接把 lib/bin/data 类包打成 .conda/.tar.bz2 并写入频道（布局与 build.lib.sh.j2 相同）。
+#跳过规则与 build 相同；其他 kind 需要 conda-build，打印 [SKIP]。--test 在临时前缀中运行 test.commands（不安装依赖）。
+#示例：python tools/debwrap.py pack --manifest manifest.yaml --rules rules.yaml -j 4 --test
+PACK_KINDS = {"lib", "bin", "data"}
+# packer.FORMATS / packer.DEFAULT_SUBDIR, spelled out so building the CLI does not import packer
+PACK_FORMATS = ("conda", "tar.bz2")
+PACK_SUBDIR = "linux-riscv64"
+
+
+def cmd_pack(manifest_path: Path, rules_path: Path, names: Optional[List[str]] = None, jobs: int = 1,
+             force: bool = False, fmt: str = "conda", level: int = 10, subdir: str = PACK_SUBDIR,
+             test: bool = False, channel_root: Optional[Path] = None, log_dir: Optional[Path] = None) -> None:
+    from concurrent.futures import ThreadPoolExecutor
+    from channel import LocalChannel
+    from debfile import DebError
+    from packer import PackError, pack_recipe, run_tests
+    manifest = read_yaml(manifest_path)
+    rules = read_yaml(rules_path)
+    map_run_deps = rules.get("map_run_deps", {}) or {}
+    channel = Path(channel_root or manifest.get("channel_root", "/workspace/local-conda-channel/"))
+    ensure_dir(channel)
+    logs = log_dir or (REPO_ROOT / "workspace" / "logs")
+    ensure_dir(logs)
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    state = _load_index()
+    ch = LocalChannel(channel)
+    ch.scan()
+
+    todo: List[Tuple[str, Path, Dict[str, Any], str]] = []
+    status: Dict[str, str] = {}
+    order: List[str] = []
+    for pkg in _named_packages(manifest):
+        name = pkg["name"]
+        if names and name not in names:
+            continue
+        order.append(name)
+        kind = pkg.get("kind", "lib")
+        if kind not in PACK_KINDS:
+            print(f"[SKIP] {name} (kind {kind} needs conda-build)")
+            status[name] = "needs conda-build"
+            continue
+        base = _resolve_base_dir(name, state)
+        recdir = base / "recipes"
+        if not (recdir / "meta.yaml").is_file():
+            print(f"[ERROR] {name}: no generated recipe under {recdir}; run gen first")
+            raise SystemExit(2)
+        meta = yaml.load((recdir / "meta.yaml").read_text(encoding="utf-8"), Loader=_BASE_LOADER) or {}
+        cname, version, bstring, _deps = _recipe_info(recdir)
+        stem = f"{cname}-{version}-{bstring}"
+        sig = _build_sig(base)
+        sigfile = base / ".build_sig"
+        old_sig = sigfile.read_text(encoding="utf-8").strip() if sigfile.is_file() else None
+        if not force and ch.has_artifact(f"{stem}.{fmt}") and old_sig == sig:
+            print(f"[SKIP] {name} (no changes and artifact already present)")
+            status[name] = "skipped"
+            continue
+        todo.append((name, base, meta, sig))
+
+    def pack_one(item: Tuple[str, Path, Dict[str, Any], str]) -> Tuple[str, Optional[Path], float, str]:
+        name, base, meta, sig = item
+        t0 = time.monotonic()
+        # like build: nothing reaches the channel unless packing (and --test) succeeded
+        out_dir = Path(tempfile.mkdtemp(prefix=f".build-{name}-", dir=str(REPO_ROOT / "workspace")))
+        try:
+            art = pack_recipe(base, meta, map_run_deps, out_dir, fmt=fmt, level=level, subdir=subdir,
+                              keep_payload=(out_dir / "prefix" if test else None))
+            if test:
+                ok, cmd = run_tests(meta, out_dir / "prefix", log=logs / f"{name}.test.log")
+                if not ok:
+                    return name, None, time.monotonic() - t0, f"test failed: {cmd}; see {logs / (name + '.test.log')}"
+            dest = channel / subdir / art.name
+            ensure_dir(dest.parent)
+            shutil.move(str(art), str(dest))
+            (base / ".build_sig").write_text(sig + "\n", encoding="utf-8")
+            return name, dest, time.monotonic() - t0, ""
+        except (PackError, DebError, OSError, subprocess.CalledProcessError) as exc:
+            return name, None, time.monotonic() - t0, str(exc)
+        finally:
+            shutil.rmtree(out_dir, ignore_errors=True)
+
+    t_start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(todo) or 1))) as pool:
+        for name, art, dur, err in pool.map(pack_one, todo):
+            if art is not None:
+                ch.add(art, replace=True)
+            if err:
+                print(f"[FAIL] {name}: {err}")
+                status[name] = "failed"
+            else:
+                print(f"[OK] {name} packed in {dur:.2f}s -> {art}")
+                status[name] = "packed"
+    written = ch.save()
+    if written:
+        print(f"[INDEX] {channel}: rewrote {', '.join(written)}")
+
+    print("[SUMMARY] pack")
+    for name in order:
+        print(f"  {name}: {status.get(name, '?')}")
+    print(f"  wall {time.monotonic() - t_start:.2f}s, jobs {jobs}")
+    if any(v == "failed" for v in status.values()):
+        raise SystemExit(1)
+
+
+#作用：增量索引本地频道：只读取 repodata.json 中尚未记录的产物的 info/index.json，删除已消失文件的条目。
+#示例：python tools/debwrap.py index --manifest manifest.yaml
+def cmd_index(channel: Path) -> None:
+    from channel import LocalChannel
+    t0 = time.monotonic()
+    ch = LocalChannel(channel)
+    ch.scan()
+    written = ch.save()
+    for a in ch.added:
+        print(f"[INDEX] + {a.relative_to(channel)}")
+    for r in ch.removed:
+        print(f"[INDEX] - {r}")
+    print(f"[INDEX] {channel}: {len(ch.artifacts())} artifact(s), {len(ch.added)} added, {len(ch.removed)} removed, "
+          f"rewrote {', '.join(written) or 'nothing'} in {time.monotonic() - t0:.2f}s")
+
+
+#作用：按 LRU 淘汰元数据缓存，直到总大小不超过 max_bytes。
+#示例：python tools/debwrap.py cache-prune --max-size 64M
+def cmd_cache_prune(cache_path: Path, max_bytes: int) -> None:
+    if not cache_path.exists():
+        print(f"[CACHE] no cache at {cache_path}")
+        return
+    cache = DebCache(cache_path)
+    try:
+        evicted, before, after = cache.prune(max_bytes)
+    finally:
+        cache.close()
+    print(f"[CACHE] evicted {evicted} entries: {before} -> {after} bytes (limit {max_bytes}) in {cache_path}")
 
 #作用：定义 gen 子命令及其参数；路由到 cmd_gen。
 
@@ -598,11 +2170,112 @@ def main() -> None:
     p_gen.add_argument("--rules", required=True, type=Path)
     p_gen.add_argument("--deb-src", required=False, type=Path, help="Directory containing source .deb files to copy from")
     p_gen.add_argument("--no-dso-scan", action="store_true", help="Disable DSO-based auto dependency mapping")
+    p_gen.add_argument("--jobs", "-j", type=int, default=1, help="Process packages in parallel with N workers (0 = CPU count)")
+    p_gen.add_argument("--cache", type=Path, default=DEFAULT_CACHE_PATH, help="Deb metadata cache (SQLite) location")
+    p_gen.add_argument("--no-cache", action="store_true", help="Do not read or write the deb metadata cache")
+    p_gen.add_argument("--stage", choices=STAGE_MODES, default="auto",
+                       help="How debs are placed into workspace: reflink/hardlink/symlink/copy (auto tries them in that order)")
+    p_gen.add_argument("--fetch-jobs", type=int, default=4, help="Concurrent downloads for packages with urls (default 4)")
+    p_gen.add_argument("--scan-mode", choices=["stream", "extract"], default="stream",
+                       help="DSO scan: stream data.tar in memory (default) or extract to a temp dir")
+
+    p_gen.add_argument("--force", action="store_true", help="Regenerate every package even if its inputs are unchanged")
+    p_gen.add_argument("--profile", type=Path, default=None, metavar="PATH",
+                       help="Write per-package/per-phase timings to PATH (JSON) and PATH's .trace.json (Chrome trace)")
+    p_gen.add_argument("--profile-top", type=int, default=10, help="How many slowest phases to print (default 10)")
+
+    p_plan = sub.add_parser("plan", help="Print the packages gen would regenerate (JSON), without generating")
+    p_plan.add_argument("--manifest", required=True, type=Path)
+    p_plan.add_argument("--rules", required=True, type=Path)
+    p_plan.add_argument("--deb-src", required=False, type=Path)
+    p_plan.add_argument("--no-dso-scan", action="store_true")
+    p_plan.add_argument("--cache", type=Path, default=DEFAULT_CACHE_PATH)
+    p_plan.add_argument("--no-cache", action="store_true")
+
+    p_query = sub.add_parser("query", help="Print manifest/workspace facts for shell scripts (JSON or TSV)")
+    p_query.add_argument("--manifest", required=True, type=Path)
+    p_query.add_argument("field", nargs="?", choices=QUERY_FIELDS, help="Print only this field")
+    p_query.add_argument("--format", choices=["json", "tsv"], default=None,
+                         help="Output format (default: json; tsv/plain text when a single field is asked for)")
+
+    p_watch = sub.add_parser("watch", help="Keep running; regenerate recipes affected by changed debs/manifest/rules/templates")
+    p_watch.add_argument("--manifest", required=True, type=Path)
+    p_watch.add_argument("--rules", required=True, type=Path)
+    p_watch.add_argument("--deb-src", required=False, type=Path, help="Pool directory to watch for new or replaced debs")
+    p_watch.add_argument("--no-dso-scan", action="store_true")
+    p_watch.add_argument("--jobs", "-j", type=int, default=1, help="Workers for large batches (default 1: in-process)")
+    p_watch.add_argument("--cache", type=Path, default=DEFAULT_CACHE_PATH)
+    p_watch.add_argument("--no-cache", action="store_true")
+    p_watch.add_argument("--stage", choices=STAGE_MODES, default="auto")
+    p_watch.add_argument("--scan-mode", choices=["stream", "extract"], default="stream")
+    p_watch.add_argument("--debounce", type=float, default=0.15, help="Quiet period before acting, seconds (default 0.15)")
+    p_watch.add_argument("--poll", action="store_true", help="Poll with stat() instead of inotify")
+    p_watch.add_argument("--poll-interval", type=float, default=1.0, help="Polling period, seconds (default 1)")
+
+    p_build = sub.add_parser("build", help="Run conda-build for generated recipes in dependency order, in parallel")
+    p_build.add_argument("--manifest", required=True, type=Path)
+    p_build.add_argument("--jobs", "-j", type=int, default=1, help="Concurrent conda-build processes (0 = CPU count)")
+    p_build.add_argument("--force", action="store_true", help="Build every package even if unchanged")
+    p_build.add_argument("--channel", type=Path, default=None, help="Override manifest channel_root")
+    p_build.add_argument("--conda-build", default=os.environ.get("CONDA_BUILD", "conda-build"),
+                         help="conda-build command (default: $CONDA_BUILD or conda-build)")
+    p_build.add_argument("--conda-index", default=os.environ.get("CONDA_INDEX") or None,
+                         help="External channel index command, e.g. 'conda index' (default: $CONDA_INDEX; "
+                              "unset = built-in incremental indexer)")
+    p_build.add_argument("--log-dir", type=Path, default=None, help="Per-package logs (default workspace/logs)")
+
+    p_pack = sub.add_parser("pack", help="Write .conda/.tar.bz2 for lib/bin/data packages directly (no conda-build)")
+    p_pack.add_argument("--manifest", required=True, type=Path)
+    p_pack.add_argument("--rules", required=True, type=Path)
+    p_pack.add_argument("names", nargs="*", help="Only these packages (default: all lib/bin/data entries)")
+    p_pack.add_argument("--jobs", "-j", type=int, default=1, help="Packages packed concurrently (0 = CPU count)")
+    p_pack.add_argument("--force", action="store_true", help="Repack even if unchanged")
+    p_pack.add_argument("--format", choices=PACK_FORMATS, default="conda", help="Artifact format (default conda)")
+    p_pack.add_argument("--zstd-level", type=int, default=10, help=".conda compression level (default 10)")
+    p_pack.add_argument("--subdir", default=PACK_SUBDIR, help=f"Channel subdir (default {PACK_SUBDIR})")
+    p_pack.add_argument("--test", action="store_true", help="Run test.commands against the packed files")
+    p_pack.add_argument("--channel", type=Path, default=None, help="Override manifest channel_root")
+    p_pack.add_argument("--log-dir", type=Path, default=None, help="Test logs (default workspace/logs)")
+
+    p_index = sub.add_parser("index", help="Incrementally update repodata.json of the local channel")
+    p_index.add_argument("--manifest", type=Path, default=None, help="Read channel_root from this manifest")
+    p_index.add_argument("--channel", type=Path, default=None, help="Channel directory (overrides the manifest)")
+
+    p_prune = sub.add_parser("cache-prune", help="Shrink the deb metadata cache (LRU eviction)")
+    p_prune.add_argument("--cache", type=Path, default=DEFAULT_CACHE_PATH)
+    p_prune.add_argument("--max-size", default="256M", help="Size limit, e.g. 512K, 64M, 1G (default 256M)")
 
     args = parser.parse_args()
 
     if args.cmd == "gen":
-        cmd_gen(args.manifest, args.rules, args.deb_src, enable_dso_scan=(not args.no_dso_scan))
+        cmd_gen(args.manifest, args.rules, args.deb_src, enable_dso_scan=(not args.no_dso_scan), jobs=args.jobs,
+                cache_path=(None if args.no_cache else args.cache), scan_mode=args.scan_mode,
+                fetch_jobs=args.fetch_jobs, stage_mode=args.stage, force=args.force,
+                profile_path=args.profile, profile_top=args.profile_top)
+    elif args.cmd == "plan":
+        cmd_plan(args.manifest, args.rules, args.deb_src, enable_dso_scan=(not args.no_dso_scan),
+                 cache_path=(None if args.no_cache else args.cache))
+    elif args.cmd == "query":
+        cmd_query(args.manifest, args.field, args.format or ("tsv" if args.field else "json"))
+    elif args.cmd == "watch":
+        cmd_watch(args.manifest, args.rules, args.deb_src, enable_dso_scan=(not args.no_dso_scan), jobs=args.jobs,
+                  cache_path=(None if args.no_cache else args.cache), scan_mode=args.scan_mode,
+                  stage_mode=args.stage, debounce=args.debounce, poll_interval=args.poll_interval,
+                  force_poll=args.poll)
+    elif args.cmd == "build":
+        cmd_build(args.manifest, jobs=args.jobs, force=args.force, conda_build=args.conda_build,
+                  conda_index=args.conda_index, channel_root=args.channel, log_dir=args.log_dir)
+    elif args.cmd == "pack":
+        cmd_pack(args.manifest, args.rules, names=args.names, jobs=args.jobs, force=args.force, fmt=args.format,
+                 level=args.zstd_level, subdir=args.subdir, test=args.test, channel_root=args.channel,
+                 log_dir=args.log_dir)
+    elif args.cmd == "index":
+        if args.channel is None and args.manifest is None:
+            parser.error("index: need --channel or --manifest")
+        channel = args.channel or Path(read_yaml(args.manifest).get("channel_root", "/workspace/local-conda-channel/"))
+        cmd_index(channel)
+    elif args.cmd == "cache-prune":
+        cmd_cache_prune(args.cache, parse_size(args.max_size))
     else:  # pragma: no cover
         parser.error("unknown command")
 
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Minimal ELF dynamic-section reader (replacement for parsing `readelf -d` output).
+
+Supports ELF32/ELF64 in either byte order. Only the program headers and the
+PT_DYNAMIC segment are read, so this works on stripped binaries too.
+
+Usage:
+  info = read_dynamic(Path("usr/lib/riscv64-linux-gnu/libX11.so.6.4.0"))
+  if info is not None:
+      info.needed   # ['libxcb.so.1', 'libc.so.6']
+      info.soname   # 'libX11.so.6'
+      info.runpath  # []
+"""
+
+import mmap
+import struct
+from pathlib import Path
+from typing import IO, List, NamedTuple, Optional, Tuple, Union
+
+ELF_MAGIC = b"\x7fELF"
+
+PT_LOAD = 1
+PT_DYNAMIC = 2
+
+DT_NULL = 0
+DT_NEEDED = 1
+DT_STRTAB = 5
+DT_STRSZ = 10
+DT_SONAME = 14
+DT_RPATH = 15
+DT_RUNPATH = 29
+
+
+class DynamicInfo(NamedTuple):
+    needed: List[str]
+    soname: Optional[str]
+    rpath: List[str]
+    runpath: List[str]
+
+
+Buffer = Union[bytes, bytearray, mmap.mmap]
+
+
+def is_elf(head: bytes) -> bool:
+    return head[:4] == ELF_MAGIC
+
+
+def _cstr(buf: Buffer, off: int, limit: int) -> str:
+    end = buf.find(b"\x00", off, limit)
+    if end < 0:
+        end = limit
+    return bytes(buf[off:end]).decode("utf-8", errors="replace")
+
+
+def parse_dynamic(buf: Union[Buffer, memoryview]) -> Optional[DynamicInfo]:
+    """Parse the dynamic section from an in-memory ELF image.
+    Returns None when buf is not ELF or is malformed; an empty DynamicInfo for static objects.
+    """
+    if isinstance(buf, memoryview):
+        buf = buf.tobytes()
+    try:
+        return _parse_dynamic(buf)
+    except struct.error:
+        return None
+
+
+class _Header(NamedTuple):
+    is64: bool
+    bo: str
+    phoff: int
+    phentsize: int
+    phnum: int
+
+
+def _header(buf: Buffer) -> Optional[_Header]:
+    if len(buf) < 52 or bytes(buf[:4]) != ELF_MAGIC:
+        return None
+    ei_class, ei_data = buf[4], buf[5]
+    if ei_data == 1:
+        bo = "<"
+    elif ei_data == 2:
+        bo = ">"
+    else:
+        return None
+    if ei_class == 2:
+        if len(buf) < 64:
+            return None
+        e_phoff, = struct.unpack_from(bo + "Q", buf, 32)
+        e_phentsize, e_phnum = struct.unpack_from(bo + "HH", buf, 54)
+        if e_phentsize < 40:
+            return None
+        return _Header(True, bo, e_phoff, e_phentsize, e_phnum)
+    if ei_class == 1:
+        e_phoff, = struct.unpack_from(bo + "I", buf, 28)
+        e_phentsize, e_phnum = struct.unpack_from(bo + "HH", buf, 42)
+        if e_phentsize < 24:
+            return None
+        return _Header(False, bo, e_phoff, e_phentsize, e_phnum)
+    return None
+
+
+def _segments(buf: Buffer, hdr: _Header) -> Tuple[List[Tuple[int, int, int]], Optional[Tuple[int, int]]]:
+    """Return PT_LOAD (vaddr, offset, filesz) triples and the PT_DYNAMIC (offset, filesz)."""
+    loads: List[Tuple[int, int, int]] = []
+    dyn: Optional[Tuple[int, int]] = None
+    ph_fmt = hdr.bo + ("IIQQQQ" if hdr.is64 else "IIIIII")
+    for i in range(hdr.phnum):
+        fields = struct.unpack_from(ph_fmt, buf, hdr.phoff + i * hdr.phentsize)
+        if hdr.is64:
+            p_type, _flags, p_offset, p_vaddr, _paddr, p_filesz = fields
+        else:
+            p_type, p_offset, p_vaddr, _paddr, p_filesz, _memsz = fields
+        if p_type == PT_LOAD:
+            loads.append((p_vaddr, p_offset, p_filesz))
+        elif p_type == PT_DYNAMIC:
+            dyn = (p_offset, p_filesz)
+    return loads, dyn
+
+
+def _dyn_entries(buf: Buffer, hdr: _Header, dyn: Tuple[int, int]) -> Tuple[Optional[int], int, List[Tuple[int, int]]]:
+    """Walk the dynamic array. Returns (DT_STRTAB vaddr, DT_STRSZ, string-valued entries)."""
+    dyn_fmt = hdr.bo + ("qQ" if hdr.is64 else "iI")
+    ent = struct.calcsize(dyn_fmt)
+    d_off, d_size = dyn
+    d_end = min(d_off + d_size, len(buf))
+    entries: List[Tuple[int, int]] = []
+    strtab_vaddr: Optional[int] = None
+    strsz = 0
+    off = d_off
+    while off + ent <= d_end:
+        tag, val = struct.unpack_from(dyn_fmt, buf, off)
+        off += ent
+        if tag == DT_NULL:
+            break
+        if tag == DT_STRTAB:
+            strtab_vaddr = val
+        elif tag == DT_STRSZ:
+            strsz = val
+        elif tag in (DT_NEEDED, DT_SONAME, DT_RPATH, DT_RUNPATH):
+            entries.append((tag, val))
+    return strtab_vaddr, strsz, entries
+
+
+def _vaddr_to_offset(loads: List[Tuple[int, int, int]], vaddr: int) -> Optional[int]:
+    for seg_vaddr, offset, filesz in loads:
+        if seg_vaddr <= vaddr < seg_vaddr + filesz:
+            return vaddr - seg_vaddr + offset
+    return None
+
+
+def _parse_dynamic(buf: Buffer) -> Optional[DynamicInfo]:
+    size = len(buf)
+    hdr = _header(buf)
+    if hdr is None or hdr.phoff + hdr.phnum * hdr.phentsize > size:
+        return None
+    loads, dyn = _segments(buf, hdr)
+    if dyn is None:
+        return DynamicInfo([], None, [], [])
+    strtab_vaddr, strsz, entries = _dyn_entries(buf, hdr, dyn)
+    if strtab_vaddr is None:
+        return DynamicInfo([], None, [], [])
+
+    # Translate the string table's virtual address to a file offset via PT_LOAD
+    str_off = _vaddr_to_offset(loads, strtab_vaddr)
+    if str_off is None or str_off >= size:
+        return None
+    str_end = min(str_off + strsz, size) if strsz else size
+
+    needed: List[str] = []
+    soname: Optional[str] = None
+    rpath: List[str] = []
+    runpath: List[str] = []
+    for tag, val in entries:
+        if str_off + val >= str_end:
+            continue
+        s = _cstr(buf, str_off + val, str_end)
+        if tag == DT_NEEDED:
+            needed.append(s)
+        elif tag == DT_SONAME:
+            soname = s
+        elif tag == DT_RPATH:
+            rpath.extend(x for x in s.split(":") if x)
+        else:
+            runpath.extend(x for x in s.split(":") if x)
+    return DynamicInfo(needed, soname, rpath, runpath)
+
+
+def _required_prefix(buf: Buffer) -> int:
+    """How many leading bytes of the file parse_dynamic needs, given what buf already holds."""
+    hdr = _header(buf)
+    if hdr is None:
+        return 64
+    ph_end = hdr.phoff + hdr.phnum * hdr.phentsize
+    if len(buf) < ph_end:
+        return ph_end
+    loads, dyn = _segments(buf, hdr)
+    if dyn is None:
+        return len(buf)
+    dyn_end = dyn[0] + dyn[1]
+    if len(buf) < dyn_end:
+        return dyn_end
+    strtab_vaddr, strsz, _ = _dyn_entries(buf, hdr, dyn)
+    str_off = _vaddr_to_offset(loads, strtab_vaddr) if strtab_vaddr is not None else None
+    if str_off is None:
+        return len(buf)
+    return max(len(buf), str_off + strsz)
+
+
+def read_dynamic_stream(fobj: IO[bytes], limit: int = 64 << 20) -> Optional[DynamicInfo]:
+    """Read dynamic info from a forward-only stream (e.g. a tar member being decompressed).
+    Reads the 4-byte magic first, then only as many leading bytes as the program headers,
+    the dynamic segment and the string table require (capped at limit).
+    """
+    buf = bytearray(fobj.read(4))
+    if bytes(buf) != ELF_MAGIC:
+        return None
+    try:
+        need = 64
+        while True:
+            while len(buf) < need:
+                chunk = fobj.read(need - len(buf))
+                if not chunk:
+                    break
+                buf += chunk
+            if len(buf) < need:
+                break  # truncated file; parse what we have
+            nxt = min(_required_prefix(buf), limit)
+            if nxt <= len(buf):
+                break
+            need = nxt
+    except struct.error:
+        return None
+    return parse_dynamic(buf)
+
+
+def read_dynamic(path: Path) -> Optional[DynamicInfo]:
+    """Read dynamic info from a file on disk using mmap.
+    Non-ELF files are rejected after reading only the 4-byte magic.
+    """
+    try:
+        with open(path, "rb") as f:
+            if f.read(4) != ELF_MAGIC:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return parse_dynamic(mm)
+    except (OSError, ValueError):
+        return None
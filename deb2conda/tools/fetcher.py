@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Concurrent, resumable, checksum-verified downloader for .deb files.
+
+- a bounded thread pool works through all jobs at once;
+- each worker keeps one keep-alive connection per (scheme, host, port);
+- partial downloads (<dest>.part) are resumed with an HTTP Range request;
+- an optional sha256 pin is verified while streaming, otherwise a validator
+  callback (e.g. "is this a parseable .deb") decides whether to keep the file;
+- one download per destination across threads and processes (flock files live in
+  lock_dir, default <tmp>/deb2conda-fetch-locks, never next to the debs).
+
+Usage:
+  jobs = [FetchJob(Path("pool/jq_1.7.1-6_riscv64.deb"), ["https://.../jq_1.7.1-6_riscv64.deb"], sha256=None)]
+  results = fetch_all(jobs, workers=4)   # {dest: True/False}
+  fetch_all(jobs, lock_dir=Path("workspace/.locks"))
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import http.client
+import os
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+USER_AGENT = "deb2conda-debwrap/1"
+CHUNK = 1 << 16
+MAX_REDIRECTS = 5
+
+
+class FetchJob(NamedTuple):
+    dest: Path
+    urls: List[str]  # mirrors, tried in order
+    sha256: Optional[str] = None
+
+
+class FetchError(Exception):
+    pass
+
+
+class _Connections(threading.local):
+    """Per-thread keep-alive connections keyed by (scheme, host, port)."""
+
+    def __init__(self) -> None:
+        self.pool: Dict[Tuple[str, str, int], http.client.HTTPConnection] = {}
+
+
+_local = _Connections()
+
+
+def _connection(scheme: str, host: str, port: int, timeout: float) -> http.client.HTTPConnection:
+    key = (scheme, host, port)
+    conn = _local.pool.get(key)
+    if conn is not None:
+        return conn
+    proxy = urllib.request.getproxies().get(scheme)
+    if proxy and not urllib.request.proxy_bypass(host):
+        p = urlsplit(proxy if "://" in proxy else f"http://{proxy}")
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(p.hostname or "", p.port or 80, timeout=timeout)
+            conn.set_tunnel(host, port)
+        else:
+            conn = http.client.HTTPConnection(p.hostname or "", p.port or 80, timeout=timeout)
+            conn._deb2conda_proxied = True  # type: ignore[attr-defined]
+    elif scheme == "https":
+        conn = http.client.HTTPSConnection(host, port, timeout=timeout)
+    else:
+        conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    _local.pool[key] = conn
+    return conn
+
+
+def _drop_connection(scheme: str, host: str, port: int) -> None:
+    conn = _local.pool.pop((scheme, host, port), None)
+    if conn is not None:
+        conn.close()
+
+
+def _request(url: str, headers: Dict[str, str], timeout: float) -> Tuple[http.client.HTTPResponse, str]:
+    """GET url on a pooled connection, following redirects. Returns (response, final url)."""
+    for _ in range(MAX_REDIRECTS + 1):
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ("http", "https"):
+            raise FetchError(f"unsupported scheme: {url}")
+        host = parts.hostname or ""
+        port = parts.port or (443 if scheme == "https" else 80)
+        conn = _connection(scheme, host, port, timeout)
+        target = url if getattr(conn, "_deb2conda_proxied", False) else (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        hdrs = {"Host": parts.netloc, "User-Agent": USER_AGENT, "Connection": "keep-alive"}
+        hdrs.update(headers)
+        try:
+            conn.request("GET", target, headers=hdrs)
+            resp = conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            # stale keep-alive socket: reconnect once before counting it as a failed attempt
+            _drop_connection(scheme, host, port)
+            conn = _connection(scheme, host, port, timeout)
+            conn.request("GET", target, headers=hdrs)
+            resp = conn.getresponse()
+        if resp.will_close:
+            _local.pool.pop((scheme, host, port), None)
+        if resp.status in (301, 302, 303, 307, 308):
+            location = resp.getheader("Location")
+            resp.read()
+            if not location:
+                raise FetchError(f"redirect without Location from {url}")
+            url = urljoin(url, location)
+            continue
+        return resp, url
+    raise FetchError(f"too many redirects: {url}")
+
+
+def _download_once(url: str, part: Path, timeout: float) -> str:
+    """Download url into part, resuming from its current size when the server allows it.
+    Returns the sha256 of the complete part file, computed while streaming.
+    """
+    offset = part.stat().st_size if part.exists() else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    resp, final_url = _request(url, headers, timeout)
+    try:
+        if resp.status == 416 and offset:
+            # Range not satisfiable: our partial file is already complete (or bogus); let verification decide
+            resp.read()
+            return _sha256_of(part)
+        if resp.status == 200:
+            offset = 0  # server ignored Range; start over
+        elif resp.status != 206:
+            raise FetchError(f"HTTP {resp.status} {resp.reason} for {final_url}")
+        h = hashlib.sha256()
+        with open(part, "r+b" if offset else "wb") as out:
+            # bytes kept from an earlier attempt are hashed once, new bytes as they arrive
+            remaining = offset
+            while remaining > 0:
+                chunk = out.read(min(CHUNK, remaining))
+                if not chunk:
+                    break
+                h.update(chunk)
+                remaining -= len(chunk)
+            out.seek(offset)
+            out.truncate()
+            while True:
+                chunk = resp.read(CHUNK)
+                if not chunk:
+                    break
+                h.update(chunk)
+                out.write(chunk)
+        length = resp.getheader("Content-Length")
+        if length is not None and part.stat().st_size != offset + int(length):
+            raise FetchError(f"short read from {final_url}")
+        return h.hexdigest()
+    finally:
+        resp.close()
+
+
+def _sha256_of(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _verify(path: Path, sha256: Optional[str], validate: Optional[Callable[[Path], bool]],
+            digest: Optional[str] = None) -> Tuple[bool, str]:
+    if sha256:
+        digest = digest or _sha256_of(path)
+        if digest.lower() != sha256.lower():
+            return False, f"sha256 mismatch (got {digest})"
+        return True, ""
+    if validate is not None and not validate(path):
+        return False, "invalid file"
+    return True, ""
+
+
+def fetch_one(job: FetchJob, tries: int = 4, backoff_s: float = 1.5, timeout: float = 60.0,
+              validate: Optional[Callable[[Path], bool]] = None, log: Callable[[str], None] = print,
+              lock_dir: Optional[Path] = None) -> bool:
+    """Fetch job.dest from its mirrors with retries and Range resume. Returns True on success."""
+    dest = job.dest
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    part = dest.with_name(f".{dest.name}.part")
+    with _dest_lock(dest, lock_dir):
+        # another worker/process may have finished it while we waited for the lock
+        if dest.exists() and _verify(dest, job.sha256, validate)[0]:
+            return True
+        for attempt in range(1, max(1, tries) + 1):
+            for url in job.urls:
+                try:
+                    digest = _download_once(url, part, timeout)
+                    ok, why = _verify(part, job.sha256, validate, digest)
+                    if ok:
+                        os.replace(part, dest)
+                        log(f"[FETCH] ok {url} -> {dest}")
+                        return True
+                    log(f"[FETCH] {why} after download, removing: {part}")
+                    part.unlink(missing_ok=True)
+                except Exception as exc:
+                    log(f"[FETCH] attempt {attempt} failed: {url} ({exc})")
+            if attempt < tries:
+                time.sleep(backoff_s * attempt)
+    return False
+
+
+# 同一目标文件（例如多个包引用同一个 url）只允许一个线程/进程下载。
+# 锁文件放在 lock_dir 里（按目标绝对路径取名），不往 --deb-src 目录里留隐藏文件；
+# 锁文件不删除：删掉后新进程会在新 inode 上加锁，和仍持有旧锁的进程同时下载。
+_dest_locks: Dict[str, threading.Lock] = {}
+_dest_locks_guard = threading.Lock()
+DEFAULT_LOCK_DIR = Path(tempfile.gettempdir()) / "deb2conda-fetch-locks"
+
+
+@contextlib.contextmanager
+def _dest_lock(dest: Path, lock_dir: Optional[Path] = None) -> Iterator[None]:
+    key = str(dest.resolve())
+    with _dest_locks_guard:
+        tlock = _dest_locks.setdefault(key, threading.Lock())
+    lock_dir = lock_dir or DEFAULT_LOCK_DIR
+    lock_dir.mkdir(parents=True, exist_ok=True)
+    lock_path = lock_dir / f"{hashlib.sha256(key.encode()).hexdigest()[:16]}-{dest.name}.lock"
+    with tlock, open(lock_path, "w") as lf:
+        fcntl.flock(lf, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lf, fcntl.LOCK_UN)
+
+
+def fetch_all(jobs: List[FetchJob], workers: int = 4, tries: int = 4, backoff_s: float = 1.5, timeout: float = 60.0,
+              validate: Optional[Callable[[Path], bool]] = None,
+              skip_existing: bool = True, lock_dir: Optional[Path] = None) -> Dict[Path, bool]:
+    """Run jobs on a bounded thread pool. Existing dest files that pass verification are skipped."""
+    results: Dict[Path, bool] = {}
+    todo: List[FetchJob] = []
+    for job in jobs:
+        if skip_existing and job.dest.exists() and _verify(job.dest, job.sha256, validate)[0]:
+            print(f"[FETCH] skip existing valid {job.dest}")
+            results[job.dest] = True
+        else:
+            todo.append(job)
+    if not todo:
+        return results
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(todo)))) as pool:
+        futures = {pool.submit(fetch_one, job, tries, backoff_s, timeout, validate, print, lock_dir): job
+                   for job in todo}
+        for fut, job in futures.items():
+            try:
+                results[job.dest] = fut.result()
+            except Exception as exc:  # pragma: no cover - fetch_one handles its own errors
+                print(f"[FETCH] {job.dest} failed: {exc}")
+                results[job.dest] = False
+    return results
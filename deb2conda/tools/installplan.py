@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Install plans for build.sh: which extracted deb path goes to which $PREFIX path.
+
+The copy rules of templates/build.sh.j2 used to run at build time as a chain of
+`find` calls over the extracted tree. They only depend on the member names of
+the package's debs, so gen evaluates them once (the member lists come from the
+metadata cache) and writes the result next to the recipe. build.sh then copies
+each (source root, destination root) group with one tar pipe.
+
+Plan file (recipes/install_plan.tsv), one member per line, grouped by root pair:
+  <source root, relative to the extracted debs> TAB <destination root, relative to $PREFIX> TAB <path>
+
+Usage:
+  members = merge_members(member_lists)          # one [[path, type, link], ...] per deb, see member_row
+  plan, warnings = install_plan("python_ext", "3.12", "312", members)
+  write_plan(out_dir / PLAN_FILE, plan, name)
+"""
+
+import fnmatch
+import posixpath
+import re
+import tarfile
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+PLAN_FILE = "install_plan.tsv"
+
+# (type, link target); type is "d" (directory), "f" (regular file or hard link), "l" (symlink)
+Member = Tuple[str, str]
+Entry = Tuple[str, str, str]  # (source root, destination root, relative path)
+
+# foo.cpython-312-riscv64-linux-gnu.so -> "312" (abi3 and untagged modules do not match)
+_EXT_ABI = re.compile(r"\.cpython-(\d+)[a-z]*-[^/]*\.so$")
+
+
+def member_row(info: tarfile.TarInfo) -> Optional[List[str]]:
+    """[path, type, link target] for one data.tar member (None for the root and special files)."""
+    name = info.name.rstrip("/")
+    if not name:
+        return None
+    if info.isdir():
+        return [name, "d", ""]
+    if info.issym():
+        return [name, "l", info.linkname]
+    if info.isfile() or info.islnk():
+        return [name, "f", ""]
+    return None
+
+
+def merge_members(lists: Iterable[List[List[str]]]) -> Dict[str, Member]:
+    """Overlay member lists in extraction order (a later deb wins, as with repeated `dpkg-deb -x`)."""
+    merged: Dict[str, Member] = {}
+    for members in lists:
+        for path, kind, link in members:
+            merged[path] = (kind, link)
+    return merged
+
+
+def _dfs_key(path: str) -> List[str]:
+    # pre-order walk with sorted directory entries, i.e. a deterministic `find`
+    return path.split("/")
+
+
+class _Tree:
+    def __init__(self, members: Dict[str, Member]) -> None:
+        self.members = members
+        self.dirs = {p for p, (k, _) in members.items() if k == "d"}
+        for p in members:
+            parent = posixpath.dirname(p)
+            while parent and parent not in self.dirs:
+                self.dirs.add(parent)
+                parent = posixpath.dirname(parent)
+        self.ordered_dirs = sorted(self.dirs, key=_dfs_key)
+        self.ordered_files = sorted((p for p, (k, _) in members.items() if k == "f"), key=_dfs_key)
+
+    # `find "$work" -type d -path PATTERN | head -n1`; "*" matches across "/" like find's -path
+    def first_dir(self, pattern: str) -> Optional[str]:
+        return next((d for d in self.ordered_dirs if fnmatch.fnmatchcase("/w/" + d, pattern)), None)
+
+    def files(self, pattern: str, name_only: bool = False) -> List[str]:
+        if name_only:
+            return [p for p in self.ordered_files if fnmatch.fnmatchcase(posixpath.basename(p), pattern)]
+        return [p for p in self.ordered_files if fnmatch.fnmatchcase("/w/" + p, pattern)]
+
+    def below(self, root: str) -> List[str]:
+        """Non-directory members under root, relative to it (what `tar -cf - .` in root would carry)."""
+        prefix = root + "/"
+        return [p[len(prefix):] for p, (k, _) in self.members.items() if k != "d" and p.startswith(prefix)]
+
+
+class _Plan:
+    def __init__(self) -> None:
+        self.by_dst: Dict[str, Entry] = {}
+
+    def copy_tree(self, tree: _Tree, src: Optional[str], dst: str) -> None:
+        if src is None or src not in tree.dirs:
+            return
+        for rel in tree.below(src):
+            self.by_dst[f"{dst}/{rel}"] = (src, dst, rel)
+
+    def install(self, src: str, dst_dir: str) -> None:
+        base = posixpath.basename(src)
+        self.by_dst[f"{dst_dir}/{base}"] = (posixpath.dirname(src), dst_dir, base)
+
+    def entries(self) -> List[Entry]:
+        groups: Dict[Tuple[str, str], List[str]] = {}
+        for src, dst, rel in self.by_dst.values():
+            groups.setdefault((src, dst), []).append(rel)
+        return [(src, dst, rel) for (src, dst), rels in groups.items() for rel in sorted(rels)]
+
+
+def install_plan(kind: str, pyver: str, pyabi: str, members: Dict[str, Member],
+                 abi_only: bool = False) -> Tuple[List[Entry], List[str]]:
+    """Evaluate the copy rules of build.sh.j2 for one package. Returns (entries, warnings).
+    abi_only drops python_ext extension modules built for another CPython ABI (a deb built for
+    several Pythons carries one module per ABI; each pythons variant keeps its own).
+    """
+    tree = _Tree(members)
+    plan = _Plan()
+    warnings: List[str] = []
+    py = f"lib/python{pyver}"
+
+    if kind in ("lib", "bin", "data"):
+        for sub in ("bin", "lib", "include", "share"):
+            plan.copy_tree(tree, f"usr/{sub}", sub)
+
+    elif kind == "python_core":
+        plan.copy_tree(tree, "usr/bin", "bin")
+        plan.copy_tree(tree, "usr/include", "include")
+        plan.copy_tree(tree, f"usr/lib/python{pyver}", py)
+        # multiarch layout: /usr/lib/<triplet>/python$PY (at most two levels below usr/lib)
+        arch_py = next((d for d in tree.ordered_dirs if d.count("/") == 3
+                        and fnmatch.fnmatchcase(d, f"usr/lib/*-linux-gnu/python{pyver}")), None)
+        plan.copy_tree(tree, arch_py, py)
+        dyn = f"{py}/lib-dynload"
+        for m in ("_ssl", "_hashlib"):
+            candidates = (tree.files(f"*/lib/python{pyver}/lib-dynload/{m}.cpython-{pyabi}-*.so")
+                          or tree.files(f"*/lib/*-linux-gnu/python{pyver}/{m}.cpython-{pyabi}-*.so")
+                          or tree.files(f"{m}.cpython-*.so", name_only=True)
+                          or tree.files(f"{m}*.so", name_only=True))
+            if candidates:
+                plan.install(candidates[0], dyn)
+            else:
+                warnings.append(f"no {m} extension module in the debs (build.sh will fail)")
+
+    elif kind == "python_ext":
+        sp = f"{py}/site-packages"
+        plan.copy_tree(tree, tree.first_dir(f"*/lib/python{pyver}/site-packages"), sp)
+        # Debian's /usr/lib/python3/dist-packages and /usr/lib/python$PY/dist-packages
+        plan.copy_tree(tree, tree.first_dir("*/lib/python3/dist-packages"), sp)
+        plan.copy_tree(tree, tree.first_dir(f"*/lib/python{pyver}/dist-packages"), sp)
+        for so in tree.files(f"*/lib/python{pyver}/lib-dynload/*.so"):
+            plan.install(so, f"{py}/lib-dynload")
+        # distributions that hang packages directly under some .../dist-packages/<pkg>
+        d2 = tree.first_dir("*/dist-packages/*")
+        if d2 is not None:
+            plan.copy_tree(tree, posixpath.dirname(d2), sp)
+        if abi_only:
+            abi_of = {dst: m.group(1) for dst, m in ((d, _EXT_ABI.search(d)) for d in plan.by_dst) if m}
+            abis = set(abi_of.values())
+            if abis and pyabi not in abis:
+                warnings.append(f"no cpython-{pyabi} extension modules in the debs (found {', '.join(sorted(abis))})")
+            plan.by_dst = {dst: e for dst, e in plan.by_dst.items() if abi_of.get(dst, pyabi) == pyabi}
+
+    return plan.entries(), warnings
+
+
+def write_plan(path: Path, entries: List[Entry], name: str) -> None:
+    lines = [f"# install plan for {name} (generated by debwrap gen): source root, $PREFIX root, path"]
+    lines += [f"{src}\t{dst}\t{rel}" for src, dst, rel in entries]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Which package installs which $PREFIX path, computed from deb member lists.
+
+gen lays out every package of the manifest on paper (the same copies and
+symlinks the build templates perform), drops the SONAMEs that map_run_deps
+assigns to another package, and records the result per path:
+  - two packages installing the same path is a clobber, reported before any build;
+  - the dropped paths become the recipe's exact exclude list (recipes/exclude.txt),
+    so build.sh / pack remove them directly instead of globbing every
+    map_run_deps entry over $PREFIX/lib;
+  - the DT_SONAMEs of installed libraries say which package provides which
+    SONAME, so run deps do not depend on map_run_deps listing every library;
+    NEEDED entries nobody provides are reported before anything is built.
+
+Usage:
+  paths = prefix_paths("lib", "libx11", members)              # {path: "f" | "l"}
+  drop = foreign_sonames(paths, "libx11", rules["map_run_deps"])
+  index = OwnershipIndex(); index.add("libx11", paths); index.clobbers()
+  providers, conflicts = soname_providers({"libx11": paths}, {"libx11": ["libX11.so.6"]})
+  unresolved_needed({"libxcb.so.1": "usr/lib/libX11.so.6"}, ["libX11.so.6"], providers, ["libxcb*"])
+"""
+
+import fnmatch
+import posixpath
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+EXCLUDE_FILE = "exclude.txt"
+LIB_DIRS = ("bin", "lib", "include", "share")  # build.lib.sh.j2: usr/<d> -> $PREFIX/<d>
+
+Member = Tuple[str, str]  # (type, link target), see installplan.merge_members
+
+
+def _exists(path: str, members: Dict[str, Member], depth: int = 0) -> bool:
+    """`[ -e path ]` inside the extracted tree: follows relative symlinks; absolute ones count as present."""
+    m = members.get(path)
+    if m is None or depth > 16:
+        return m is not None
+    kind, link = m
+    if kind != "l":
+        return True
+    if link.startswith("/"):
+        return True
+    return _exists(posixpath.normpath(posixpath.join(posixpath.dirname(path), link)), members, depth + 1)
+
+
+def _lib_layout(members: Dict[str, Member]) -> Dict[str, str]:
+    paths: Dict[str, str] = {}
+    for path, (kind, _) in members.items():
+        top, _, rest = path.partition("/")
+        if top != "usr" or kind == "d":
+            continue
+        d, _, rel = rest.partition("/")
+        if d in LIB_DIRS and rel:
+            paths[f"{d}/{rel}"] = kind
+    # lib/<so> -> <multiarch>/<so> links for lib/*-linux-gnu/*.so* (unless lib/<so> exists)
+    for path in sorted(paths):
+        parts = path.split("/")
+        if len(parts) != 3 or parts[0] != "lib" or not fnmatch.fnmatchcase(parts[1], "*-linux-gnu"):
+            continue
+        so = parts[2]
+        if so.startswith(".") or not fnmatch.fnmatchcase(so, "*.so*") or f"lib/{so}" in paths:
+            continue
+        if _exists(f"usr/{path}", members):
+            paths[f"lib/{so}"] = "l"
+    return paths
+
+
+def prefix_paths(kind: str, name: str, members: Dict[str, Member],
+                 plan: Optional[List[Tuple[str, str, str]]] = None, pyver: str = "",
+                 extras: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
+    """Paths (relative to $PREFIX) the package's build.sh creates, before exclusion.
+    lib/bin/data follow build.lib.sh.j2; other kinds use their install plan (build.sh.j2).
+    """
+    if kind in ("lib", "bin", "data") or plan is None:
+        paths = _lib_layout(members)
+    else:
+        paths = {}
+        for src, dst, rel in plan:
+            paths[f"{dst}/{rel}"] = members.get(f"{src}/{rel}", ("f", ""))[0]
+        if kind == "python_core" and pyver:
+            paths.setdefault(f"lib/python{pyver}/sitecustomize.py", "f")
+        if "lib/libopenblas.so.0" in paths:
+            for flag, alias in (("blas_alias", "lib/libblas.so.3"), ("lapack_alias", "lib/liblapack.so.3")):
+                if (extras or {}).get(flag):
+                    paths[alias] = "l"
+    paths[f"etc/conda/activate.d/{name}_activate.sh"] = "f"
+    paths[f"etc/conda/deactivate.d/{name}_deactivate.sh"] = "f"
+    return paths
+
+
+def _is_lib_dir(d: str) -> bool:
+    """lib/ or lib/*-linux-gnu/ under $PREFIX, where the templates look for SONAMEs."""
+    return d == "lib" or (d.startswith("lib/") and "/" not in d[4:] and fnmatch.fnmatchcase(d[4:], "*-linux-gnu"))
+
+
+def foreign_sonames(paths: Iterable[str], name: str, map_run_deps: Optional[Dict[str, Any]]) -> List[str]:
+    """Paths in lib/ or lib/*-linux-gnu/ named <dso> or <dso>.* where map_run_deps gives dso to another package.
+    Same selection as the former `rm -f lib/<dso> lib/<dso>.*` loops, in one pass over the package's paths.
+    """
+    foreign = {str(dso) for dso, mapped in (map_run_deps or {}).items() if str(mapped).split(" ")[0] != name}
+    if not foreign:
+        return []
+    out: List[str] = []
+    for path in paths:
+        d, _, base = path.rpartition("/")
+        if not _is_lib_dir(d):
+            continue
+        # base is "<dso>" or "<dso>.<anything>": try every prefix that ends right before a dot
+        if base in foreign or any(base[:i] in foreign for i, ch in enumerate(base) if ch == "."):
+            out.append(path)
+    return sorted(out)
+
+
+def soname_providers(paths_of: Dict[str, Dict[str, str]],
+                     sonames_of: Dict[str, Iterable[str]]) -> Tuple[Dict[str, str], Dict[str, List[str]]]:
+    """SONAME -> package, from the DT_SONAME of each package's ELF files.
+    A package provides a SONAME only if it installs a file of that name in lib/ or lib/*-linux-gnu/
+    (paths_of is the layout after exclusion). The first package in manifest order wins;
+    returns (providers, {soname: [all candidate packages]} for SONAMEs with more than one).
+    """
+    providers: Dict[str, str] = {}
+    candidates: Dict[str, List[str]] = {}
+    for name, paths in paths_of.items():
+        installed = {p.rpartition("/")[2] for p in paths if _is_lib_dir(p.rpartition("/")[0])}
+        for so in sorted(set(sonames_of.get(name, ())) & installed):
+            providers.setdefault(so, name)
+            candidates.setdefault(so, []).append(name)
+    return providers, {so: names for so, names in candidates.items() if len(names) > 1}
+
+
+# provided by the system C library on every target, never by a manifest package
+SYSTEM_SONAMES = ("ld-linux*", "libc.so.*", "libm.so.*", "libmvec.so.*", "libdl.so.*", "libpthread.so.*",
+                  "librt.so.*", "libresolv.so.*", "libutil.so.*", "libanl.so.*", "libBrokenLocale.so.*",
+                  "libnss_*", "libthread_db.so.*", "libc_malloc_debug.so.*")
+
+
+def unresolved_needed(needed: Dict[str, str], own: Iterable[str], providers: Dict[str, Any],
+                      whitelist: Iterable[str] = ()) -> Dict[str, str]:
+    """NEEDED SONAMEs ({soname: first file needing it}) that nothing resolves: not one of the package's
+    own SONAMEs, not in providers, not a system library and not matched by a missing_dso entry
+    (basename patterns, a leading `$RPATH/` is ignored).
+    """
+    patterns = [str(w).rpartition("/")[2] for w in whitelist] + list(SYSTEM_SONAMES)
+    own = set(own)
+    return {so: path for so, path in sorted(needed.items())
+            if so not in own and so not in providers and not any(fnmatch.fnmatchcase(so, p) for p in patterns)}
+
+
+def read_exclude(recipes_dir: Path) -> Optional[List[str]]:
+    """The recipe's exclude list, or None for recipes generated before exclude lists existed."""
+    try:
+        text = (recipes_dir / EXCLUDE_FILE).read_text(encoding="utf-8")
+    except OSError:
+        return None
+    return [line for line in text.splitlines() if line]
+
+
+def write_exclude(recipes_dir: Path, paths: List[str]) -> None:
+    (recipes_dir / EXCLUDE_FILE).write_text("".join(f"{p}\n" for p in paths), encoding="utf-8")
+
+
+class OwnershipIndex:
+    """path -> packages installing it, across the manifest."""
+
+    def __init__(self) -> None:
+        self.owners: Dict[str, List[str]] = {}
+
+    def add(self, name: str, paths: Iterable[str]) -> None:
+        for p in paths:
+            self.owners.setdefault(p, []).append(name)
+
+    def clobbers(self) -> Dict[str, List[str]]:
+        return {p: names for p, names in sorted(self.owners.items()) if len(set(names)) > 1}
+
+    def grouped(self) -> Dict[Tuple[str, ...], List[str]]:
+        """Clobbered paths grouped by the set of packages that share them."""
+        groups: Dict[Tuple[str, ...], List[str]] = {}
+        for p, names in self.clobbers().items():
+            groups.setdefault(tuple(sorted(set(names))), []).append(p)
+        return groups
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Write conda artifacts for lib/bin/data recipes directly, without conda-build.
+
+The payload is laid out exactly as templates/build.lib.sh.j2 does it:
+  - usr/{bin,lib,include,share} of every deb (extracted in order) -> $PREFIX/{bin,lib,include,share}
+  - lib/<multiarch>/*.so* get a lib/<name> symlink unless lib/<name> already exists
+  - SONAMEs that map_run_deps assigns to another package are dropped (recipes/exclude.txt)
+  - etc/conda/{activate,deactivate}.d/<name>_*.sh export $CONDA_PREFIX/lib on LD_LIBRARY_PATH
+and info/{index.json,paths.json,files,about.json} plus info/recipe/ are
+generated next to it, so the result installs like a conda-build artifact
+(build.binary_relocation is False for these recipes, so nothing is patched).
+
+Usage:
+  art = pack_recipe(base, meta, map_run_deps, out_dir)              # out_dir/linux-riscv64/<stem>.conda
+  pack_recipe(base, meta, map_run_deps, out_dir, fmt="tar.bz2", keep_payload=prefix)
+  ok, failed_cmd = run_tests(meta, prefix)                          # optional smoke test of test.commands
+"""
+
+import fnmatch
+import hashlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from debfile import DebFile
+from ownership import foreign_sonames, read_exclude
+
+DEFAULT_SUBDIR = "linux-riscv64"
+FORMATS = ("conda", "tar.bz2")
+COPY_DIRS = ("bin", "lib", "include", "share")
+
+# keep in sync with the heredocs in templates/build.lib.sh.j2
+_ACTIVATE = """\
+if [ "${LD_LIBRARY_PATH+x}" = x ]; then export _OLD_LD_LIBRARY_PATH="$LD_LIBRARY_PATH"; fi
+case ":${LD_LIBRARY_PATH:-}:" in *":$CONDA_PREFIX/lib:"*) : ;; *) export LD_LIBRARY_PATH="$CONDA_PREFIX/lib${LD_LIBRARY_PATH:+:$LD_LIBRARY_PATH}";; esac
+"""
+_DEACTIVATE = """\
+if [ "${_OLD_LD_LIBRARY_PATH+x}" = x ]; then export LD_LIBRARY_PATH="$_OLD_LD_LIBRARY_PATH"; else unset LD_LIBRARY_PATH; fi
+unset _OLD_LD_LIBRARY_PATH
+"""
+
+
+class PackError(Exception):
+    """Raised when a recipe cannot be packed directly."""
+
+
+class _Entry(NamedTuple):
+    src: Optional[Path]  # file in the extraction dir (None for generated content)
+    link: Optional[str]  # symlink target
+    data: Optional[bytes]  # generated file content
+    mode: int
+    mtime: int
+
+
+# -- payload ---------------------------------------------------------------
+def _walk(root: Path, prefix_dir: str, entries: Dict[str, _Entry]) -> None:
+    """Add every file/symlink under root as <prefix_dir>/<relpath> (what `tar -cf - . | tar -xf -` copies)."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root)
+        for fn in filenames + [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]:
+            full = Path(dirpath) / fn
+            st = full.lstat()
+            rel = f"{prefix_dir}/{fn}" if rel_dir == "." else f"{prefix_dir}/{rel_dir}/{fn}"
+            if os.path.islink(full):
+                entries[rel] = _Entry(None, os.readlink(full), None, 0o777, int(st.st_mtime))
+            else:
+                entries[rel] = _Entry(full, None, None, st.st_mode & 0o7777, int(st.st_mtime))
+
+
+def _lib_dirs(entries: Dict[str, _Entry], work: Path) -> List[str]:
+    """lib/*-linux-gnu directories present in the payload (the template's `$PREFIX/lib/*-linux-gnu`)."""
+    found = set()
+    for rel in entries:
+        parts = rel.split("/")
+        if len(parts) >= 3 and parts[0] == "lib" and fnmatch.fnmatchcase(parts[1], "*-linux-gnu") \
+                and (work / "usr" / "lib" / parts[1]).is_dir():
+            found.add(parts[1])
+    return sorted(found)
+
+
+def layout_payload(debs: List[Path], name: str, map_run_deps: Dict[str, Any], work: Path,
+                   exclude: Optional[List[str]] = None) -> Dict[str, _Entry]:
+    """Extract debs into work/ and return {prefix-relative path: entry} after the build.lib.sh transforms.
+    exclude is the recipe's exclude.txt; without one the foreign SONAMEs are selected from map_run_deps.
+    """
+    for deb in debs:
+        DebFile(deb).extract(work)
+    entries: Dict[str, _Entry] = {}
+    for d in COPY_DIRS:
+        src = work / "usr" / d
+        if src.is_dir() and not src.is_symlink():
+            _walk(src, d, entries)
+
+    # top-level lib/<so> -> <multiarch>/<so> links
+    archdirs = _lib_dirs(entries, work)
+    for arch in archdirs:
+        for so in sorted(os.listdir(work / "usr" / "lib" / arch)):
+            # `[ -e "$so" ]` follows symlinks: dangling ones are skipped
+            if not so.startswith(".") and fnmatch.fnmatchcase(so, "*.so*") and (work / "usr" / "lib" / arch / so).exists():
+                top = f"lib/{so}"
+                if top not in entries and not (work / "usr" / "lib" / so).exists():
+                    entries[top] = _Entry(None, f"{arch}/{so}", None, 0o777, int(time.time()))
+
+    # drop SONAMEs owned by another package: the recipe's exclude list, or the same selection from map_run_deps
+    for rel in (exclude if exclude is not None else foreign_sonames(list(entries), name, map_run_deps)):
+        entries.pop(rel, None)
+
+    outside = sorted(r for r, e in entries.items() if e.link is not None and e.link.startswith("/"))
+    if outside:
+        # conda-build keeps these too; conda then copies whatever the installing host has at that path
+        print(f"[WARN] {name}: {len(outside)} absolute symlink(s) point outside the prefix, "
+              f"e.g. {outside[0]} -> {entries[outside[0]].link}")
+
+    now = int(time.time())
+    entries[f"etc/conda/activate.d/{name}_activate.sh"] = _Entry(None, None, _ACTIVATE.encode(), 0o755, now)
+    entries[f"etc/conda/deactivate.d/{name}_deactivate.sh"] = _Entry(None, None, _DEACTIVATE.encode(), 0o755, now)
+    return entries
+
+
+def _sha256(entry: _Entry) -> Tuple[str, int]:
+    if entry.link is not None:
+        data = entry.link.encode()
+        return hashlib.sha256(data).hexdigest(), len(data)
+    if entry.data is not None:
+        return hashlib.sha256(entry.data).hexdigest(), len(entry.data)
+    h = hashlib.sha256()
+    size = 0
+    with open(entry.src, "rb") as f:  # type: ignore[arg-type]
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+            size += len(chunk)
+    return h.hexdigest(), size
+
+
+# -- metadata --------------------------------------------------------------
+def _index_json(meta: Dict[str, Any], subdir: str) -> Dict[str, Any]:
+    package = meta.get("package", {}) or {}
+    build = meta.get("build", {}) or {}
+    about = meta.get("about", {}) or {}
+    run = ((meta.get("requirements", {}) or {}).get("run", []) or [])
+    platform, _, arch = subdir.partition("-")
+    return {
+        "arch": arch or None,
+        "build": str(build.get("string", "")),
+        "build_number": int(build.get("number", 0) or 0),
+        "depends": [str(r).strip() for r in run if str(r).strip()],
+        "license": str(about.get("license", "")),
+        "name": str(package.get("name", "")),
+        "platform": platform or None,
+        "subdir": subdir,
+        "timestamp": int(time.time() * 1000),
+        "version": str(package.get("version", "")),
+    }
+
+
+def info_files(meta: Dict[str, Any], entries: Dict[str, _Entry], subdir: str, recipe_dir: Path) -> Dict[str, bytes]:
+    """info/* members: index.json, paths.json, files, about.json, recipe/{meta.yaml,build.sh}."""
+    paths = []
+    for rel in sorted(entries):
+        digest, size = _sha256(entries[rel])
+        paths.append({
+            "_path": rel,
+            "path_type": "softlink" if entries[rel].link is not None else "hardlink",
+            "sha256": digest,
+            "size_in_bytes": size,
+        })
+    about = meta.get("about", {}) or {}
+    out = {
+        "info/index.json": json.dumps(_index_json(meta, subdir), indent=2, sort_keys=True),
+        "info/paths.json": json.dumps({"paths": paths, "paths_version": 1}, indent=2, sort_keys=True),
+        "info/files": "".join(f"{rel}\n" for rel in sorted(entries)),
+        "info/about.json": json.dumps({k: str(v) for k, v in about.items()}, indent=2, sort_keys=True),
+    }
+    result = {k: v.encode("utf-8") for k, v in out.items()}
+    for fn in ("meta.yaml", "build.sh"):
+        if (recipe_dir / fn).is_file():
+            result[f"info/recipe/{fn}"] = (recipe_dir / fn).read_bytes()
+    return result
+
+
+# -- archives --------------------------------------------------------------
+def _tarinfo(name: str, size: int, mode: int, mtime: int) -> tarfile.TarInfo:
+    ti = tarfile.TarInfo(name)
+    ti.size, ti.mode, ti.mtime = size, mode, mtime
+    ti.uid = ti.gid = 0
+    ti.uname = ti.gname = ""
+    return ti
+
+
+def _add_payload(tar: tarfile.TarFile, entries: Dict[str, _Entry]) -> None:
+    for rel in sorted(entries):
+        e = entries[rel]
+        if e.link is not None:
+            ti = _tarinfo(rel, 0, e.mode, e.mtime)
+            ti.type, ti.linkname = tarfile.SYMTYPE, e.link
+            tar.addfile(ti)
+        elif e.data is not None:
+            tar.addfile(_tarinfo(rel, len(e.data), e.mode, e.mtime), io.BytesIO(e.data))
+        else:
+            # regular file even if it was a hardlink in the deb
+            with open(e.src, "rb") as f:  # type: ignore[arg-type]
+                tar.addfile(_tarinfo(rel, os.fstat(f.fileno()).st_size, e.mode, e.mtime), f)
+
+
+def _add_info(tar: tarfile.TarFile, info: Dict[str, bytes]) -> None:
+    now = int(time.time())
+    for name in sorted(info):
+        tar.addfile(_tarinfo(name, len(info[name]), 0o644, now), io.BytesIO(info[name]))
+
+
+def _zstd_compress(src: Path, dst: Path, level: int) -> None:
+    """Compress src into dst; stdlib (3.14+) or `zstandard`, else `zstd` (1)."""
+    try:
+        from compression import zstd  # type: ignore
+
+        with open(src, "rb") as fi, zstd.ZstdFile(str(dst), "w", level=level) as fo:  # type: ignore[call-arg]
+            shutil.copyfileobj(fi, fo, 1 << 20)
+        return
+    except ImportError:
+        pass
+    try:
+        import zstandard  # type: ignore
+
+        with open(src, "rb") as fi, open(dst, "wb") as fo:
+            zstandard.ZstdCompressor(level=level, threads=-1).copy_stream(fi, fo)
+        return
+    except ImportError:
+        pass
+    if shutil.which("zstd") is None:
+        raise PackError("writing .conda needs zstandard or zstd(1); use --format tar.bz2")
+    subprocess.run(["zstd", "-q", "-f", f"-{level}", "-T0", str(src), "-o", str(dst)], check=True)
+
+
+def _write_conda(path: Path, stem: str, entries: Dict[str, _Entry], info: Dict[str, bytes], level: int,
+                 tmp: Path) -> None:
+    parts: List[Tuple[str, Path]] = []
+    for kind in ("info", "pkg"):
+        raw = tmp / f"{kind}.tar"
+        with tarfile.open(raw, "w", format=tarfile.PAX_FORMAT) as tar:
+            if kind == "info":
+                _add_info(tar, info)
+            else:
+                _add_payload(tar, entries)
+        _zstd_compress(raw, tmp / f"{kind}.tar.zst", level)
+        raw.unlink()
+        parts.append((f"{kind}-{stem}.tar.zst", tmp / f"{kind}.tar.zst"))
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED) as zf:
+        zf.writestr("metadata.json", json.dumps({"conda_pkg_format_version": 2}))
+        # conda reads info- first; order matches conda-package-handling
+        for arcname, src in parts:
+            zf.write(src, arcname)
+
+
+def _write_tar_bz2(path: Path, entries: Dict[str, _Entry], info: Dict[str, bytes]) -> None:
+    with tarfile.open(path, "w:bz2", format=tarfile.PAX_FORMAT) as tar:
+        _add_info(tar, info)
+        _add_payload(tar, entries)
+
+
+def pack_recipe(base: Path, meta: Dict[str, Any], map_run_deps: Dict[str, Any], out_dir: Path,
+                fmt: str = "conda", level: int = 10, subdir: str = DEFAULT_SUBDIR,
+                keep_payload: Optional[Path] = None) -> Path:
+    """Build <out_dir>/<subdir>/<name>-<version>-<build>.<fmt> from <base>/debs and the rendered meta.yaml.
+    If keep_payload is given, the laid-out prefix is also materialised there (for run_tests).
+    """
+    if fmt not in FORMATS:
+        raise PackError(f"unknown format {fmt!r}")
+    debs = sorted((base / "debs").glob("*.deb"))
+    if not debs:
+        raise PackError(f"no .deb in {base / 'debs'}")
+    package = meta.get("package", {}) or {}
+    name, version = str(package.get("name", "")), str(package.get("version", ""))
+    stem = f"{name}-{version}-{(meta.get('build', {}) or {}).get('string', '')}"
+    dest_dir = out_dir / subdir
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    dest = dest_dir / f"{stem}.{fmt}"
+    with tempfile.TemporaryDirectory(prefix=f".pack-{name}-", dir=str(dest_dir)) as tmpd:
+        tmp = Path(tmpd)
+        entries = layout_payload(debs, name, map_run_deps, tmp / "work", read_exclude(base / "recipes"))
+        info = info_files(meta, entries, subdir, base / "recipes")
+        part = tmp / dest.name
+        if fmt == "conda":
+            _write_conda(part, stem, entries, info, level, tmp)
+        else:
+            _write_tar_bz2(part, entries, info)
+        if keep_payload is not None:
+            materialize(entries, keep_payload)
+        os.replace(part, dest)
+    return dest
+
+
+def materialize(entries: Dict[str, _Entry], prefix: Path) -> None:
+    """Write the payload to a directory (what installing the artifact would produce)."""
+    for rel in sorted(entries):
+        e = entries[rel]
+        target = prefix / rel
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if e.link is not None:
+            os.symlink(e.link, target)
+        elif e.data is not None:
+            target.write_bytes(e.data)
+            os.chmod(target, e.mode)
+        else:
+            shutil.copy2(e.src, target)  # type: ignore[arg-type]
+
+
+def run_tests(meta: Dict[str, Any], prefix: Path, log: Optional[Path] = None) -> Tuple[bool, str]:
+    """Run test.commands with PREFIX/CONDA_PREFIX pointing at the materialised payload.
+    Run deps are not installed: commands see this package plus whatever the host provides.
+    """
+    cmds = [str(c) for c in (((meta.get("test", {}) or {}).get("commands", []) or [])) if str(c).strip()]
+    env = dict(os.environ)
+    env.update({
+        "PREFIX": str(prefix),
+        "CONDA_PREFIX": str(prefix),
+        "PATH": f"{prefix}/bin:{env.get('PATH', '')}",
+        "LD_LIBRARY_PATH": f"{prefix}/lib" + (f":{env['LD_LIBRARY_PATH']}" if env.get("LD_LIBRARY_PATH") else ""),
+    })
+    out = io.StringIO()
+    for cmd in cmds:
+        proc = subprocess.run(["bash", "-c", cmd], env=env, cwd=str(prefix), stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT)
+        out.write(f"+ {cmd}\n{proc.stdout.decode('utf-8', errors='replace')}")
+        if proc.returncode != 0:
+            out.write(f"[exit {proc.returncode}]\n")
+            if log is not None:
+                log.write_text(out.getvalue(), encoding="utf-8")
+            return False, cmd
+    if log is not None:
+        log.write_text(out.getvalue(), encoding="utf-8")
+    return True, ""
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Lightweight per-phase profiler for debwrap runs.
+
+Spans are recorded with wall time, the number of subprocesses started, and the
+bytes this process read and wrote while the span was open (from
+/proc/self/io; zero where that is unavailable). When profiling is off,
+span() returns a shared no-op context and costs a single attribute check.
+
+Worker processes record into their own profiler and hand the spans back with
+their result (drain() / extend()), so one report covers the whole run.
+
+Usage:
+  PROF.enable()
+  with PROF.span("render", pkg="jq"):
+      ...
+  PROF.write(Path("prof.json"), top=10)   # also writes prof.trace.json (Chrome trace-event format)
+"""
+
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+_SPAWN_EVENTS = ("subprocess.Popen", "os.system", "os.posix_spawn", "os.exec", "os.spawn")
+
+
+def _io_counters() -> Tuple[int, int]:
+    """(bytes read, bytes written) by this process so far, counting page-cache hits too."""
+    try:
+        with open("/proc/self/io", "rb") as f:
+            fields = dict(line.split(b":", 1) for line in f.read().splitlines() if b":" in line)
+        return int(fields.get(b"rchar", 0)), int(fields.get(b"wchar", 0))
+    except (OSError, ValueError):
+        return 0, 0
+
+
+class Profiler:
+    def __init__(self) -> None:
+        self.enabled = False
+        self.spans: List[Dict[str, Any]] = []
+        self._spawned = 0
+        self._hooked = False
+        self._t0 = time.monotonic()
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        if not self._hooked:
+            # audit hooks cannot be removed; the hook itself checks `enabled`
+            sys.addaudithook(self._audit)
+            self._hooked = True
+        self.enabled = True
+
+    def _audit(self, event: str, _args: Any) -> None:
+        if self.enabled and event.startswith(_SPAWN_EVENTS):
+            self._spawned += 1
+
+    @contextlib.contextmanager
+    def _record(self, name: str, pkg: Optional[str]) -> Iterator[None]:
+        r0, w0 = _io_counters()
+        s0 = self._spawned
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            t1 = time.monotonic()
+            r1, w1 = _io_counters()
+            span = {
+                "name": name,
+                "pkg": pkg,
+                "start": t0,
+                "dur": t1 - t0,
+                "pid": os.getpid(),
+                "tid": threading.get_native_id(),
+                "subprocesses": self._spawned - s0,
+                "read_bytes": r1 - r0,
+                "write_bytes": w1 - w0,
+            }
+            with self._lock:
+                self.spans.append(span)
+
+    def span(self, name: str, pkg: Optional[str] = None) -> "contextlib.AbstractContextManager[None]":
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._record(name, pkg)
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """Hand over (and forget) the spans recorded by this process; spans inherited over fork are dropped."""
+        pid = os.getpid()
+        with self._lock:
+            spans, self.spans = self.spans, []
+        return [s for s in spans if s["pid"] == pid]
+
+    def extend(self, spans: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self.spans.extend(spans)
+
+    # -- reporting ------------------------------------------------------------
+    @staticmethod
+    def _add(acc: Dict[str, Any], span: Dict[str, Any]) -> None:
+        acc["wall_s"] = acc.get("wall_s", 0.0) + span["dur"]
+        acc["count"] = acc.get("count", 0) + 1
+        for key in ("subprocesses", "read_bytes", "write_bytes"):
+            acc[key] = acc.get(key, 0) + span[key]
+
+    def report(self, command: str = "") -> Dict[str, Any]:
+        spans = sorted(self.spans, key=lambda s: s["start"])
+        phases: Dict[str, Dict[str, Any]] = {}
+        packages: Dict[str, Dict[str, Any]] = {}
+        for s in spans:
+            if s["pkg"] is None:
+                self._add(phases.setdefault(s["name"], {}), s)
+                continue
+            entry = packages.setdefault(s["pkg"], {"phases": {}})
+            if s["name"] == "package":
+                self._add(entry, s)
+            else:
+                self._add(entry["phases"].setdefault(s["name"], {}), s)
+                self._add(phases.setdefault(s["name"], {}), s)
+        t0 = spans[0]["start"] if spans else self._t0
+        return {
+            "command": command,
+            "wall_s": max((s["start"] + s["dur"] for s in spans), default=t0) - t0,
+            "phases": phases,
+            "packages": packages,
+            "spans": [dict(s, start=s["start"] - t0) for s in spans],
+        }
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """Trace-event JSON loadable in chrome://tracing or https://ui.perfetto.dev."""
+        spans = sorted(self.spans, key=lambda s: s["start"])
+        t0 = spans[0]["start"] if spans else self._t0
+        events = []
+        for s in spans:
+            events.append({
+                "name": s["name"] if s["pkg"] is None else f"{s['pkg']}:{s['name']}",
+                "cat": s["name"],
+                "ph": "X",
+                "ts": round((s["start"] - t0) * 1e6, 1),
+                "dur": round(s["dur"] * 1e6, 1),
+                "pid": s["pid"],
+                "tid": s["tid"],
+                "args": {k: s[k] for k in ("pkg", "subprocesses", "read_bytes", "write_bytes")},
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, path: Path, command: str = "", top: int = 10) -> None:
+        """Write PATH (summary + spans) and PATH's .trace.json sibling, then print the slowest spans."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        report = self.report(command)
+        path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        trace_path = path.with_name(f"{path.stem}.trace.json")
+        trace_path.write_text(json.dumps(self.chrome_trace()), encoding="utf-8")
+        print(f"[PROFILE] wrote {path} and {trace_path} (wall {report['wall_s']:.2f}s)")
+        for name, acc in sorted(report["phases"].items(), key=lambda kv: -kv[1]["wall_s"]):
+            print(f"  phase {name:<12} {acc['wall_s']:8.3f}s  x{acc['count']:<5} "
+                  f"subprocs {acc['subprocesses']:<4} read {acc['read_bytes']:>12} B  wrote {acc['write_bytes']:>12} B")
+        slow = sorted((s for s in report["spans"] if s["pkg"] is not None and s["name"] != "package"),
+                      key=lambda s: -s["dur"])[:max(0, top)]
+        if slow:
+            print(f"[PROFILE] top {len(slow)} slowest package phases:")
+            for s in slow:
+                print(f"  {s['dur']:8.3f}s  {s['pkg']}:{s['name']}  subprocs {s['subprocesses']}  "
+                      f"read {s['read_bytes']} B  wrote {s['write_bytes']} B")
+
+
+PROF = Profiler()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Dependency-aware job scheduler for local package builds.
+
+Nodes are started as soon as all of their dependencies have finished
+successfully. At most `jobs` nodes run at the same time. When several nodes
+are ready, the one with the longest chain of dependents goes first, so a full
+rebuild takes about as long as the critical path instead of the sum of all
+builds. If a node fails, everything that depends on it is reported as blocked
+and is not run.
+
+Usage:
+  deps = {"jq": ["libjq", "libonig"], "libjq": ["libonig"], "libonig": [], "tzdata": []}
+  order = manifest_names
+  results = run_dag(order, deps, build_one, jobs=4)   # {name: "ok" | "failed" | "blocked"}
+"""
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+
+def break_cycles(order: List[str], deps: Dict[str, List[str]]) -> Tuple[Dict[str, List[str]], List[str]]:
+    """Return (acyclic deps, nodes that were in a cycle).
+    Inside a cycle only edges to packages listed earlier in `order` are kept, which is
+    exactly the order a serial build in manifest order would have used.
+    """
+    pos = {n: i for i, n in enumerate(order)}
+    graph = {n: [d for d in dict.fromkeys(deps.get(n, [])) if d in pos and d != n] for n in order}
+    indeg = {n: len(graph[n]) for n in order}
+    users: Dict[str, List[str]] = {n: [] for n in order}
+    for n, ds in graph.items():
+        for d in ds:
+            users[d].append(n)
+    ready = [n for n in order if indeg[n] == 0]
+    seen: Set[str] = set()
+    while ready:
+        n = ready.pop()
+        seen.add(n)
+        for u in users[n]:
+            indeg[u] -= 1
+            if indeg[u] == 0:
+                ready.append(u)
+    cyclic = [n for n in order if n not in seen]
+    for n in cyclic:
+        graph[n] = [d for d in graph[n] if d in seen or pos[d] < pos[n]]
+    return graph, cyclic
+
+
+def critical_path_lengths(order: List[str], graph: Dict[str, List[str]],
+                          cost: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    """Length of the longest dependent chain starting at each node (node itself included)."""
+    users: Dict[str, List[str]] = {n: [] for n in order}
+    for n in order:
+        for d in graph[n]:
+            users[d].append(n)
+    memo: Dict[str, float] = {}
+
+    def visit(n: str) -> float:
+        # iterative post-order to stay clear of the recursion limit on long chains
+        stack = [(n, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if node in memo:
+                continue
+            if not expanded:
+                stack.append((node, True))
+                stack.extend((u, False) for u in users[node] if u not in memo)
+                continue
+            own = (cost or {}).get(node, 1.0)
+            memo[node] = own + max((memo[u] for u in users[node]), default=0.0)
+        return memo[n]
+
+    for n in order:
+        visit(n)
+    return memo
+
+
+def run_dag(order: List[str], deps: Dict[str, List[str]], run: Callable[[str], bool], jobs: int = 1,
+            cost: Optional[Dict[str, float]] = None,
+            before_start: Optional[Callable[[str], None]] = None,
+            on_done: Optional[Callable[[str, bool], None]] = None) -> Dict[str, str]:
+    """Run `run(name) -> ok` for every node in dependency order on `jobs` threads.
+
+    before_start(name) and on_done(name, ok) are called on the scheduling thread, so they
+    may touch shared state (e.g. publish artifacts, refresh an index) without extra locking.
+    Dependencies on names outside `order` are ignored.
+    """
+    graph, _cyclic = break_cycles(order, deps)
+    prio = critical_path_lengths(order, graph, cost)
+    pos = {n: i for i, n in enumerate(order)}
+    waiting: Dict[str, Set[str]] = {n: set(graph[n]) for n in order}
+    users: Dict[str, List[str]] = {n: [] for n in order}
+    for n in order:
+        for d in graph[n]:
+            users[d].append(n)
+
+    status: Dict[str, str] = {}
+    ready = [n for n in order if not waiting[n]]
+    running: Dict[Future, str] = {}
+
+    def block(n: str) -> None:
+        stack = [n]
+        while stack:
+            for u in users[stack.pop()]:
+                if u not in status:
+                    status[u] = "blocked"
+                    stack.append(u)
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        while ready or running:
+            # longest remaining chain first; manifest order breaks ties
+            ready.sort(key=lambda n: (-prio[n], pos[n]))
+            while ready and len(running) < max(1, jobs):
+                n = ready.pop(0)
+                if n in status:  # blocked meanwhile
+                    continue
+                if before_start is not None:
+                    before_start(n)
+                running[pool.submit(run, n)] = n
+            if not running:
+                break
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in done:
+                n = running.pop(fut)
+                try:
+                    ok = bool(fut.result())
+                except Exception as exc:
+                    print(f"[ERROR] {n}: {exc!r}")
+                    ok = False
+                status[n] = "ok" if ok else "failed"
+                if on_done is not None:
+                    on_done(n, ok)
+                if not ok:
+                    block(n)
+                    continue
+                for u in users[n]:
+                    waiting[u].discard(n)
+                    if not waiting[u] and u not in status:
+                        ready.append(u)
+    for n in order:
+        status.setdefault(n, "blocked")
+    return status
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+File change notifications for `debwrap watch`: inotify through ctypes on
+Linux, periodic stat() polling everywhere else (or when inotify is not
+usable, e.g. on some network filesystems).
+
+Only the direct entries of the watched directories are observed; a watched
+file is observed through its parent directory, so editors that save by
+writing a temp file and renaming it over the original are seen too.
+
+Usage:
+  w = FsWatcher([pool_dir, templates_dir], files=[manifest, rules])
+  changed = w.wait(timeout=None)     # set of paths, empty on timeout
+  w.close()
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+# <sys/inotify.h>
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE \
+    | IN_DELETE_SELF | IN_MOVE_SELF
+_EVENT = struct.Struct("iIII")
+
+
+class _Inotify:
+    def __init__(self) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add = libc.inotify_add_watch
+        self._add.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs: Dict[int, Path] = {}
+
+    def add(self, directory: Path) -> None:
+        wd = self._add(self.fd, os.fsencode(str(directory)), _MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+        self._dirs[wd] = directory
+
+    def read(self, timeout: Optional[float]) -> Tuple[Set[Path], bool]:
+        """(changed paths, overflowed). Blocks up to timeout seconds (None = forever)."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set(), False
+        changed: Set[Path] = set()
+        overflow = False
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            off = 0
+            while off + _EVENT.size <= len(buf):
+                wd, mask, _cookie, length = _EVENT.unpack_from(buf, off)
+                name = buf[off + _EVENT.size: off + _EVENT.size + length].rstrip(b"\0")
+                off += _EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+                base = self._dirs.get(wd)
+                if base is not None:
+                    changed.add(base / os.fsdecode(name) if name else base)
+        return changed, overflow
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class FsWatcher:
+    """Watch directories (their direct entries) and single files for changes."""
+
+    def __init__(self, dirs: List[Path], files: Optional[List[Path]] = None, poll_interval: float = 1.0,
+                 force_poll: bool = False) -> None:
+        self.dirs = [Path(d).resolve() for d in dirs]
+        self.files = {Path(f).resolve() for f in (files or [])}
+        self.poll_interval = poll_interval
+        self._parents = sorted({*self.dirs, *(f.parent for f in self.files)})
+        self._inotify: Optional[_Inotify] = None
+        if not force_poll:
+            try:
+                ino = _Inotify()
+                for d in self._parents:
+                    ino.add(d)
+                self._inotify = ino
+            except (OSError, AttributeError):
+                self._inotify = None
+        self._snapshot = self._take() if self._inotify is None else {}
+
+    @property
+    def backend(self) -> str:
+        return "inotify" if self._inotify is not None else "poll"
+
+    def _relevant(self, path: Path) -> bool:
+        return path in self.files or path.parent in self.dirs or path in self.dirs
+
+    def _take(self) -> Dict[Path, Tuple[int, int]]:
+        snap: Dict[Path, Tuple[int, int]] = {}
+        for d in self.dirs:
+            try:
+                with os.scandir(d) as it:
+                    for e in it:
+                        try:
+                            st = e.stat()
+                        except OSError:
+                            continue
+                        snap[Path(e.path)] = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                continue
+        for f in self.files:
+            try:
+                st = f.stat()
+                snap[f] = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                pass
+        return snap
+
+    def _poll(self, timeout: Optional[float]) -> Set[Path]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snap = self._take()
+            old = self._snapshot
+            changed = {p for p in snap.keys() | old.keys() if snap.get(p) != old.get(p)}
+            self._snapshot = snap
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            step = self.poll_interval if deadline is None else min(self.poll_interval, deadline - time.monotonic())
+            time.sleep(max(0.0, step))
+
+    def wait(self, timeout: Optional[float] = None) -> Set[Path]:
+        """Changed paths since the last call, waiting up to timeout seconds (None = until something changes)."""
+        if self._inotify is None:
+            return self._poll(timeout)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            left = None if deadline is None else max(0.0, deadline - time.monotonic())
+            changed, overflow = self._inotify.read(left)
+            if overflow:
+                # events were lost: report everything so the caller re-checks all inputs
+                return set(self.files) | set(self.dirs)
+            changed = {p for p in changed if self._relevant(p)}
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+    def close(self) -> None:
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None